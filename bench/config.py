@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Benchmark of configuration files parser and serializer (Config class of indicator).
+#
+# It generates daemon config files with large 'exclude-dirs' lists (in both forms: the list of
+# quoted values and the single quoted comma-separated value like yandex-disk writes it) and
+# measures the time of load, daemon config load (with additional parsing of 'exclude-dirs'),
+# saving of not changed config and saving of the config with changed list. It also checks that
+# loaded values are correct and that saving of not changed config doesn't change the file.
+# The time per value have to stay about the same for all sizes (linear scaling).
+#
+# The indicator module is loaded from the script (GUI libraries are not imported when the script is
+# imported as module), so PyGObject is not required.
+#
+# Example:
+#   bench/config.py -s 1000 10000 50000
+#
+import builtins
+from sys import exit as sysExit
+from os.path import join as pathJoin, dirname, abspath
+from time import perf_counter
+from tempfile import mkdtemp
+from shutil import rmtree
+from argparse import ArgumentParser
+from json import dumps as jsonDumps
+from logging import getLogger
+from importlib.machinery import SourceFileLoader
+
+benchDir = dirname(abspath(__file__))
+
+def loadIndicator(path):
+  builtins.__dict__.setdefault('_', lambda s: s)   # Translation function is not installed
+  ydi = SourceFileLoader('ydi', path).load_module()
+  ydi.logger = getLogger('')
+  ydi.logger.setLevel(40)
+  return ydi
+
+def timeit(func, repeat):             # The best time of repeated calls
+  best = None
+  for i in range(repeat):
+    t = perf_counter()
+    func()
+    t = perf_counter() - t
+    best = t if best is None else min(best, t)
+  return best
+
+def run(args):
+  ydi = loadIndicator(args.indicator or pathJoin(dirname(benchDir), 'yandex-disk-indicator.py'))
+  DConfig = ydi.YDDaemon._YDDaemon__DConfig
+  root = mkdtemp(prefix='ydi-config-')
+  res = []
+  try:
+    for size in args.sizes:
+      dirs = ['Folder %d/sub_folder-%d' % (i // 100, i) for i in range(size)]
+      for form in ('list', 'single'):
+        fileName = pathJoin(root, 'config-%s-%d.cfg' % (form, size))
+        text = ('# daemon config\nauth="/home/user/.config/yandex-disk/passwd"\n' +
+                'dir="/home/user/Yandex.Disk"\nproxy="no"\n' +
+                ('exclude-dirs=%s\n' % ', '.join('"%s"' % d for d in dirs) if form == 'list' else
+                 'exclude-dirs="%s"\n' % ','.join(dirs)))
+        with open(fileName, 'wt') as f:
+          f.write(text)
+        cfg = ydi.Config(fileName)
+        dcfg = DConfig(fileName)
+        if dcfg['exclude-dirs'] != dirs or (form == 'list' and cfg['exclude-dirs'] != dirs):
+          sysExit('Wrong values are loaded from %s' % fileName)
+        r = {'values': size, 'form': form, 'bytes': len(text),
+             'load_ms': timeit(lambda: ydi.Config(fileName), args.repeat) * 1000,
+             'dload_ms': timeit(lambda: DConfig(fileName), args.repeat) * 1000,
+             'save_ms': timeit(cfg.save, args.repeat) * 1000}
+        with open(fileName) as f:
+          r['roundtrip'] = f.read() == text
+        def change():
+          cfg['exclude-dirs'] = dirs[1:] if cfg['exclude-dirs'] == dirs else dirs
+          cfg.save()
+        r['change_ms'] = timeit(change, args.repeat) * 1000
+        r['load_us_per_value'] = r['load_ms'] * 1000 / size
+        res.append(r)
+  finally:
+    rmtree(root, ignore_errors=True)
+  return res
+
+def argParse():
+  parser = ArgumentParser(description='Benchmark of indicator configuration parser')
+  parser.add_argument('-s', '--sizes', type=int, nargs='+', default=[1000, 10000, 50000],
+                      help='Numbers of excluded folders')
+  parser.add_argument('-r', '--repeat', type=int, default=5, help='Number of repeats (best is taken)')
+  parser.add_argument('--indicator', default=None, help='Path to indicator script')
+  parser.add_argument('--json', action='store_true', help='Print result as JSON')
+  return parser.parse_args()
+
+if __name__ == '__main__':
+  args = argParse()
+  res = run(args)
+  if args.json:
+    print(jsonDumps(res))
+  else:
+    print('%8s %7s %9s %9s %9s %9s %10s %9s %11s' % ('values', 'form', 'bytes', 'load_ms', 'dload_ms',
+                                                    'save_ms', 'change_ms', 'roundtrip', 'us/value'))
+    for r in res:
+      print('%8d %7s %9d %9.2f %9.2f %9.2f %10.2f %9s %11.2f' %
+            (r['values'], r['form'], r['bytes'], r['load_ms'], r['dload_ms'], r['save_ms'],
+             r['change_ms'], r['roundtrip'], r['load_us_per_value']))
+  sysExit(0 if all(r['roundtrip'] for r in res) else 1)
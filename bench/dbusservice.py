@@ -0,0 +1,188 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# D-Bus service test for yandex-disk-indicator.
+#
+# It starts the private session bus (dbus-daemon --session) and the indicator with activated D-Bus
+# service ('dbus' key) against the simulated daemon (see bench/yandex-disk stand-in) and checks the
+# service via gdbus utility:
+#   - properties of daemon object have the values of simulated daemon status,
+#   - PropertiesChanged signal is emitted with changed properties only and it is not emitted when
+#     the status is requested again but nothing is changed,
+#   - Start, Stop and Refresh methods call the appropriate daemon commands.
+# The result of each check is printed, the test exits with code 1 when any check fails.
+#
+# GUI mode requires X session (the test restarts itself under xvfb-run when it is not available).
+#
+# Example:
+#   bench/dbusservice.py --timeout 20
+#
+from sys import executable, argv, exit as sysExit
+from os import environ, execvp
+from shutil import which
+from subprocess import Popen, PIPE, DEVNULL, check_output, CalledProcessError
+from threading import Thread, Condition
+from time import monotonic, sleep
+from ast import literal_eval
+from argparse import ArgumentParser
+from json import dumps as jsonDumps
+from re import findall as reFindall, sub as reSub
+
+from load import Bench
+
+NAME = 'com.github.slytomcat.YandexDiskIndicator'
+IFACE = NAME + '.Daemon'
+PATH = '/com/github/slytomcat/YandexDiskIndicator/Daemon0'
+
+class Bus(object):                    # Private session bus and gdbus client
+  def __init__(self):
+    self.proc = Popen(['dbus-daemon', '--session', '--nofork', '--print-address=1'],
+                      stdout=PIPE, universal_newlines=True)
+    self.address = self.proc.stdout.readline().strip()
+    self.env = dict(environ, DBUS_SESSION_BUS_ADDRESS=self.address)
+    self.signals = []                 # (time, {property: value text}) of PropertiesChanged signals
+    self.cond = Condition()
+    self.monitor = None
+
+  def call(self, method, *params, dest=NAME, path=PATH):  # Returns output of gdbus call or None
+    try:
+      return check_output(['gdbus', 'call', '--session', '-d', dest, '-o', path, '-m', method] +
+                          list(params), env=self.env, stderr=DEVNULL,
+                          universal_newlines=True).strip()
+    except CalledProcessError:
+      return None
+
+  def owned(self, timeout):           # Wait for the service name on the bus
+    deadline = monotonic() + timeout
+    while monotonic() < deadline:
+      if self.call('org.freedesktop.DBus.NameHasOwner', NAME, dest='org.freedesktop.DBus',
+                   path='/org/freedesktop/DBus') == '(true,)':
+        return True
+      sleep(0.2)
+    return False
+
+  def get(self, prop):                # Property value (None when it is not available)
+    out = self.call('org.freedesktop.DBus.Properties.Get', IFACE, prop)
+    if out is None or not out.startswith('(<'):
+      return None
+    return literal_eval(reSub(r'^@\w+ ', '', out[2: -3]))   # Type annotation of empty array
+
+  def watch(self):                    # Collect PropertiesChanged signals of daemon object
+    self.monitor = Popen(['gdbus', 'monitor', '--session', '-d', NAME, '-o', PATH],
+                         env=self.env, stdout=PIPE, universal_newlines=True)
+    Thread(target=self.__reader, daemon=True).start()
+
+  def __reader(self):
+    for line in self.monitor.stdout:
+      if 'PropertiesChanged' in line:
+        changed = dict(reFindall(r"'(\w+)': <(.*?)>(?=, '|})", line))
+        with self.cond:
+          self.signals.append((monotonic(), changed))
+          self.cond.notify_all()
+
+  def waitSignal(self, since, prop, value, timeout):
+    ''' Wait for the signal (raised after 'since') with property value (text as gdbus shows it,
+        None - any value). Returns changed properties of the signal or None on timeout. '''
+    deadline = monotonic() + timeout
+    with self.cond:
+      while True:
+        for t, changed in self.signals:
+          if t >= since and prop in changed and value in (None, changed[prop]):
+            return changed
+        left = deadline - monotonic()
+        if left <= 0:
+          return None
+        self.cond.wait(left)
+
+  def since(self, moment):            # Signals raised after the moment
+    with self.cond:
+      return [c for t, c in self.signals if t >= moment]
+
+  def exit(self):
+    if self.monitor is not None:
+      self.monitor.kill()
+      self.monitor.wait()
+    self.proc.kill()
+    self.proc.wait()
+
+def waitCalls(bench, cmd, count, timeout):  # Wait until stand-in command is called 'count' times
+  deadline = monotonic() + timeout
+  while bench.calls(0, cmd) < count:
+    if monotonic() > deadline:
+      return False
+    sleep(0.1)
+  return True
+
+def run(args):
+  checks = {}
+  def check(name, ok):
+    checks[name] = bool(ok)
+  bus = Bus()
+  bench = Bench(1, 0.0, 'append', args.indicator, env={'DBUS_SESSION_BUS_ADDRESS': bus.address},
+                settings={'dbus': 'yes'})
+  bench.extraEnv['XDG_RUNTIME_DIR'] = bench.root   # Don't touch the socket of running indicator
+  bench.set(0, running=True, status='idle', used='3 GB', free='7 GB', lastitems=['file-1.txt'])
+  bench.start()
+  try:
+    if bench.waitChange(0, 0, timeout=args.timeout) is None or not bus.owned(args.timeout):
+      sysExit('Indicator does not start D-Bus service: %s' % ''.join(bench.lines[-5:]))
+    bus.watch()
+    sleep(0.5)                        # Monitor is subscribed to signals
+    # Properties reflect the daemon status
+    check('properties', bus.get('Status') == 'idle' and bus.get('Used') == '3 GB' and
+          bus.get('Free') == '7 GB' and bus.get('Total') == '10 GB' and
+          bus.get('Dir') == bench.home + '/Yandex.Disk-0' and
+          any(i.endswith('file-1.txt') for i in bus.get('LastItems') or []))
+    # Changed values are signaled, the signal contains the changed properties only
+    t = monotonic()
+    bench.set(0, status='busy', progress='1 MB/ 100 MB (1 %)')
+    changed = bus.waitSignal(t, 'Status', "'busy'", args.timeout)
+    check('signal_on_change', changed is not None and
+          set(changed) <= {'Status', 'Progress', 'Error', 'Path'})
+    t = monotonic()
+    bench.set(0, progress='2 MB/ 100 MB (2 %)')
+    changed = bus.waitSignal(t, 'Progress', None, args.timeout)
+    check('changed_only', changed is not None and set(changed) == {'Progress'})
+    # Refresh requests the status, nothing is changed, so no signal is emitted
+    sleep(1)
+    t, calls = monotonic(), bench.calls(0, 'status')
+    ok = bus.call(IFACE + '.Refresh') == '()' and waitCalls(bench, 'status', calls + 1, args.timeout)
+    sleep(args.quiet)
+    check('refresh', ok)
+    check('no_signal_without_change', not bus.since(t))
+    # Stop and Start methods call the daemon commands and the status changes are signaled
+    t, calls = monotonic(), bench.calls(0, 'stop')
+    check('stop', bus.call(IFACE + '.Stop') == '()' and
+          waitCalls(bench, 'stop', calls + 1, args.timeout) and
+          bus.waitSignal(t, 'Status', "'none'", args.timeout) is not None)
+    t, calls = monotonic(), bench.calls(0, 'start')
+    check('start', bus.call(IFACE + '.Start') == '()' and
+          waitCalls(bench, 'start', calls + 1, args.timeout) and
+          bus.waitSignal(t, 'Status', "'idle'", args.timeout) is not None)
+  finally:
+    bench.stop()
+    bus.exit()
+    if not args.keep:
+      bench.cleanup()
+  return {'checks': checks, 'failed': [k for k, v in checks.items() if not v]}
+
+def argParse():
+  parser = ArgumentParser(description='D-Bus service test for yandex-disk-indicator')
+  parser.add_argument('--timeout', type=float, default=20, help='Timeout of each check (sec)')
+  parser.add_argument('--quiet', type=float, default=2,
+                      help='Time to watch for unexpected signals after refresh (sec)')
+  parser.add_argument('--indicator', default=None, help='Path to indicator script')
+  parser.add_argument('--keep', action='store_true', help='Keep sandbox folder')
+  return parser.parse_args()
+
+if __name__ == '__main__':
+  for tool in ('dbus-daemon', 'gdbus'):
+    if which(tool) is None:
+      sysExit('%s is required' % tool)
+  # Provide virtual X server when it is not available (private session bus is started by test)
+  if not environ.get('DISPLAY') and which('xvfb-run'):
+    execvp('xvfb-run', ['xvfb-run', '-a', executable] + argv)
+  args = argParse()
+  res = run(args)
+  print(jsonDumps(res, indent=2))
+  sysExit(1 if res['failed'] else 0)
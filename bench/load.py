@@ -0,0 +1,268 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# End-to-end load harness for yandex-disk-indicator.
+#
+# It starts the indicator against N simulated daemons (see bench/yandex-disk stand-in) in the
+# sandboxed HOME and drives the status changes of simulated daemons. For each change it measures
+# the latency from the moment of the state change to the delivery of the change() event (indicator
+# reports it in log as '<ID>Change event: ...'). During the run it samples CPU time, threads number
+# and number of child processes of indicator process.
+#
+# The indicator should be installed (it requires /usr/share/yd-tools files) and the X session
+# should be available (use xvfb-run when it is run on the headless machine).
+#
+# Example:
+#   bench/load.py -n 5 -e 200 --latency 0.2 --clilog burst
+#
+from sys import executable, exit as sysExit
+from os import makedirs, symlink, listdir, sysconf, kill, environ
+from os.path import join as pathJoin, dirname, abspath
+from subprocess import Popen, PIPE
+from threading import Thread, Condition
+from time import monotonic, sleep
+from tempfile import mkdtemp
+from shutil import rmtree
+from argparse import ArgumentParser
+from json import dumps as jsonDumps
+from re import search as reSearch
+from signal import SIGTERM
+from importlib.machinery import SourceFileLoader
+
+benchDir = dirname(abspath(__file__))
+standin = SourceFileLoader('standin', pathJoin(benchDir, 'yandex-disk')).load_module()
+
+def percentile(values, p):
+  if not values:
+    return None
+  values = sorted(values)
+  return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+class ProcSampler(object):            # Process resources sampler based on /proc
+  def __init__(self, pid):
+    self.pid = pid
+    self.tick = sysconf('SC_CLK_TCK')
+
+  def cpu(self):                      # CPU time (user + system) in seconds
+    with open('/proc/%d/stat' % self.pid) as f:
+      fields = f.read().rsplit(')', 1)[1].split()
+    return (int(fields[11]) + int(fields[12])) / self.tick
+
+  def threads(self):
+    with open('/proc/%d/status' % self.pid) as f:
+      return int(reSearch(r'Threads:\s*(\d+)', f.read()).group(1))
+
+  def rss(self):                      # Resident set size in KB
+    with open('/proc/%d/status' % self.pid) as f:
+      return int(reSearch(r'VmRSS:\s*(\d+)', f.read()).group(1))
+
+  def fds(self):
+    return len(listdir('/proc/%d/fd' % self.pid))
+
+  def children(self):                 # Number of direct child processes
+    cnt = 0
+    for p in listdir('/proc'):
+      if p.isdigit():
+        try:
+          with open('/proc/%s/stat' % p) as f:
+            if int(f.read().rsplit(')', 1)[1].split()[1]) == self.pid:
+              cnt += 1
+        except (OSError, IndexError, ValueError):
+          pass
+    return cnt
+
+  def sample(self):
+    return {'time': monotonic(), 'cpu': self.cpu(), 'threads': self.threads(),
+            'children': self.children(), 'rss': self.rss(), 'fds': self.fds()}
+
+class Bench(object):                  # Sandbox with indicator and simulated daemons
+  def __init__(self, daemons=1, latency=0.0, clilog='append', indicator=None, logLevel=20,
+               env=None, args=None, prefix=None, settings=None):
+    ''' prefix   - interpreter arguments before indicator path (i.e. wrapper script)
+        settings - additional/changed indicator configuration values '''
+    self.n = daemons
+    self.indicator = indicator or pathJoin(dirname(benchDir), 'yandex-disk-indicator.py')
+    self.logLevel = logLevel
+    self.extraEnv = env or {}
+    self.args = list(args or [])
+    self.prefix = list(prefix or [])
+    self.root = mkdtemp(prefix='ydi-bench-')
+    self.home = pathJoin(self.root, 'home')
+    self.cfgs = []
+    # Stand-in utility have to be found by which('yandex-disk')
+    self.bin = pathJoin(self.root, 'bin')
+    makedirs(self.bin)
+    symlink(pathJoin(benchDir, 'yandex-disk'), pathJoin(self.bin, 'yandex-disk'))
+    for i in range(daemons):
+      cfgDir = pathJoin(self.home, '.config', 'yandex-disk-%d' % i)
+      syncDir = pathJoin(self.home, 'Yandex.Disk-%d' % i)
+      makedirs(cfgDir)
+      makedirs(pathJoin(syncDir, '.sync'))
+      with open(pathJoin(cfgDir, 'passwd'), 'wt') as f:
+        f.write('token')
+      cfg = pathJoin(cfgDir, 'config.cfg')
+      with open(cfg, 'wt') as f:
+        f.write('auth="%s"\ndir="%s"\nproxy="no"\n' % (pathJoin(cfgDir, 'passwd'), syncDir))
+      standin.setState(cfg, {'latency': latency, 'clilog': clilog, 'running': False,
+                             'status': 'idle'})
+      self.cfgs.append(cfg)
+    # Indicator configuration (it is not a first run: FM actions/autostart are not touched)
+    appCfg = pathJoin(self.home, '.config', 'yd-tools')
+    makedirs(pathJoin(appCfg, 'icons', 'light'))
+    makedirs(pathJoin(appCfg, 'icons', 'dark'))
+    appSettings = {'notifications': 'no', 'theme': 'no', 'fmextensions': 'no', 'dbus': 'no'}
+    appSettings.update(settings or {})
+    with open(pathJoin(appCfg, 'yandex-disk-indicator.conf'), 'wt') as f:
+      f.write(''.join('%s="%s"\n' % kv for kv in appSettings.items()) +
+              'daemons=%s\n' % ', '.join('"%s"' % c for c in self.cfgs))
+    self.events = {}                  # ID -> list of (time, flags) of change events
+    self.lines = []                   # Full log of indicator
+    self.cond = Condition()
+    self.proc = None
+
+  def ID(self, n):                    # Daemon identity as it is shown in indicator log
+    return '#%d ' % n if self.n > 1 else ''
+
+  def start(self):
+    env = {'HOME': self.home, 'PATH': self.bin + ':/usr/bin:/bin', 'LANG': 'C'}
+    for k in ('DISPLAY', 'XAUTHORITY', 'DBUS_SESSION_BUS_ADDRESS', 'XDG_RUNTIME_DIR'):
+      v = environ.get(k)
+      if v:
+        env[k] = v
+    env.update(self.extraEnv)
+    self.proc = Popen([executable] + self.prefix + [self.indicator, '-l%d' % self.logLevel] +
+                      self.args,
+                      env=env, stderr=PIPE, universal_newlines=True)
+    self.sampler = ProcSampler(self.proc.pid)
+    Thread(target=self.__reader, daemon=True).start()
+
+  def __reader(self):                 # Collect indicator log and change events
+    for line in self.proc.stderr:
+      t = monotonic()
+      m = reSearch(r'(#\d+ )?Change event: (.*)$', line)
+      with self.cond:
+        self.lines.append(line)
+        if m:
+          self.events.setdefault(m.group(1) or '', []).append((t, m.group(2).split(',')))
+          self.cond.notify_all()
+
+  def set(self, n, **vals):           # Change state of n-th simulated daemon
+    standin.setState(self.cfgs[n], vals)
+
+  def waitChange(self, n, since, flag='stat', timeout=30):
+    ''' Wait for change event with flag from n-th daemon raised after 'since' moment.
+        Returns the event time or None on timeout. '''
+    deadline = monotonic() + timeout
+    with self.cond:
+      while True:
+        for t, flags in self.events.get(self.ID(n), []):
+          if t >= since and flag in flags:
+            return t
+        left = deadline - monotonic()
+        if left <= 0 or self.proc.poll() is not None:
+          return None
+        self.cond.wait(left)
+
+  def calls(self, n, cmd='status'):   # Number of calls of stand-in utility
+    try:
+      with open(pathJoin(dirname(self.cfgs[n]), 'calls.log')) as f:
+        return sum(1 for l in f if l.split()[1] == cmd)
+    except OSError:
+      return 0
+
+  def stop(self):
+    if self.proc is not None and self.proc.poll() is None:
+      kill(self.proc.pid, SIGTERM)
+      try:
+        self.proc.wait(30)
+      except Exception:
+        self.proc.kill()
+
+  def cleanup(self):
+    rmtree(self.root, ignore_errors=True)
+
+def run(args):
+  bench = Bench(args.daemons, args.latency, args.clilog, args.indicator)
+  for n in range(args.daemons):
+    bench.set(n, running=True, status='idle')
+  bench.start()
+  samples = []
+  stop = [False]
+  def sampler():
+    while not stop[0] and bench.proc.poll() is None:
+      try:
+        samples.append(bench.sampler.sample())
+      except OSError:
+        break
+      sleep(args.sample)
+  try:
+    # Wait for initial status of all daemons
+    for n in range(args.daemons):
+      if bench.waitChange(n, 0, flag='stat', timeout=args.timeout) is None:
+        sysExit('Indicator does not report the initial status of daemon #%d' % n)
+    Thread(target=sampler, daemon=True).start()
+    cpu0, calls0, t0 = bench.sampler.cpu(), [bench.calls(n) for n in range(args.daemons)], monotonic()
+    latencies, lost = [], 0
+    for e in range(args.events):
+      targets = range(args.daemons) if args.all else [e % args.daemons]
+      busy = (e // (1 if args.all else args.daemons)) % 2 == 0
+      starts = {}
+      for n in targets:
+        starts[n] = monotonic()
+        bench.set(n, status='busy' if busy else 'idle', progress='%d%%' % e if busy else '',
+                  lastitems=['item%d' % e])
+      for n in targets:
+        t = bench.waitChange(n, starts[n], flag='stat', timeout=args.timeout)
+        if t is None:
+          lost += 1
+        else:
+          latencies.append(t - starts[n])
+      sleep(args.interval)
+    elapsed = monotonic() - t0
+    cpu = bench.sampler.cpu() - cpu0
+    calls = sum(bench.calls(n) for n in range(args.daemons)) - sum(calls0)
+  finally:
+    stop[0] = True
+    bench.stop()
+    if not args.keep:
+      bench.cleanup()
+  res = {'daemons': args.daemons, 'events': len(latencies), 'lost': lost,
+         'latency_ms': dict((k, None if v is None else round(v * 1000, 1)) for k, v in
+                            (('p50', percentile(latencies, 50)), ('p95', percentile(latencies, 95)),
+                             ('p99', percentile(latencies, 99)),
+                             ('max', max(latencies) if latencies else None))),
+         'elapsed_s': round(elapsed, 2), 'cpu_s': round(cpu, 2),
+         'cpu_pct': round(100 * cpu / elapsed, 1) if elapsed else None,
+         'status_calls_per_min': round(60 * calls / elapsed, 1) if elapsed else None,
+         'max_threads': max((s['threads'] for s in samples), default=None),
+         'max_children': max((s['children'] for s in samples), default=None),
+         'max_rss_kb': max((s['rss'] for s in samples), default=None)}
+  return res
+
+def argParse():
+  parser = ArgumentParser(description='End-to-end load harness for yandex-disk-indicator')
+  parser.add_argument('-n', '--daemons', type=int, default=1, help='Number of simulated daemons')
+  parser.add_argument('-e', '--events', type=int, default=100, help='Number of status changes')
+  parser.add_argument('-i', '--interval', type=float, default=0.5,
+                      help='Pause between status changes (sec)')
+  parser.add_argument('-a', '--all', action='store_true',
+                      help='Change status of all daemons at once (instead of round-robin)')
+  parser.add_argument('--latency', type=float, default=0.0,
+                      help='Latency of simulated "yandex-disk status" call (sec)')
+  parser.add_argument('--clilog', choices=('none', 'append', 'burst'), default='append',
+                      help='Pattern of cli.log writes on each status change')
+  parser.add_argument('--indicator', default=None, help='Path to indicator script')
+  parser.add_argument('--sample', type=float, default=1.0, help='Sampling interval (sec)')
+  parser.add_argument('--timeout', type=float, default=30, help='Change event timeout (sec)')
+  parser.add_argument('--keep', action='store_true', help='Keep sandbox folder')
+  parser.add_argument('--json', action='store_true', help='Print result as JSON')
+  return parser.parse_args()
+
+if __name__ == '__main__':
+  args = argParse()
+  res = run(args)
+  if args.json:
+    print(jsonDumps(res))
+  else:
+    for k, v in res.items():
+      print('%-22s %s' % (k, v))
@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Long-running memory and leak benchmark for yandex-disk-indicator.
+#
+# It runs the indicator (under virtual X server and private session bus when they are not
+# available) against simulated daemons and generates accelerated stream of status changes:
+# status flips, progress changes, new last synchronized items. It tracks:
+#   - RSS, threads and open fds of indicator process (from /proc),
+#   - traced memory (tracemalloc), number of gc objects and GObject instances (via soakrun.py).
+# At the end it reports the growth of each value and flags the monotonic growth: the median of
+# each quarter of the run (after warm-up) is greater than the median of previous quarter and
+# total growth exceeds the tolerance.
+#
+# Example (1 hour, 3 daemons, 10 changes per second):
+#   bench/soak.py -n 3 -d 3600 -i 0.1
+#
+from sys import executable, argv, exit as sysExit
+from os import environ, execvp
+from os.path import join as pathJoin
+from shutil import which, rmtree
+from tempfile import mkdtemp
+from threading import Thread
+from time import monotonic, sleep
+from json import loads as jsonLoads, dumps as jsonDumps
+from argparse import ArgumentParser
+from statistics import median
+
+from load import Bench, benchDir
+
+def growth(series, warmup, tolerance):
+  ''' Returns (first, last, flag) for the series after warm-up part. flag is True when the series
+      grows monotonically by quarters and total growth exceeds tolerance (part of first value). '''
+  series = series[int(len(series) * warmup):]
+  if len(series) < 8:
+    return None, None, False
+  q = len(series) // 4
+  medians = [median(series[i * q: (i + 1) * q]) for i in range(4)]
+  rising = all(b > a for a, b in zip(medians, medians[1:]))
+  return medians[0], medians[-1], rising and medians[-1] - medians[0] > abs(medians[0]) * tolerance
+
+def run(args):
+  statsDir = mkdtemp(prefix='ydi-soak-')    # Inner stats are written by soakrun.py wrapper
+  statsFile = pathJoin(statsDir, 'stats.jsonl')
+  bench = Bench(args.daemons, 0.0, args.clilog, args.indicator,
+                prefix=[pathJoin(benchDir, 'soakrun.py'), statsFile, str(args.sample)],
+                settings={'notifications': 'yes' if args.notifications else 'no'})
+  for n in range(args.daemons):
+    bench.set(n, running=True, status='idle')
+  bench.start()
+  samples = []
+  stop = [False]
+  def sampler():
+    while not stop[0] and bench.proc.poll() is None:
+      try:
+        samples.append(bench.sampler.sample())
+      except OSError:
+        break
+      sleep(args.sample)
+  try:
+    for n in range(args.daemons):
+      if bench.waitChange(n, 0, flag='stat', timeout=args.timeout) is None:
+        sysExit('Indicator does not report the initial status of daemon #%d' % n)
+    Thread(target=sampler, daemon=True).start()
+    e, end = 0, monotonic() + args.duration
+    while monotonic() < end and bench.proc.poll() is None:
+      n = e % args.daemons
+      step = e // args.daemons
+      busy = step % 4 != 3                # busy, busy (progress), busy (progress), idle
+      bench.set(n, status='busy' if busy else 'idle',
+                progress='%d MB/ 100 MB (%d %%)' % (step % 100, step % 100) if busy else '',
+                used='%d.%d GB' % (2 + step % 5, step % 10),
+                lastitems=['folder/file-%d-%d.txt' % (step, i) for i in range(step % 10)])
+      e += 1
+      sleep(args.interval)
+  finally:
+    stop[0] = True
+    bench.stop()
+  inner = []
+  try:
+    with open(statsFile) as f:
+      inner = [jsonLoads(l) for l in f]
+  except OSError:
+    pass
+  if not args.keep:
+    bench.cleanup()
+    rmtree(statsDir, ignore_errors=True)
+  res = {'duration_s': args.duration, 'events': e, 'samples': len(samples)}
+  leaks = []
+  for name, series in (('rss_kb', [s['rss'] for s in samples]),
+                       ('threads', [s['threads'] for s in samples]),
+                       ('fds', [s['fds'] for s in samples]),
+                       ('traced_bytes', [s['traced'] for s in inner]),
+                       ('gc_objects', [s['objects'] for s in inner]),
+                       ('gobjects', [s['gobjects'] for s in inner])):
+    first, last, flag = growth(series, args.warmup, args.tolerance)
+    res[name] = {'first': first, 'last': last, 'growth': flag}
+    if flag:
+      leaks.append(name)
+  if len(inner) > 1:                    # Object types with the largest growth
+    t0, t1 = inner[int(len(inner) * args.warmup)]['types'], inner[-1]['types']
+    res['top_type_growth'] = dict(sorted(((k, t1[k] - t0.get(k, 0)) for k in t1),
+                                         key=lambda kv: -kv[1])[:10])
+  res['leaks'] = leaks
+  return res
+
+def argParse():
+  parser = ArgumentParser(description='Memory and leak soak benchmark for yandex-disk-indicator')
+  parser.add_argument('-n', '--daemons', type=int, default=2, help='Number of simulated daemons')
+  parser.add_argument('-d', '--duration', type=float, default=3600, help='Run duration (sec)')
+  parser.add_argument('-i', '--interval', type=float, default=0.1,
+                      help='Pause between status changes (sec)')
+  parser.add_argument('--clilog', choices=('none', 'append', 'burst'), default='append',
+                      help='Pattern of cli.log writes on each status change')
+  parser.add_argument('--notifications', action='store_true', help='Enable notifications')
+  parser.add_argument('--indicator', default=None, help='Path to indicator script')
+  parser.add_argument('--sample', type=float, default=10, help='Sampling interval (sec)')
+  parser.add_argument('--warmup', type=float, default=0.1,
+                      help='Part of run that is ignored in growth analysis')
+  parser.add_argument('--tolerance', type=float, default=0.05,
+                      help='Allowed growth (part of initial value)')
+  parser.add_argument('--timeout', type=float, default=30, help='Change event timeout (sec)')
+  parser.add_argument('--keep', action='store_true', help='Keep sandbox and inner stats folders')
+  return parser.parse_args()
+
+if __name__ == '__main__':
+  # Provide virtual X server and private session bus when they are not available
+  if not environ.get('DISPLAY') and which('xvfb-run'):
+    execvp('xvfb-run', ['xvfb-run', '-a', executable] + argv)
+  if not environ.get('DBUS_SESSION_BUS_ADDRESS') and which('dbus-run-session'):
+    execvp('dbus-run-session', ['dbus-run-session', '--', executable] + argv)
+  args = argParse()
+  res = run(args)
+  print(jsonDumps(res, indent=2))
+  sysExit(1 if res['leaks'] else 0)
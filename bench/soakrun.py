@@ -0,0 +1,42 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# In-process statistics collector for soak benchmark (see soak.py).
+#
+# Usage: python3 soakrun.py <stats file> <interval> <indicator script> [indicator options]
+#
+# It starts the thread that periodically appends JSON line with the process internals to the
+# stats file: memory traced by tracemalloc, number of objects tracked by gc, number of GObject
+# instances, number of threads and the counts of top object types. Then it runs the indicator
+# script as __main__ in the same process.
+#
+from sys import argv
+from gc import get_objects, collect
+from threading import Thread, active_count
+from time import sleep, monotonic
+from json import dumps as jsonDumps
+from collections import Counter
+from runpy import run_path
+import tracemalloc
+
+def collector(fileName, interval):
+  from gi.repository import GObject
+  while True:
+    sleep(interval)
+    collect()
+    objs = get_objects()
+    types = Counter(type(o).__name__ for o in objs)
+    stat = {'time': monotonic(), 'traced': tracemalloc.get_traced_memory()[0],
+            'objects': len(objs), 'gobjects': sum(1 for o in objs if isinstance(o, GObject.Object)),
+            'threads': active_count(), 'types': dict(types.most_common(30))}
+    del objs
+    with open(fileName, 'at') as f:
+      f.write(jsonDumps(stat) + '\n')
+
+if __name__ == '__main__':
+  fileName, interval, script = argv[1], float(argv[2]), argv[3]
+  del argv[:3]                          # Indicator sees its own arguments only
+  argv[0] = script
+  tracemalloc.start()
+  Thread(target=collector, args=(fileName, interval), daemon=True).start()
+  run_path(script, run_name='__main__')
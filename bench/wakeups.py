@@ -0,0 +1,212 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Wakeups and energy accounting benchmark for yandex-disk-indicator.
+#
+# It runs the indicator against simulated daemons (see bench/yandex-disk stand-in) in each of
+# the daemon states: 'idle', 'busy' (with changing progress) and 'stopped', and counts per minute:
+#   - wakeups: context switches of all indicator threads (from /proc/<pid>/task/*/status, the
+#     precise value is taken from 'perf stat' when perf is available),
+#   - threads: number of created threads (new thread IDs in /proc/<pid>/task, short-living
+#     threads are counted precisely by strace),
+#   - spawns: number of started processes (calls of stand-in utility),
+#   - syscalls: number of system calls (strace -c summary, when strace is available),
+#   - cpu: CPU time of indicator process (sec per minute).
+# Values are compared with the budget (see BUDGET or --budget file with the same JSON structure):
+# the benchmark exits with code 1 when any value exceeds the budget.
+#
+# GUI mode requires X session and session bus (the benchmark restarts itself under xvfb-run and
+# dbus-run-session when they are not available), --headless runs the indicator without GUI.
+#
+# Example:
+#   bench/wakeups.py -n 2 -d 60 --states idle stopped
+#
+from sys import executable, argv, exit as sysExit
+from os import environ, execvp, listdir, kill, devnull
+from shutil import which
+from subprocess import Popen, PIPE, DEVNULL
+from signal import SIGINT
+from threading import Thread
+from time import monotonic, sleep
+from json import load as jsonLoad, dumps as jsonDumps
+from argparse import ArgumentParser
+from re import search as reSearch, findall as reFindall
+
+from load import Bench
+
+# Maximal values per minute for the whole indicator (with 1 daemon, scaled by number of daemons
+# except cpu that is scaled by square root as the main loop is shared).
+# Busy values include the refresh on each progress change (once per second by default).
+BUDGET = {'idle':    {'wakeups': 600, 'threads': 20, 'spawns': 15, 'syscalls': 6000, 'cpu': 0.3},
+          'busy':    {'wakeups': 1500, 'threads': 90, 'spawns': 90, 'syscalls': 20000, 'cpu': 1.5},
+          'stopped': {'wakeups': 600, 'threads': 20, 'spawns': 15, 'syscalls': 6000, 'cpu': 0.3}}
+
+class TaskSampler(object):            # Threads and context switches of process from /proc
+  def __init__(self, pid, interval):
+    self.pid = pid
+    self.interval = interval
+    self.switches = {}                  # thread ID -> last seen number of context switches
+    self.active = False
+
+  def tasks(self):
+    res = {}
+    for tid in listdir('/proc/%d/task' % self.pid):
+      try:
+        with open('/proc/%d/task/%s/status' % (self.pid, tid)) as f:
+          st = f.read()
+        res[tid] = sum(int(v) for v in reFindall(r'(?:non)?voluntary_ctxt_switches:\s*(\d+)', st))
+      except OSError:
+        pass                            # Thread has exited
+    return res
+
+  def start(self):
+    self.start0 = self.tasks()
+    self.switches = dict(self.start0)
+    self.active = True
+    self.thread = Thread(target=self.run, daemon=True)
+    self.thread.start()
+
+  def run(self):
+    while self.active:
+      sleep(self.interval)
+      try:
+        self.switches.update(self.tasks())
+      except OSError:
+        break
+
+  def stop(self):                       # Returns (context switches, new threads)
+    self.active = False
+    self.thread.join()
+    switches = sum(n - self.start0.get(tid, 0) for tid, n in self.switches.items())
+    return switches, len(set(self.switches) - set(self.start0))
+
+def perfStat(pid, duration):            # Context switches by perf (None when it is not available)
+  if which('perf') is None:
+    return None
+  proc = Popen(['perf', 'stat', '-x,', '-e', 'context-switches', '-p', str(pid), '--',
+                'sleep', str(duration)], stdout=DEVNULL, stderr=PIPE, universal_newlines=True)
+  err = proc.communicate()[1]
+  m = reSearch(r'^(\d+),,context-switches', err, flags=8)
+  return int(m.group(1)) if m else None
+
+def straceStat(pid, duration):          # (syscalls, clones) by strace -c (None when not available)
+  if which('strace') is None:
+    return None
+  proc = Popen(['strace', '-f', '-c', '-p', str(pid)], stdout=DEVNULL, stderr=PIPE,
+               universal_newlines=True)
+  sleep(duration)
+  kill(proc.pid, SIGINT)
+  err = proc.communicate()[1]
+  total = reSearch(r'^[-\d.\s]*?(\d+)\s+(?:\d+\s+)?total$', err, flags=8)
+  if total is None:
+    return None
+  clones = sum(int(n) for n in reFindall(r'^\s*[\d.]+\s+[\d.]+\s+\d+\s+(\d+)\s+(?:\d+\s+)?clone3?$',
+                                          err, flags=8))
+  return int(total.group(1)), clones
+
+def measure(args, state):
+  bench = Bench(args.daemons, 0.0, 'append', args.indicator,
+                args=['--headless', '-o', devnull] if args.headless else [])
+  bench.extraEnv['XDG_RUNTIME_DIR'] = bench.root   # Don't touch the socket of running indicator
+  for n in range(args.daemons):
+    if state == 'stopped':
+      bench.set(n, running=False, status='idle')
+      with open(bench.cfgs[n], 'at') as f:       # Indicator must not start the daemon
+        f.write('startonstartofindicator="no"\n')
+    else:
+      bench.set(n, running=True, status=state, progress='0 MB/ 100 MB (0 %)' if state == 'busy' else '')
+  bench.start()
+  stop = [False]
+  drivers = []
+  def driver():                         # Busy daemons change their progress like real ones
+    step = 0
+    while not stop[0]:
+      sleep(args.progress)
+      step += 1
+      for n in range(args.daemons):
+        bench.set(n, progress='%d MB/ 100 MB (%d %%)' % (step % 100, step % 100))
+  try:
+    sleep(args.warmup)
+    if bench.proc.poll() is not None:
+      sysExit('Indicator exited: %s' % ''.join(bench.lines[-5:]))
+    if state == 'busy':
+      drivers.append(Thread(target=driver, daemon=True))
+      drivers[0].start()
+    tasks = TaskSampler(bench.proc.pid, args.sample)
+    calls0 = sum(bench.calls(n, c) for n in range(args.daemons) for c in ('status', 'start', 'stop'))
+    cpu0, t0 = bench.sampler.cpu(), monotonic()
+    tasks.start()
+    perf = [None]
+    perfThread = Thread(target=lambda: perf.__setitem__(0, perfStat(bench.proc.pid, args.duration)))
+    perfThread.start()
+    strace = straceStat(bench.proc.pid, args.duration) if not args.nostrace else None
+    if strace is None:
+      sleep(max(0, args.duration - (monotonic() - t0)))
+    perfThread.join()
+    elapsed = monotonic() - t0
+    cpu = bench.sampler.cpu() - cpu0
+    switches, threads = tasks.stop()
+    calls = sum(bench.calls(n, c) for n in range(args.daemons) for c in ('status', 'start', 'stop'))
+  finally:
+    stop[0] = True
+    for d in drivers:
+      d.join()
+    bench.stop()
+    bench.cleanup()
+  perMin = 60 / elapsed
+  res = {'wakeups': round((perf[0] if perf[0] is not None else switches) * perMin, 1),
+         'wakeups_source': 'perf' if perf[0] is not None else 'proc',
+         'threads': round((strace[1] if strace else threads) * perMin, 1),
+         'threads_source': 'strace' if strace else 'proc',
+         'spawns': round((calls - calls0) * perMin, 1),
+         'syscalls': round(strace[0] * perMin, 1) if strace else None,
+         'cpu': round(cpu * perMin, 3)}
+  return res
+
+def run(args):
+  budget = BUDGET
+  if args.budget:
+    with open(args.budget) as f:
+      budget = jsonLoad(f)
+  res, over = {}, []
+  for state in args.states:
+    r = measure(args, state)
+    limits = {}
+    for key, limit in budget.get(state, {}).items():
+      limit = limit * (args.daemons ** 0.5 if key == 'cpu' else args.daemons)
+      limits[key] = limit
+      if r.get(key) is not None and r[key] > limit:
+        over.append('%s.%s' % (state, key))
+    r['budget'] = limits
+    res[state] = r
+  res['over_budget'] = over
+  return res
+
+def argParse():
+  parser = ArgumentParser(description='Wakeups and energy accounting benchmark for yandex-disk-indicator')
+  parser.add_argument('-n', '--daemons', type=int, default=1, help='Number of simulated daemons')
+  parser.add_argument('-d', '--duration', type=float, default=60, help='Measurement time for each state (sec)')
+  parser.add_argument('-w', '--warmup', type=float, default=15,
+                      help='Time after start before the measurement (sec)')
+  parser.add_argument('--states', nargs='+', choices=('idle', 'busy', 'stopped'),
+                      default=['idle', 'busy', 'stopped'], help='Daemon states to measure')
+  parser.add_argument('--progress', type=float, default=1.0,
+                      help='Interval of progress changes in busy state (sec)')
+  parser.add_argument('--sample', type=float, default=0.1, help='Threads sampling interval (sec)')
+  parser.add_argument('--headless', action='store_true', help='Run indicator without GUI')
+  parser.add_argument('--nostrace', action='store_true', help="Don't use strace (it slows the process down)")
+  parser.add_argument('--budget', default=None, help='JSON file with budget values')
+  parser.add_argument('--indicator', default=None, help='Path to indicator script')
+  return parser.parse_args()
+
+if __name__ == '__main__':
+  if '--headless' not in argv:
+    # Provide virtual X server and private session bus when they are not available
+    if not environ.get('DISPLAY') and which('xvfb-run'):
+      execvp('xvfb-run', ['xvfb-run', '-a', executable] + argv)
+    if not environ.get('DBUS_SESSION_BUS_ADDRESS') and which('dbus-run-session'):
+      execvp('dbus-run-session', ['dbus-run-session', '--', executable] + argv)
+  args = argParse()
+  res = run(args)
+  print(jsonDumps(res, indent=2))
+  sysExit(1 if res['over_budget'] else 0)
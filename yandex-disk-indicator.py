@@ -22,31 +22,115 @@ You should have received a copy of the GNU General Public License
 along with this program.  If not, see http://www.gnu.org/licenses
 """
 
-from os import remove, makedirs, getpid, geteuid, getenv
-from gi import require_version
-require_version('Gtk', '3.0')
-from gi.repository import Gtk
-require_version('AppIndicator3', '0.1')
-from gi.repository import AppIndicator3 as appIndicator
-require_version('Notify', '0.7')
-from gi.repository import Notify
-require_version('GLib', '2.0')
-from gi.repository.GLib import timeout_add, source_remove, idle_add, unix_signal_add, PRIORITY_HIGH
-require_version('GdkPixbuf', '2.0')
-from gi.repository.GdkPixbuf import Pixbuf
-from subprocess import check_output, call, CalledProcessError
-from re import findall as reFindall, sub as reSub, search as reSearch, M as reM, S as reS
+from os import remove, makedirs, getpid, geteuid, getenv, rename, environ
+from subprocess import check_output, call, CalledProcessError, Popen, PIPE, TimeoutExpired
+from re import findall as reFindall, search as reSearch, S as reS, compile as reCompile
 from argparse import ArgumentParser
 from gettext import translation
 from logging import basicConfig, getLogger
 from os.path import exists as pathExists, join as pathJoin, relpath as relativePath, expanduser
-from os import stat
+from os.path import realpath, basename, dirname
+from os import stat, statvfs, cpu_count, walk, pipe, read, write, close as closeFile, listdir
+try:
+  from os import pidfd_open
+except ImportError:             # Python < 3.9: daemon process is checked via /proc periodically
+  pidfd_open = None
+from select import select
+from ctypes import CDLL, get_errno
+from errno import ENOSPC
+from struct import unpack_from
 from shutil import copy as fileCopy, which
 from datetime import datetime
 from webbrowser import open_new as openNewBrowser
-from signal import signal, SIGTERM, SIGINT
-from sys import exit as sysExit
-from threading import Timer as thTimer, Lock, Thread
+from signal import signal, SIGTERM, SIGINT, SIGUSR1, SIGUSR2
+from sys import exit as sysExit, stdout, _current_frames as currentFrames
+from threading import Timer as thTimer, Lock, Thread, Event, Condition, get_ident
+from threading import enumerate as threadsList
+from time import monotonic, time
+from concurrent.futures import ThreadPoolExecutor, Future, CancelledError
+from collections import deque, Counter
+from cProfile import Profile
+from pstats import Stats
+from traceback import format_stack as formatStack
+import tracemalloc
+from types import MappingProxyType
+from json import dumps as jsonDumps, loads as jsonLoads
+from socket import socket, AF_UNIX, SOCK_STREAM
+from csv import writer as csvWriter
+# GUI libraries are imported only in GUI mode (see importGUI and the command line parsing below)
+class Gtk(object):              # Placeholder of Gtk namespace until GUI libraries are imported
+  Menu = Dialog = object        # Base classes of GUI classes: they are defined but not usable
+
+def importGUI():                # Import GUI libraries into module namespace
+  global Gtk, appIndicator, Notify, timeout_add, source_remove, idle_add, unix_signal_add
+  global PRIORITY_HIGH, Pixbuf, Gio, Variant
+  from gi import require_version
+  require_version('Gtk', '3.0')
+  from gi.repository import Gtk
+  require_version('AppIndicator3', '0.1')
+  from gi.repository import AppIndicator3 as appIndicator
+  require_version('Notify', '0.7')
+  from gi.repository import Notify
+  require_version('GLib', '2.0')
+  from gi.repository.GLib import timeout_add, source_remove, idle_add, unix_signal_add, PRIORITY_HIGH
+  require_version('GdkPixbuf', '2.0')
+  from gi.repository.GdkPixbuf import Pixbuf
+  require_version('Gio', '2.0')
+  from gi.repository import Gio
+  from gi.repository.GLib import Variant
+
+def argParse(ver):              # Parse command line arguments
+  parser = ArgumentParser(description=_('Desktop indicator for yandex-disk daemon'), add_help=False)
+  group = parser.add_argument_group(_('Options'))
+  group.add_argument('-l', '--log', type=int, choices=range(10, 60, 10), dest='level', default=30,
+            help=_('Sets the logging level: ' +
+                   '10 - to show all messages (DEBUG), ' +
+                   '20 - to show all messages except debugging messages (INFO), ' +
+                   '30 - to show all messages except debugging and info messages (WARNING), ' +
+                   '40 - to show only error and critical messages (ERROR), ' +
+                   '50 - to show critical messages only (CRITICAL). Default: 30'))
+  group.add_argument('-c', '--config', dest='cfg', metavar='path', default='',
+            help=_('Path to configuration file of YandexDisk daemon. ' +
+                   'This daemon will be added to daemons list' +
+                   ' if it is not in the current configuration.' +
+                   'Default: \'\''))
+  group.add_argument('-r', '--remove', dest='rcfg', metavar='path', default='',
+            help=_('Path to configuration file of daemon that should be removed' +
+                   ' from daemos list. Default: \'\''))
+  group.add_argument('--headless', action='store_true',
+            help=_('Run without GUI: monitor daemons and write status changes as JSON lines'))
+  group.add_argument('-o', '--output', dest='output', metavar='path', default='',
+            help=_('File to append status change events in headless mode. Default: stdout'))
+  group.add_argument('--wait-idle', dest='waitidle', action='store_true',
+            help=_('Wait until daemons of running indicator are synchronized (idle) and exit'))
+  group.add_argument('--wait-status', dest='waitstatus', metavar='status[,status]', default='',
+            help=_('Wait until daemons of running indicator have one of specified statuses ' +
+                   '(idle, busy, paused, none, no_net, error) and exit'))
+  group.add_argument('--daemon', type=int, action='append', metavar='n',
+            help=_('Daemon number (in daemons list) to wait for. Default: all daemons'))
+  group.add_argument('--timeout', type=float, metavar='sec', default=0,
+            help=_('Waiting timeout, 0 - no timeout. Default: 0'))
+  group.add_argument('--stats-csv', dest='statscsv', metavar='path', default='',
+            help=_('Write time in states statistics of daemons as CSV ("-" - to stdout) and exit'))
+  group.add_argument('-h', '--help', action='help', help=_('Show this help message and exit'))
+  group.add_argument('-v', '--version', action='version', version='%(prog)s v.' + ver,
+            help=_('Print version and exit'))
+  return parser.parse_args()
+
+if __name__ == '__main__':
+  # Load translation object (or NullTranslations) and define _() function.
+  translation(appName, '/usr/share/locale', fallback=True).install()
+  # Command line is parsed before GUI classes are defined: the GUI libraries are imported only in
+  # GUI mode, headless and client (--wait-*, --stats-csv) modes don't require them
+  args = argParse(appVer)
+  guiMode = not (args.headless or args.waitidle or args.waitstatus or args.statscsv)
+  if guiMode:
+    importGUI()
+
+# Application constants
+appHomeName = 'yd-tools'
+installDir = pathJoin('/usr/share', appHomeName)
+configPath = pathJoin(getenv("HOME"), '.config', appHomeName)
 
 
 #################### Common utility functions and classes ####################
@@ -123,6 +207,93 @@ class CVal(object):             # Multivalue helper
   def __bool__(self):
     return self.val is not None
 
+class CmdQueue(object):         # Per-daemon commands queue
+  ''' Queue of commands of one daemon. Commands of one queue are executed one by one, but
+      queues of all daemons share one bounded pool of worker threads.
+      Public methods:
+        submit - Put function into the queue. It returns Future object of the call or None when
+                 queue is closed. When the last waiting command has the same key the command is
+                 not queued again: the Future of the waiting command is returned (the commands
+                 with other keys between them keep the order of requests, e.g. start, stop, start).
+        run    - Execute external command and return its output (it is called from queued
+                 functions). The process is killed when it runs longer than timeout.
+        cancel - Close the queue: cancel all waiting commands and kill running processes.
+  '''
+  workers = 4                         # Number of worker threads shared by all queues
+  __pool = None                       # Shared pool of worker threads
+  __poolLock = Lock()
+
+  @classmethod
+  def pool(cls):                      # Create shared pool on first request
+    with cls.__poolLock:
+      if cls.__pool is None:
+        cls.__pool = ThreadPoolExecutor(max_workers=cls.workers, thread_name_prefix='ydcmd')
+      return cls.__pool
+
+  def __init__(self, timeout=10):
+    self.timeout = timeout            # Default timeout for external commands (sec)
+    self.closed = False
+    self.__lock = Lock()
+    self.__pending = deque()          # Waiting commands: (key, future, function, args)
+    self.__active = False             # True when the queue has a task in the pool
+    self.__procs = set()              # Running external processes
+
+  def submit(self, key, func, *args):
+    with self.__lock:
+      if self.closed:
+        return None
+      if self.__pending and self.__pending[-1][0] == key:
+        return self.__pending[-1][1]  # The same command is the last waiting one
+      fut = Future()
+      self.__pending.append((key, fut, func, args))
+      if not self.__active:
+        self.__active = True
+        CmdQueue.pool().submit(self.__next)
+    return fut
+
+  def __next(self):                   # Execute one command and pass the queue to the pool again
+    with self.__lock:
+      if not self.__pending:
+        self.__active = False
+        return
+      key, fut, func, args = self.__pending.popleft()
+    if fut.set_running_or_notify_cancel():
+      try:
+        fut.set_result(func(*args))
+      except Exception as e:
+        fut.set_exception(e)
+    with self.__lock:
+      if self.__pending:
+        CmdQueue.pool().submit(self.__next)   # Let other queues use the worker before next command
+      else:
+        self.__active = False
+
+  def run(self, cmd, timeout=None):
+    proc = Popen(cmd, stdout=PIPE, universal_newlines=True)
+    with self.__lock:
+      self.__procs.add(proc)
+    try:
+      output = proc.communicate(timeout=timeout or self.timeout)[0]
+    except TimeoutExpired:
+      logger.warning('Command timeout: %s' % ' '.join(cmd))
+      proc.kill()
+      proc.communicate()
+      raise
+    finally:
+      with self.__lock:
+        self.__procs.discard(proc)
+    if proc.returncode:
+      raise CalledProcessError(proc.returncode, cmd, output)
+    return output
+
+  def cancel(self):
+    with self.__lock:
+      self.closed = True
+      while self.__pending:
+        self.__pending.popleft()[1].cancel()
+      for proc in self.__procs:
+        proc.kill()
+
 class Config(dict):             # Configuration
 
   def __init__(self, fileName, load=True,
@@ -145,31 +316,42 @@ class Config(dict):             # Configuration
       value = False
     return value
 
+  keyRe = reCompile(r'"([^"]+)"$|([\w-]+)$')           # Quoted key or key without quotes
+  valueRe = reCompile(r'\s*(?:"([^"]*)"|([^",#]*))\s*')  # Quoted value or value without quotes
+
   def getValue(self, st):               # Find value(s) in string after '='
-    v = CVal()                                    # Value accumulator
-    st = st.strip()                               # Remove starting and ending spaces
-    if st.startswith(','):
-      return None                                 # Error: String after '=' starts with comma
+    '''
+    Tokenizer of comma-separated values: each value is matched from the current position of the
+    string (the string is not sliced), so the time is linear in string length.
+    Empty items (like after trailing or doubled comma in "a,, b, ") are dropped with warning unless
+    the value is empty.
+    Returns the single value, the list of values or None on error.
+    '''
+    vals = []                                     # Value accumulator
+    pos, end = 0, len(st.rstrip())
     while True:
-      s = reSearch(r'^("[^"]*")|^([^",#]+)', st)  # Search for quoted or value without quotes
-      if s is None:
-        return None                               # Error: Nothing found but value expected
-      start, end = s.span()
-      vv = st[start: end].strip()                 # Get found value
-      if vv.startswith('"'):
-        vv = vv[1: -1]                            # Remove quotes
-      v.add(self.decode(vv))                      # Decode and store value
-      st = st[end:].lstrip()                      # Remove value and following spaces from string
-      if st == '':
-        return v.get()                            # EOF normaly reached (after last value in string)
-      else:                                       # String still contain something
-        if st.startswith(','):                    # String is continued with comma?
-          st = st[1:].lstrip()                    # Remove comma and following spaces
-          if st != '':                            # String is continued after comma?
-            continue                              # Continue to search values
-          # else:                                 # Error: No value after comma
-        # else:                                   # Error: Next symbol is not comma
-        return None                               # Error
+      s = self.valueRe.match(st, pos)             # Quoted or value without quotes (it can be empty)
+      quoted, plain = s.groups()
+      vals.append(self.decode(quoted if quoted is not None else plain.strip()))
+      pos = s.end()
+      if pos >= end:                              # EOF normaly reached (after last value in string)
+        items = [v for v in vals if v != '']
+        if items and len(items) < len(vals):
+          logger.warning('Empty items are ignored in value: %s' % st[:200])
+        return CVal(items or vals[:1]).get()
+      if st[pos] != ',':
+        return None                               # Error: Next symbol is not comma
+      pos += 1                                    # Value after comma is expected
+
+  def lineKey(self, line):              # Returns (key, value string) of config line or (None, None)
+    st = line.strip()
+    if not st or st[0] == '#' or self.delimiter not in st:
+      return None, None                           # Blank line, comment or line without delimiter
+    kv, _d, vv = st.partition(self.delimiter)
+    key = self.keyRe.match(kv.strip())
+    if key is None:
+      return None, vv
+    return key.group(1) or key.group(2), vv.strip()
 
   def load(self, bools=[['true', 'yes', 'y'], ['false', 'no', 'n']], delimiter='='):
     """
@@ -182,35 +364,31 @@ class Config(dict):             # Configuration
     """
     self.bools = bools
     self.delimiter = delimiter
-    try:                              # Read configuration file into list of tuples ignoring blank
-                                      # lines, lines without delimiter, and lines with comments.
+    try:                              # Read configuration file
       with open(self.fileName) as cf:
-        res = [reFindall(r'^\s*(.+?)\s*%s\s*(.*)$' % self.delimiter, l)[0]
-               for l in cf if l and self.delimiter in l and l.lstrip()[0] != '#']
+        lines = cf.read().splitlines()
       self.readSuccess = True
     except:
       logger.error('Config file read error: %s' % self.fileName)
       self.readSuccess = False
       return False
-    for kv, vv in res:                # Parse each line
-      # Check key
-      key = reFindall(r'^"([^"]+)"$|^([\w-]+)$', kv)
-      if key == []:
-        logger.warning('Wrong key in line \'%s %s %s\'' % (kv, self.delimiter, vv))
-      else:                           # Key is OK
-        key = key[0][0] + key[0][1]   # Join two possible keys variants (with and without quotes)
-        if vv.strip() == '':
-          logger.warning('No value specified in line \'%s %s %s\'' % (kv, self.delimiter, vv))
-        else:                         # Value is not empty
-          value = self.getValue(vv)   # Parse values
-          if value is None:
-            logger.warning('Wrong value(s) in line \'%s %s %s\'' % (kv, self.delimiter, vv))
-          else:                       # Value is OK
-            if key in self.keys():    # Check double values
-              logger.warning(('Double values for one key:\n%s = %s\nand\n%s = %s\n' +
-                              'Last one is stored.') % (key, self[key], key, value))
-            self[key] = value         # Store last value
-            logger.debug('Config value read as: %s = %s' % (key, str(value)))
+    for line in lines:                # Parse each line ignoring blank lines, lines without
+      key, vv = self.lineKey(line)    # delimiter, and lines with comments.
+      if vv is None:
+        continue
+      if key is None:
+        logger.warning('Wrong key in line \'%s\'' % line[:200])
+      elif vv == '':
+        logger.warning('No value specified in line \'%s\'' % line[:200])
+      else:                           # Key and value are not empty
+        value = self.getValue(vv)     # Parse values
+        if value is None:
+          logger.warning('Wrong value(s) in line \'%s\'' % line[:200])
+        else:                         # Value is OK
+          if key in self.keys():      # Check double values
+            logger.warning('Double values for one key: %s. Last one is stored.' % key)
+          self[key] = value           # Store last value
+          logger.debug('Config value read as: %s = %s' % (key, value))
     logger.info('Config read: %s' % self.fileName)
     return True
 
@@ -222,33 +400,46 @@ class Config(dict):             # Configuration
     return val
 
   def save(self, boolval=['yes', 'no'], usequotes=True, delimiter='='):
+    '''
+    Updates the values in config file. Only the lines with changed values are rewritten: comments,
+    order of lines and representation (quoting) of the not changed values are kept as they are.
+    Value None removes the key from file. New keys are added to the end of file.
+    '''
     self.usequotes = usequotes
     self.boolval = boolval
     self.delimiter = delimiter
     try:                                  # Read the file in buffer
       with open(self.fileName, 'rt') as cf:
-        buf = cf.read()
+        lines = cf.read().splitlines()
     except:
       logger.warning('Config file access error, a new file (%s) will be created' % self.fileName)
-      buf = ''
-    buf = reSub(r'[\n]*$', '\n', buf)     # Remove all ending blank lines except the one.
+      lines = []
+    while lines and not lines[-1].strip():
+      lines.pop()                         # Remove all ending blank lines
+    index = {}                            # key -> numbers of lines with this key
+    for n, line in enumerate(lines):
+      key, vv = self.lineKey(line)
+      if key is not None:
+        index.setdefault(key, []).append(n)
     for key, value in self.items():
+      found = index.get(key, [])
       if value is None:
-        res = ''                          # Remove 'key=value' from file if value is None
+        res = None                        # Remove 'key=value' from file if value is None
         logger.debug('Config value \'%s\' will be removed' % key)
+      elif len(found) == 1 and self.getValue(self.lineKey(lines[found[0]])[1]) == value:
+        continue                          # Value is not changed: line is kept as it is
       else:                               # Make a line with value
-        res = self.delimiter.join([key,
-                                   ', '.join([self.encode(val) for val in CVal(value)])]) + '\n'
-        logger.debug('Config value to save: %s' % res[:-1])
-      # Find line with key in file the buffer
-      sRe = reSearch(r'^[ \t]*["]?%s["]?[ \t]*%s.+\n' % (key, self.delimiter), buf, flags=reM)
-      if sRe is not None:                 # Value has been found
-        buf = sRe.re.sub(res, buf)        # Replace it with new value
-      elif res != '':                     # Value was not found and value is not empty
-        buf += res                        # Add new value to end of file buffer
+        res = self.delimiter.join([key, ', '.join([self.encode(val) for val in CVal(value)])])
+        logger.debug('Config value to save: %s' % res)
+      if found:                           # Value has been found
+        lines[found[0]] = res             # Replace it with new value
+        for n in found[1:]:
+          lines[n] = None                 # Remove double values
+      elif res is not None:               # Value was not found and value is not empty
+        lines.append(res)                 # Add new value to end of file buffer
     try:
       with open(self.fileName, 'wt') as cf:
-        cf.write(buf)                     # Write updated buffer to file
+        cf.write(''.join(l + '\n' for l in lines if l is not None))  # Write updated lines to file
     except:
       logger.error('Config file write error: %s' % self.fileName)
       return False
@@ -256,6 +447,26 @@ class Config(dict):             # Configuration
     self.changed = False                  # Reset flag of change in not stored config
     return True
 
+class StatusStore(object):      # Status values with field-level subscriptions
+  '''
+  update() stores the new values and calls the subscribers of the changed fields. Each subscriber
+  is called once per update with all current values. The first update calls all subscribers.
+  '''
+  def __init__(self):
+    self.values = {}
+    self.subscribers = []               # (set of fields, callback)
+
+  def subscribe(self, fields, callback):
+    self.subscribers.append((set(fields), callback))
+
+  def update(self, values):             # Returns the set of changed fields
+    changed = set(k for k, v in values.items() if k not in self.values or self.values[k] != v)
+    self.values = dict(values)
+    for fields, callback in self.subscribers:
+      if fields & changed:
+        callback(self.values)
+    return changed
+
 class Notification(object):     # On-screen notification
 
   def __init__(self, title):    # Initialize notification engine
@@ -267,15 +478,12 @@ class Notification(object):     # On-screen notification
   def send(self, messg):
     global logo
     logger.debug('Message: %s | %s' % (self.title, messg))
-    if self.note is not None:
-      try:
-        self.note.close()
-      except:
-        pass
-      self.note = None
-    try:                            # Create notification
-      self.note = Notify.Notification.new(self.title, messg)
-      self.note.set_image_from_pixbuf(logo)
+    try:
+      if self.note is None:         # Create notification once and reuse it for next messages
+        self.note = Notify.Notification.new(self.title, messg)
+        self.note.set_image_from_pixbuf(logo)
+      else:
+        self.note.update(self.title, messg, None)
       self.note.show()              # Display new notification
     except:
       logger.error('Message engine failure')
@@ -286,11 +494,16 @@ class YDDaemon(object):         # Yandex.Disk daemon interface
   This is the fully automated class that serves as daemon interface.
   Public methods:
   __init__ - Handles initialization of the object and as a part - auto-start daemon if it
-             is required by configuration settings.
-  output   - Provides daemon output (in user language) through the parameter of callback. Executed in separate thread 
-  start    - Request to start daemon. Do nothing if it is alreday started. Executed in separate thread
-  stop     - Request to stop daemon. Do nothing if it is not started. Executed in separate thread
+             is required by configuration settings. With background=True the daemon config is
+             loaded and checked and daemon is started in separate thread (see loaded).
+  output   - Provides daemon output (in user language) through the parameter of callback. Executed via commands queue
+  start    - Request to start daemon. Do nothing if it is alreday started. Executed via commands queue
+  stop     - Request to stop daemon. Do nothing if it is not started. Executed via commands queue
   exit     - Handles 'Stop on exit' facility according to daemon configuration settings.
+  refresh  - Request the status refresh. Executed in events worker thread of daemon
+  snapshot - Returns the current status values dictionary (see change). It is not changed later:
+             each refresh makes a new dictionary.
+  callStats - Returns the copy of status requests statistics (see stats).
   change   - Virtual method for handling daemon status changes. It have to be redefined by UI class.
              The parameters of the call - status values dictionary with following keys:
               'status' - current daemon status
@@ -307,10 +520,18 @@ class YDDaemon(object):         # Yandex.Disk daemon interface
               'error' - error message
               'path' - path of error
   error    - Virtual method for error handling. It have to be redefined by UI class.
+  governed - Virtual method that is called when Governor pauses the daemon (with the reason text)
+             or resumes it (with empty reason). It can be redefined by UI class.
+  loaded   - Virtual method that is called when initialization is finished (with False when the
+             daemon is not configured). It can be redefined by UI class.
  
   Class interface variables:
   ID       - the daemon identity string (empty in single daemon configuration)
+  ready    - True when initialization is finished (config is loaded)
   config   - The daemon configuration dictionary (object of _DConfig(Config) class)
+  stats    - Status requests statistics: number of 'calls', 'failures' (including daemon is
+             not running), 'timeouts' and total duration of calls in 'seconds' (it is updated
+             from several threads: use callStats() to read the consistent copy)
   '''
   #################### Virtual methods ##################
   # they have to be implemented in GUI part of code
@@ -320,10 +541,18 @@ class YDDaemon(object):         # Yandex.Disk daemon interface
     return 0 
 
   def change(self, vals):                  # Update handler
-    logger.debug('Update event: %s \nValues : %s' % (str(update), str(vals)))
+    logger.debug('Update event: %s' % str(vals))
+
+  def governed(self, reason):              # Governor pause/resume handler
+    logger.info('%sGovernor: %s' % (self.ID, reason if reason else 'resumed'))
+
+  def loaded(self, configured):            # Initialization finished handler
+    logger.debug('%sInitialization finished%s' % (self.ID, '' if configured else ': not configured'))
 
   #################### Private classes ####################
   class __Watcher(object):                 # File changes watcher implementation
+    ''' It checks the file change time every 0.5 sec in one long-living thread (the thread is not
+        created for each check) until it is stopped. '''
     def __init__(self, path, handler, *args, **kwargs):
       self.path = path
       self.handler = handler
@@ -339,21 +568,180 @@ class YDDaemon(object):         # Yandex.Disk daemon interface
         logger.info("Watcher was not started: path '"+self.path+"' was not found.")
         return
       self.mark = stat(self.path).st_ctime_ns
-      def wHandler():
-        st = stat(self.path).st_ctime_ns
-        if st != self.mark:
-          self.mark = st
-          self.handler(*self.args, **self.kwargs)
-        self.timer = thTimer(0.5, wHandler)
-        self.timer.start()
-      self.timer = thTimer(0.5, wHandler)
-      self.timer.start()
+      self.stopped = Event()
+      def wHandler(stopped):
+        while not stopped.wait(0.5):
+          try:
+            st = stat(self.path).st_ctime_ns
+          except OSError:
+            continue
+          if st != self.mark:
+            self.mark = st
+            self.handler(*self.args, **self.kwargs)
+      Thread(target=wHandler, args=(self.stopped,), daemon=True).start()
       self.status = True
     
     def stop(self):
       if not self.status:
         return
-      self.timer.cancel()
+      self.stopped.set()
+      self.status = False
+
+  class __Tracker(object):                 # Daemon process liveness tracker
+    '''
+    It finds the daemon process of config in /proc and waits for its exit on pidfd (or checks
+    /proc every 'interval' seconds when pidfd is not available). When the daemon is not running
+    /proc is scanned every 'interval' seconds. The handler is called with True when the daemon
+    process is found and with False when it has exited.
+    The tracker is trusted only after the status request confirms it (see verify) and it is
+    disabled when the daemon answers but its process can't be found (it is simulated or runs in
+    another namespace): then the daemon status is polled as before.
+    The pid is used from the tracker thread and from the threads of status requests, so it is
+    guarded by lock. The wake up pipe is closed by the tracker thread on its exit (or by exit()
+    when the thread was not started).
+    '''
+    COMMANDS = {'status', 'stop', 'token', 'sync', 'publish', 'unpublish', 'setup', 'help'}
+
+    def __init__(self, handler, interval=5):
+      self.handler = handler
+      self.interval = interval
+      self.cfg = None                   # Real path of daemon config
+      self.pid = None                   # Daemon process ID (None when it is not running)
+      self.enabled = pathExists('/proc/self')
+      self.trusted = False              # The tracker state is confirmed by status request
+      self.lock = Lock()                # Guards pid, thread and pipe
+      self.thread = None
+      self.stopR, self.stopW = pipe()   # Wakes up the tracker thread on exit
+
+    def start(self, cfgFile):
+      if not self.enabled:
+        return
+      cfg = realpath(expanduser(cfgFile))
+      pid = self.find(cfg)
+      with self.lock:
+        if not self.enabled:            # Tracking is not available or exit is already called
+          return
+        self.cfg, self.pid = cfg, pid
+        self.thread = Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def setPid(self, pid, expected=None):   # Set pid unless it is changed by another thread meanwhile
+      with self.lock:
+        if self.pid == expected:
+          self.pid = pid
+        return self.pid
+
+    def wake(self):                     # Wake up the tracker thread to finish it
+      with self.lock:
+        if self.stopW is not None:
+          write(self.stopW, b'x')
+
+    def close(self):                    # Close wake up pipe (lock have to be acquired)
+      if self.stopW is not None:
+        closeFile(self.stopR)
+        closeFile(self.stopW)
+        self.stopR = self.stopW = None
+
+    def config(self, args):             # Config path from daemon command line
+      for i, arg in enumerate(args):
+        if arg in ('-c', '--config') and i + 1 < len(args):
+          return realpath(args[i + 1])
+        if arg.startswith('--config='):
+          return realpath(arg[9:])
+      return realpath(expanduser('~/.config/yandex-disk/config.cfg'))
+
+    def find(self, cfg=None):           # Find daemon process in /proc, returns its pid or None
+      cfg = cfg or self.cfg
+      uid = geteuid()
+      for name in listdir('/proc'):
+        if not name.isdigit():
+          continue
+        try:
+          if stat('/proc/' + name).st_uid != uid:
+            continue
+          with open('/proc/%s/cmdline' % name, 'rb') as f:
+            args = f.read().decode(errors='replace').split('\0')[:-1]
+        except OSError:                 # Process has exited
+          continue
+        if (args and basename(args[0]) == 'yandex-disk' and not self.COMMANDS.intersection(args) and
+            self.config(args) == cfg):
+          return int(name)
+      return None
+
+    def alive(self):                    # Daemon process is running
+      with self.lock:
+        pid = self.pid
+      if pid is None:
+        pid = self.setPid(self.find())
+      return pid is not None
+
+    def dead(self):                     # Daemon is surely not running (it needn't be polled)
+      with self.lock:
+        return self.enabled and self.trusted and self.pid is None
+
+    def verify(self, running):          # Compare tracker state with result of status request
+      with self.lock:
+        if not self.enabled:
+          return
+        pid = self.pid
+      if running and pid is None:
+        pid = self.setPid(self.find())
+        if pid is None:
+          logger.info('Daemon process is not found: process tracking is disabled')
+          with self.lock:
+            self.enabled = self.trusted = False
+            if self.stopW is not None:  # Wake up the tracker thread to finish it
+              write(self.stopW, b'x')
+          return
+      with self.lock:
+        # Running process that doesn't answer yet (starting or hung) doesn't confirm the tracker
+        self.trusted = self.trusted or running == (pid is not None)
+
+    def run(self):
+      while self.enabled:
+        with self.lock:
+          pid = self.pid
+        if pid is None:                 # Wait for daemon start
+          if select([self.stopR], [], [], self.interval)[0]:
+            break
+          pid = self.setPid(self.find())
+          if pid is not None:
+            logger.debug('Daemon process %d is found' % pid)
+            self.handler(True)
+          continue
+        try:
+          pfd = pidfd_open(pid) if pidfd_open is not None else None
+        except OSError:                 # Process has already exited
+          pfd = -1
+        if pfd is not None and pfd >= 0:
+          ready = select([self.stopR, pfd], [], [])[0]
+          closeFile(pfd)
+        elif pfd is None:
+          ready = select([self.stopR], [], [], self.interval)[0]
+          try:
+            with open('/proc/%d/cmdline' % pid, 'rb') as f:
+              if f.read():              # Process is still running (it isn't a zombie)
+                continue
+          except OSError:
+            pass
+        else:
+          ready = []
+        if self.stopR in ready:
+          break
+        # Another daemon process can be found (the start command one exits first)
+        if self.setPid(self.find(), pid) is None:
+          logger.debug('Daemon process %d has exited' % pid)
+          self.handler(False)
+      with self.lock:
+        self.close()
+
+    def exit(self):
+      with self.lock:
+        self.enabled = False
+        if self.thread is None:         # Pipe is closed here when the thread was not started
+          self.close()
+        elif self.stopW is not None:
+          write(self.stopW, b'x')
 
   class __DConfig(Config):                 # Redefined class for daemon config
 
@@ -384,33 +772,25 @@ class YDDaemon(object):         # Yandex.Disk daemon interface
         if exDirs is not None and not isinstance(exDirs, list):
           # Additional parsing required when quoted value like "dir,dir,dir" is specified.
           # When the value specified without quotes it will be already list value [dir, dir, dir].
-          self['exclude-dirs'] = self.getValue(exDirs)
+          self['exclude-dirs'] = self.getValue(exDirs) or None
         return True
       else:
         return False
 
   #################### Private methods ####################
-  def __init__(self, cfgFile, ID):         # Check that daemon installed and configured and initialize object
+  def __init__(self, cfgFile, ID, background=False):  # Check that daemon installed and initialize object
     '''
-    cfgFile  - full path to config file
-    ID       - identity string '#<n> ' in multi-instance environment or
-               '' in single instance environment'''
+    cfgFile    - full path to config file
+    ID         - identity string '#<n> ' in multi-instance environment or
+                 '' in single instance environment
+    background - load config and start daemon in separate thread'''
     self.ID = ID                                      # Remember daemon identity
+    self.ready = False                                # Config is not loaded yet
     self.__YDC = which('yandex-disk')
     if self.__YDC is None:
       sysExit(_('Yandex.Disk utility is not installed.\n ' +
             'Visit www.yandex.ru, download and install Yandex.Disk daemon.'))
-    # Try to read Yandex.Disk configuration file and make sure that it is correctly configured
     self.config = self.__DConfig(cfgFile, load=False)
-    while not (self.config.load() and
-               pathExists(expanduser(self.config.get('dir', ''))) and
-               pathExists(expanduser(self.config.get('auth', '')))):
-      if self.error(cfgFile) != 0:
-        if ID != '':
-          self.config['dir'] = ''
-          break   # Exit from loop in multi-instance configuration
-        else:
-          sysExit('Daemon is not configured')
     self.tmpDir = getenv("TMPDIR")
     if self.tmpDir is None:
         self.tmpDir = '/tmp'
@@ -420,61 +800,162 @@ class YDDaemon(object):         # Yandex.Disk daemon interface
                 'error':'', 'path':'', 'lastitems': [], 'lastchg': True}
     # Declare event handler staff for callback from watcher and timer
     self.__tCnt = 0                          # Timer event counter 
-    self.__lock = Lock()                     # event handler lock 
+    self.__lock = Lock()                     # Status snapshot and refresh state lock
+    self.__cmds = CmdQueue()                 # Queue of daemon commands
+    self.__inFlight = False                  # True when status refresh is in progress
+    self.__rerun = False                     # True when watcher event came during the refresh
+    self.__wakeup = Condition(self.__lock)   # Wakes up the events worker
+    self.__request = None                    # Event for the worker: None - no event, True - watcher
+    self.__worker = None                     # Events worker thread (it is started on first event)
     def eventHandler(watch):
       '''
-      Handles watcher (when watch=False) and and timer (when watch=True) events.
+      Handles watcher (when watch=True) and and timer (when watch=False) events.
       After receiving and parsing the daemon output it raises outside change event if daemon changes
       at least one of its status values.
+      Events that come while the refresh is in progress join it instead of making one more status
+      request. Only watcher event requests one more refresh after the current one as the daemon can
+      change its status after the current status request has been made.
       '''
-      # Enter to critical section through acquiring of the lock as it can be called from two different threads
-      self.__lock.acquire()
-      # Parse fresh daemon output. Parsing returns true when something changed
-      if self.__parseOutput(self.__getOutput()):
-        logger.debug(self.ID + 'Event raised by' + (' Watcher' if watch else ' Timer'))
-        self.change(self.__v)                # Call the callback of update event handler 
-      # --- Handle timer delays ---
-      self.__timer.cancel()                  # Cancel timer if it still active
-      if watch or self.__v['status'] == 'busy':
-        delay = 2                            # Initial delay
-        self.__tCnt = 0                      # Reset counter 
-      else:                                  # It called by timer
-        delay = 2 + self.__tCnt              # Increase interval up to 10 sec (2 + 8)
-        self.__tCnt += 1                     # Increase counter to increase delay next activation.
-      if self.__tCnt < 9:                    # Don't start timer after 10 seconds delay
-        self.__timer = thTimer(delay, eventHandler, (False,))
-        self.__timer.start()
-      # Leave the critical section
-      self.__lock.release()
-    
-    # Initialize watcher staff
-    self.__watcher = self.__Watcher(pathJoin(expanduser(self.config['dir']), '.sync/cli.log'), eventHandler, (True,))
-    # Initialize timer staff
+      # The lock guards only the refresh state and the swap of status snapshot
+      with self.__lock:
+        if self.__inFlight:                  # Join the refresh that is already in progress
+          self.__rerun = self.__rerun or watch
+          return
+        self.__inFlight = True
+      while True:
+        if not watch and self.__tracker.dead():
+          out = ''                           # Daemon is not running: status request isn't required
+        else:
+          # Request the daemon output via commands queue (waiting status request is reused)
+          out = self.__cmds.submit('status', self.__getOutput)
+          try:
+            out = out.result() if out is not None else None
+          except CancelledError:
+            out = None
+          if out is None:                    # Queue was closed on exit
+            with self.__lock:
+              self.__inFlight = False
+            return
+          self.__tracker.verify(out != '')
+        # Parse fresh daemon output into the new status snapshot
+        vals = self.__parseOutput(out)
+        with self.__lock:
+          self.__v = vals                    # Swap the status snapshot
+        if vals['statchg'] or vals['szchg'] or vals['lastchg']:
+          logger.debug(self.ID + 'Event raised by' + (' Watcher' if watch else ' Timer'))
+          self.change(vals)                  # Call the callback of update event handler 
+        with self.__lock:
+          # --- Handle timer delays ---
+          self.__timer.cancel()              # Cancel timer if it still active
+          if watch or vals['status'] == 'busy':
+            delay = 2                        # Initial delay
+            self.__tCnt = 0                  # Reset counter 
+          else:                              # It called by timer
+            delay = 2 + self.__tCnt          # Increase interval up to 10 sec (2 + 8)
+            self.__tCnt += 1                 # Increase counter to increase delay next activation.
+          # Don't start timer after 10 seconds delay and when the daemon start is tracked
+          if self.__tCnt < 9 and not self.__cmds.closed and not self.__tracker.dead():
+            self.__timer = thTimer(delay, eventHandler, (False,))
+            self.__timer.start()
+          if not self.__rerun:               # Leave the refresh
+            self.__inFlight = False
+            return
+          self.__rerun = False               # Repeat the refresh for watcher event
+          watch = True
+
+    def eventWorker():
+      '''
+      Passes the events of tracker and refresh requests to eventHandler one by one. Events that
+      come while the handler works are joined into one (watcher event covers the timer one).
+      '''
+      while True:
+        with self.__wakeup:
+          while self.__request is None and not self.__cmds.closed:
+            self.__wakeup.wait()
+          if self.__cmds.closed:
+            return
+          watch, self.__request = self.__request, None
+        eventHandler(watch)
+
+    def requestEvent(watch):
+      with self.__wakeup:
+        self.__request = bool(self.__request) or watch
+        if self.__worker is None:
+          self.__worker = Thread(target=eventWorker, daemon=True)
+          self.__worker.start()
+        self.__wakeup.notify()
+
+    self.__event = requestEvent
+    def trackHandler(started):
+      if started:
+        self.__watcher.start()               # Daemon could be started outside of indicator
+      requestEvent(started)                  # Status of exited daemon isn't requested
+    # Daemon process tracker (it is started when config is loaded)
+    self.__tracker = self.__Tracker(trackHandler)
+    # Status requests statistics
+    self.stats = {'calls': 0, 'failures': 0, 'timeouts': 0, 'seconds': 0.0}
+    # Initialize watcher staff (path is set when config is loaded)
+    self.__watcher = self.__Watcher('', eventHandler, (True,))
+    # Initialize timer staff (it is started when config is loaded)
     self.__timer = thTimer(0.3, eventHandler, (False,))
-    self.__timer.start()
-
-    # Start daemon if it is required in configuration
-    if self.config.get('startonstartofindicator', True):
-      self.start()                       
+    if background:
+      Thread(target=self.__setup, args=(cfgFile, True), daemon=True).start()
     else:
-      self.__watcher.start()             # try to activate file watcher
+      self.__setup(cfgFile, False)
+
+  def __setup(self, cfgFile, background):  # Load and check daemon config, start daemon
+    # Try to read Yandex.Disk configuration file and make sure that it is correctly configured
+    configured = True
+    while not (self.config.load() and
+               pathExists(expanduser(self.config.get('dir', ''))) and
+               pathExists(expanduser(self.config.get('auth', '')))):
+      if self.error(cfgFile) != 0:
+        if self.ID == '' and not background:
+          sysExit('Daemon is not configured')
+        self.config['dir'] = ''
+        configured = False
+        break   # Exit from loop: daemon is shown as not configured
+    if configured or self.ID != '':
+      self.__watcher.path = pathJoin(expanduser(self.config['dir']), '.sync/cli.log')
+      if not self.__cmds.closed:           # Exit could be requested during initialization
+        self.__tracker.start(cfgFile)
+        self.__timer.start()
+        # Start daemon if it is required in configuration
+        if self.config.get('startonstartofindicator', True):
+          self.start()
+        else:
+          self.__watcher.start()           # try to activate file watcher
+    self.ready = True
+    self.loaded(configured)
 
   def __getOutput(self, userLang=False):   # Get result of 'yandex-disk status'
     cmd = [self.__YDC, '-c', self.config.fileName, 'status']
     if not userLang:      # Change locale settings when it required
       cmd = ['env', '-i', "TMPDIR=%s"%self.tmpDir] + cmd
     #logger.debug('cmd = %s' % str(cmd))
+    start = monotonic()
+    timeout = failure = False
     try:
-      output = check_output(cmd, universal_newlines=True)
+      output = self.__cmds.run(cmd)
+    except TimeoutExpired:
+      output = ''         # daemon is hung
+      timeout = failure = True
     except:
       output = ''         # daemon is not running or bad
+      failure = True
       logger.debug('Status output = %s' % output)
+    with self.__lock:     # Requests are made from several threads of commands queue
+      self.stats['timeouts'] += timeout
+      self.stats['failures'] += failure
+      self.stats['calls'] += 1
+      self.stats['seconds'] += monotonic() - start
     return output
 
   def __parseOutput(self, out):            # Parse the daemon output
     '''
     It parses the daemon output and check that something changed from last daemon status.
-    The self.__v dictionary is updated with new daemon statuses. It returns True is something changed
+    It returns the new status values dictionary (self.__v is not changed). The 'statchg', 'szchg'
+    and 'lastchg' values of the result show what has been changed.
     Daemon status is converted form daemon raw statuses into internal representation.
     Internal status can be on of the following: 'busy', 'idle', 'paused', 'none', 'no_net', 'error'.
     Conversion is done by following rules:
@@ -484,9 +965,7 @@ class YDDaemon(object):         # Yandex.Disk daemon interface
      - 'no internet access' converted to 'no_net'
      - 'error' covers all other errors, except 'no internet access'
     '''
-    self.__v['statchg'] = False
-    self.__v['szchg'] = False
-    self.__v['lastchg'] = False
+    v = dict(self.__v, statchg=False, szchg=False, lastchg=False)
     # Split output on two parts: list of named values and file list
     output = out.split('Last synchronized items:')
     if len(output) == 2:
@@ -502,14 +981,14 @@ class YDDaemon(object):         # Yandex.Disk daemon interface
                       ('Trash size', 'trash'), ('Error', 'error'), ('Path', 'path')):
       val = res.get(srch, '')
       if key == 'status':                     # Convert status to internal representation
-        # logger.debug('Raw status: \'%s\', previous status: %s'%(val, self.__v['status']))
+        # logger.debug('Raw status: \'%s\', previous status: %s'%(val, v['status']))
         # Store previous status
-        self.__v['laststatus'] = self.__v['status']
+        v['laststatus'] = v['status']
         # Convert daemon raw status to internal representation
         val = ('none' if val == '' else
                # Ignore index status
-               'busy' if val == 'index' and self.__v['laststatus'] == "unknown" else
-               self.__v['laststatus'] if val == 'index' and self.__v['laststatus'] != "unknown" else
+               'busy' if val == 'index' and v['laststatus'] == "unknown" else
+               v['laststatus'] if val == 'index' and v['laststatus'] != "unknown" else
                # Rename long error status
                'no_net' if val == 'no internet access' else
                # pass 'busy', 'idle' and 'paused' statuses 'as is'
@@ -519,94 +998,1222 @@ class YDDaemon(object):         # Yandex.Disk daemon interface
       elif key != 'progress' and val == '':   # 'progress' can be '' the rest - can't
         val = '...'                           # Make default filling for empty values
       # Check value change and store changed
-      if self.__v[key] != val:                # Check change of value
-        self.__v[key] = val                   # Store new value
+      if v[key] != val:                       # Check change of value
+        v[key] = val                          # Store new value
         if key == 'status':
-          self.__v['statchg'] = True          # Remember that status changed
+          v['statchg'] = True                 # Remember that status changed
         elif key == 'progress':
-          self.__v['statchg'] = True          # Remember that progress changed
+          v['statchg'] = True                 # Remember that progress changed
         else:
-          self.__v['szchg'] = True            # Remember that something changed in sizes values
+          v['szchg'] = True                   # Remember that something changed in sizes values
     # Parse last synchronized items
     buf = reFindall(r".*: '(.*)'\n", files)
     # Check if file list has been changed
-    if self.__v['lastitems'] != buf:
-      self.__v['lastitems'] = buf             # Store the new file list
-      self.__v['lastchg'] = True              # Remember that it is changed
-    # return True when something changed, if nothing changed - return False
-    return self.__v['statchg'] or self.__v['szchg'] or self.__v['lastchg']
+    if v['lastitems'] != buf:
+      v['lastitems'] = buf                    # Store the new file list
+      v['lastchg'] = True                     # Remember that it is changed
+    return v
+
+  def __running(self):                     # Check that daemon is running
+    if self.__tracker.trusted:
+      return self.__tracker.alive()        # It doesn't require the status request
+    return self.__getOutput() != ''
 
   #################### Interface methods ####################
+  def snapshot(self):                      # Current status values
+    with self.__lock:
+      return self.__v
+
+  def callStats(self):                     # Copy of status requests statistics
+    with self.__lock:
+      return dict(self.stats)
+
+  def refresh(self):                       # Request the status refresh in events worker thread
+    if self.ready and not self.__cmds.closed:
+      self.__event(True)
+
   def output(self, callBack):              # Receive daemon output in separate thread and pass it back through the callback
-    Thread(target=lambda:callBack(self.__getOutput(True))).start()
+    fut = self.__cmds.submit('output', self.__getOutput, True)
+    if fut is not None:
+      fut.add_done_callback(lambda f: None if f.cancelled() else callBack(f.result()))
 
-  def start(self, wait=False):             # Execute 'yandex-disk start' in separate thread
+  def start(self, wait=False):             # Execute 'yandex-disk start' via commands queue
     '''
-    Execute 'yandex-disk start' in separate thread
+    Execute 'yandex-disk start' via commands queue (repeated requests are joined while the first
+    one is waiting for execution).
     Additionally it starts watcher in case of success start
     '''
     def do_start():
-      if self.__getOutput() != "":
+      if self.__running():
         logger.info('Daemon is already started')
         self.__watcher.start()    # Activate file watcher
         return
       try:                        # Try to start
-        msg = check_output([self.__YDC, '-c', self.config.fileName, 'start'], universal_newlines=True)
+        msg = self.__cmds.run([self.__YDC, '-c', self.config.fileName, 'start'], timeout=30)
         logger.info('Daemon started, message: %s' % msg)
-      except CalledProcessError as e:
+      except (CalledProcessError, TimeoutExpired) as e:
         logger.error('Daemon start failed:%s' % e.output)
         return
       self.__watcher.start()      # Activate file watcher
+      self.refresh()
     if wait:
       do_start()
     else:
-      Thread(target=do_start).start()
+      self.__cmds.submit('start', do_start)
 
-  def stop(self, wait=False):              # Execute 'yandex-disk stop' in separate thread
+  def stop(self, wait=False):              # Execute 'yandex-disk stop' via commands queue
     def do_stop():
-      if self.__getOutput() == "":
+      if not self.__running():
         logger.info('Daemon is not started')
         return
       try:
-        msg = check_output([self.__YDC, '-c', self.config.fileName, 'stop'], universal_newlines=True)
+        msg = self.__cmds.run([self.__YDC, '-c', self.config.fileName, 'stop'], timeout=30)
         logger.info('Daemon stopped, message: %s' % msg)
       except:
         logger.info('Daemon stop failed')
+      self.refresh()
     if wait:
       do_stop()
     else:
-      Thread(target=do_stop).start()
+      self.__cmds.submit('stop', do_stop)
 
   def exit(self):                          # Handle daemon/indicator closing
     logger.debug("Indicator %sexit started: " % self.ID)
     self.__watcher.stop()
+    self.__tracker.exit()
     self.__timer.cancel()  # stop event timer if it is running
+    self.__cmds.cancel()   # drop waiting commands and kill hung ones
+    with self.__wakeup:
+      self.__wakeup.notify()  # finish events worker
     # Stop yandex-disk daemon if it is required by its configuration
     if self.config.get('stoponexitfromindicator', False):
       self.stop(wait=True)
       logger.info('Demon %sstopped' % self.ID)
     logger.debug('Indicator %sexited' % self.ID)
 
+#################### Auto-pause governor ####################
+class Governor(object):         # System load and local disk space aware auto-pause of daemons
+  '''
+  It periodically samples the system load average (per CPU), the I/O pressure (avg10 from
+  /proc/pressure/io when it is available) and the free space of file system of each daemon folder.
+  When any value goes over its threshold the running daemon is stopped and its governed(reason)
+  method is called. The daemon is started again when all values go back under the thresholds
+  with hysteresis: load and pressure have to be lower than 'resume' part of threshold, free space
+  have to be greater than threshold divided by 'resume' part.
+  Only the daemons that were stopped by governor are started by it.
+  Settings (values of app config, see defaults in __init__):
+    governorinterval - sampling interval (sec)
+    maxload          - maximal 1-minute load average per CPU
+    maxiopressure    - maximal share of time (%) when some tasks wait for I/O
+    minfreespace     - minimal free space (MB) in the file system of daemon folder
+    governorresume   - hysteresis: the part of threshold to resume daemons
+  '''
+  def __init__(self, daemons, settings):
+    self.daemons = daemons
+    self.interval = float(settings.get('governorinterval', 15))
+    self.maxLoad = float(settings.get('maxload', 1.5))
+    self.maxIO = float(settings.get('maxiopressure', 40))
+    self.minFree = float(settings.get('minfreespace', 1024))
+    self.resume = float(settings.get('governorresume', 0.75))
+    self.cpus = cpu_count() or 1
+    self.paused = {}                    # daemon -> reason of pause
+    self.timer = None
+    self.active = False
+
+  def start(self):
+    self.active = True
+    self.timer = thTimer(self.interval, self.check)
+    self.timer.start()
+
+  def stop(self):
+    self.active = False
+    if self.timer is not None:
+      self.timer.cancel()
+
+  def load(self):                       # 1-minute load average per CPU
+    try:
+      with open('/proc/loadavg') as f:
+        return float(f.read().split()[0]) / self.cpus
+    except (OSError, ValueError, IndexError):
+      return None
+
+  def ioPressure(self):                 # I/O pressure (%) for last 10 seconds
+    try:
+      with open('/proc/pressure/io') as f:
+        return float(reFindall(r'some avg10=([\d.]+)', f.read())[0])
+    except (OSError, ValueError, IndexError):
+      return None                       # Kernel without PSI support
+
+  def freeSpace(self, path):            # Free space (MB) of file system of path
+    try:
+      st = statvfs(path)
+      return st.f_bavail * st.f_frsize / 1048576
+    except OSError:
+      return None
+
+  def reasons(self, daemon, load, io, resume=False):
+    ''' Returns the list of reasons to pause the daemon. When resume is True the thresholds
+        with hysteresis are used. '''
+    k = self.resume if resume else 1
+    res = []
+    if load is not None and load > self.maxLoad * k:
+      res.append(_('load %.2f > %.2f') % (load, self.maxLoad * k))
+    if io is not None and io > self.maxIO * k:
+      res.append(_('I/O pressure %.0f%% > %.0f%%') % (io, self.maxIO * k))
+    free = self.freeSpace(expanduser(daemon.config.get('dir', '')))
+    if free is not None and free < self.minFree / k:
+      res.append(_('free space %.0f MB < %.0f MB') % (free, self.minFree / k))
+    return res
+
+  def check(self):                      # Sample the system state and pause/resume daemons
+    load, io = self.load(), self.ioPressure()
+    for d in self.daemons:
+      status = d.snapshot()['status']
+      if d in self.paused:
+        if status not in ('none', 'unknown'):   # Daemon was started by user: forget it
+          del self.paused[d]
+          d.governed('')
+        elif not self.reasons(d, load, io, resume=True):
+          del self.paused[d]
+          logger.info('%sGovernor resumes daemon' % d.ID)
+          d.start()
+          d.governed('')
+      elif status not in ('none', 'unknown') and d.config.get('dir', ''):
+        res = self.reasons(d, load, io)
+        if res:
+          self.paused[d] = ', '.join(res)
+          logger.info('%sGovernor pauses daemon: %s' % (d.ID, self.paused[d]))
+          d.stop()
+          d.governed(self.paused[d])
+    if self.active:
+      self.timer = thTimer(self.interval, self.check)
+      self.timer.start()
+
+#################### D-Bus service ####################
+class DBusService(object):      # Session bus object per daemon with its status
+  '''
+  It owns the DBUSNAME name on the session bus and exports one object per daemon:
+    /com/github/slytomcat/YandexDiskIndicator/Daemon<n> (n is the daemon index in daemons list)
+  Properties (read only) reflect the daemon status values (see YDDaemon.change), methods Start,
+  Stop and Refresh call the appropriate daemon methods. The standard PropertiesChanged signal is
+  emitted with only changed properties when update() receives the changed values.
+  The service is activated by 'dbus' key of configuration (it is off by default). It is tested with
+  the private bus by bench/dbusservice.py.
+  '''
+  NAME = 'com.github.slytomcat.YandexDiskIndicator'
+  IFACE = NAME + '.Daemon'
+  PATH = '/com/github/slytomcat/YandexDiskIndicator/Daemon%d'
+  PROPS = (('ID', 's'), ('Dir', 's'), ('Status', 's'), ('Progress', 's'), ('Total', 's'),
+           ('Used', 's'), ('Free', 's'), ('Trash', 's'), ('LastItems', 'as'), ('Error', 's'),
+           ('Path', 's'))
+  XML = ('<node><interface name="%s"><method name="Start"/><method name="Stop"/>' +
+         '<method name="Refresh"/>%s</interface></node>') % (
+         IFACE, ''.join('<property name="%s" type="%s" access="read"/>' % p for p in PROPS))
+
+  def __init__(self, daemons):
+    self.daemons = daemons
+    self.values = [None] * len(daemons)  # Exported values of each daemon
+    self.conn = None
+    self.owner = Gio.bus_own_name(Gio.BusType.SESSION, self.NAME, Gio.BusNameOwnerFlags.NONE,
+                                  self.onBus, None, self.onLost)
+
+  def onBus(self, conn, name):          # Register objects when bus connection is available
+    info = Gio.DBusNodeInfo.new_for_xml(self.XML).interfaces[0]
+    for n in range(len(self.daemons)):
+      # Properties requests are also passed to onCall as get_property handler is not specified
+      conn.register_object(self.PATH % n, info, self.onCall, None, None)
+    self.conn = conn
+    for d in self.daemons:
+      self.update(d, d.snapshot())
+    logger.info('D-Bus service registered: %s' % self.NAME)
+
+  def onLost(self, conn, name):
+    logger.warning('D-Bus name %s is not available' % name)
+
+  def props(self, daemon, vals):        # Make exported values from daemon status values
+    return {'ID': daemon.ID.strip(), 'Dir': daemon.config.get('dir', ''),
+            'Status': vals['status'], 'Progress': vals['progress'], 'Total': vals['total'],
+            'Used': vals['used'], 'Free': vals['free'], 'Trash': vals['trash'],
+            'LastItems': list(vals['lastitems']), 'Error': vals['error'], 'Path': vals['path']}
+
+  def variant(self, name, value):
+    return Variant(dict(self.PROPS)[name], value)
+
+  def update(self, daemon, vals):       # Store new values and signal about changed ones
+    n = self.daemons.index(daemon)
+    new = self.props(daemon, vals)
+    old, self.values[n] = self.values[n], new
+    if self.conn is None or old is None:
+      return
+    changed = dict((k, self.variant(k, v)) for k, v in new.items() if old[k] != v)
+    if changed:
+      self.conn.emit_signal(None, self.PATH % n, 'org.freedesktop.DBus.Properties',
+                            'PropertiesChanged', Variant('(sa{sv}as)', (self.IFACE, changed, [])))
+
+  def onCall(self, conn, sender, path, iface, method, params, invocation):
+    n = int(path[len(self.PATH % 0) - 1:])
+    if iface == 'org.freedesktop.DBus.Properties':
+      vals = self.values[n]
+      if method == 'Get' and params[1] in vals:
+        invocation.return_value(Variant('(v)', (self.variant(params[1], vals[params[1]]),)))
+      elif method == 'GetAll':
+        invocation.return_value(Variant('(a{sv})', (dict((k, self.variant(k, v))
+                                                         for k, v in vals.items()),)))
+      else:
+        invocation.return_dbus_error('org.freedesktop.DBus.Error.InvalidArgs',
+                                     'Property is not available or read only')
+      return
+    daemon = self.daemons[n]
+    if method == 'Start':
+      daemon.start()
+    elif method == 'Stop':
+      daemon.stop()
+    elif method == 'Refresh':
+      daemon.refresh()
+    invocation.return_value(None)
+
+  def exit(self):
+    Gio.bus_unown_name(self.owner)
+
+#################### Prometheus metrics export ####################
+def sizeToBytes(size):          # Convert daemon size value (like '2.5 GB') to bytes or None
+  s = reFindall(r'^([\d.]+)\s*([KMGT]?)B', size)
+  if not s:
+    return None
+  return int(float(s[0][0]) * 1024 ** ' KMGT'.index(s[0][1] or ' '))
+
+class PromExporter(object):     # Metrics file writer for node_exporter textfile collector
+  '''
+  It collects metrics from status change events of daemons (update() is called from change
+  handler) and writes them into the .prom file. The file is written atomically (via temporary
+  file and rename) not often than once per interval seconds: extra status requests are not made.
+  '''
+  STATUSES = ('busy', 'idle', 'paused', 'none', 'no_net', 'error', 'unknown')
+
+  def __init__(self, daemons, fileName, interval=15):
+    self.daemons = daemons
+    self.fileName = expanduser(fileName)
+    self.interval = interval
+    self.lock = Lock()
+    self.vals = [d.snapshot() for d in daemons]  # Last status values of each daemon
+    self.transitions = [0] * len(daemons)   # Number of status transitions
+    self.errors = [0] * len(daemons)        # Number of transitions into error status
+    self.timer = None
+    self.write()
+
+  def update(self, daemon, vals):
+    n = self.daemons.index(daemon)
+    with self.lock:
+      if self.vals[n]['status'] not in (vals['status'], 'unknown'):
+        self.transitions[n] += 1
+        if vals['status'] == 'error':
+          self.errors[n] += 1
+      self.vals[n] = vals
+      if self.timer is None:                # Schedule writing when it is not scheduled yet
+        self.timer = thTimer(self.interval, self.write)
+        self.timer.start()
+
+  def metrics(self):                        # Make the text of metrics file
+    def label(v):
+      return v.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+    out = {}
+    def add(name, mtype, hlp, labels, value):
+      m = out.setdefault(name, ['# HELP %s %s\n# TYPE %s %s\n' % (name, hlp, name, mtype)])
+      m.append('%s{%s} %s\n' % (name, ','.join('%s="%s"' % (k, label(v)) for k, v in labels),
+                                 value))
+    for n, d in enumerate(self.daemons):
+      lbl = [('daemon', str(n)), ('dir', d.config.get('dir', ''))]
+      vals = self.vals[n]
+      stats = d.callStats()
+      for st in self.STATUSES:
+        add('yd_daemon_status', 'gauge', 'Current daemon status (1 for the current one)',
+            lbl + [('status', st)], 1 if vals['status'] == st else 0)
+      for key in ('used', 'free', 'total', 'trash'):
+        size = sizeToBytes(vals[key])
+        if size is not None:
+          add('yd_daemon_%s_bytes' % key, 'gauge', 'Disk space: %s' % key, lbl, size)
+      progress = reFindall(r'\((\d+) ?%\)', vals['progress'])
+      add('yd_daemon_sync_progress', 'gauge', 'Synchronization progress (0..1)', lbl,
+          int(progress[0]) / 100 if progress else 0)
+      add('yd_daemon_transitions_total', 'counter', 'Number of daemon status transitions', lbl,
+          self.transitions[n])
+      add('yd_daemon_errors_total', 'counter', 'Number of transitions into error status', lbl,
+          self.errors[n])
+      add('yd_status_calls_total', 'counter', 'Number of status requests', lbl,
+          stats['calls'])
+      add('yd_status_call_failures_total', 'counter', 'Number of failed status requests', lbl,
+          stats['failures'])
+      add('yd_status_call_timeouts_total', 'counter', 'Number of timed out status requests', lbl,
+          stats['timeouts'])
+      add('yd_status_call_seconds_total', 'counter', 'Total duration of status requests', lbl,
+          '%.3f' % stats['seconds'])
+    return ''.join(''.join(m) for m in out.values())
+
+  def write(self):
+    with self.lock:
+      self.timer = None
+      text = self.metrics()
+    tmp = '%s.%d.tmp' % (self.fileName, getpid())
+    try:
+      with open(tmp, 'wt') as f:
+        f.write(text)
+      rename(tmp, self.fileName)            # Collector never reads the partially written file
+    except OSError as e:
+      logger.error('Metrics file write error: %s' % str(e))
+
+  def exit(self):
+    with self.lock:
+      if self.timer is not None:
+        self.timer.cancel()
+    self.write()
+
+#################### Status transition hooks ####################
+class HookRunner(object):       # User commands for daemon status transitions
+  '''
+  Hooks are read from hooks file (see Config) with lines in form:
+    <from>-<to> = command[, command ...]          - hook for all daemons
+    "<n>:<from>-<to>" = command[, command ...]    - hook for n-th daemon (index in daemons list)
+  where <from> and <to> are the internal statuses (busy, idle, paused, none, no_net, error) or
+  'any', for example: busy-idle, any-error, none-idle.
+  Commas separate commands, so the command that contains comma (like shell brace expansion
+  {a,b}) have to be quoted: "cp file{,.bak}". Values are not converted into booleans (yes/no
+  commands are kept as strings).
+  Commands are executed by 'sh -c' in worker threads (not more than 'workers' at once). Event
+  data are passed via environment variables (YD_DAEMON, YD_DIR, YD_STATUS, YD_LASTSTATUS,
+  YD_PROGRESS, YD_USED, YD_FREE, YD_TOTAL, YD_TRASH, YD_ERROR, YD_PATH) and as JSON via stdin.
+  Commands that wait for execution are kept in the bounded queue: the oldest one is dropped when
+  the queue is full. The command is killed when it runs longer than timeout. event() never waits
+  for commands, so the hooks can't delay status polling or UI updates.
+  '''
+  def __init__(self, daemons, fileName, workers=2, queueSize=32, timeout=60):
+    self.daemons = daemons
+    self.timeout = timeout
+    self.hooks = {}                     # (daemon index or None, from, to) -> list of commands
+    cfg = Config(fileName, load=False)
+    cfg.load(bools=[[], []])            # Commands are raw strings
+    for key, cmds in cfg.items():
+      k = reFindall(r'^(?:(\d+):)?([a-z_]+)-([a-z_]+)$', key)
+      if not k:
+        logger.warning('Wrong hook key: %s' % key)
+        continue
+      n, frm, to = k[0]
+      self.hooks[(int(n) if n else None, frm, to)] = [c for c in CVal(cmds) if isinstance(c, str) and c]
+    self.queue = deque(maxlen=queueSize)
+    self.cond = Condition()
+    self.procs = set()
+    self.active = True
+    for i in range(workers):
+      Thread(target=self.worker, daemon=True).start()
+
+  def event(self, daemon, vals):        # Queue commands of hooks that match the status transition
+    if not vals['statchg'] or vals['status'] == vals['laststatus'] or vals['laststatus'] == 'unknown':
+      return
+    n = self.daemons.index(daemon)
+    cmds = [c for d in (n, None) for f in (vals['laststatus'], 'any') for t in (vals['status'], 'any')
+            for c in self.hooks.get((d, f, t), [])]
+    if not cmds:
+      return
+    env = dict(environ, YD_DAEMON=str(n), YD_DIR=daemon.config.get('dir', ''))
+    for key in ('status', 'laststatus', 'progress', 'used', 'free', 'total', 'trash', 'error', 'path'):
+      env['YD_' + key.upper()] = vals[key]
+    data = jsonDumps(dict(vals, daemon=n, dir=env['YD_DIR']))
+    with self.cond:
+      for c in cmds:
+        if len(self.queue) == self.queue.maxlen:
+          logger.warning('Hooks queue is full, the oldest command is dropped: %s' % self.queue[0][0])
+        self.queue.append((c, env, data))
+      self.cond.notify(len(cmds))
+
+  def worker(self):
+    while True:
+      with self.cond:
+        while self.active and not self.queue:
+          self.cond.wait()
+        if not self.active:
+          return
+        cmd, env, data = self.queue.popleft()
+      logger.info('Hook: %s' % cmd)
+      try:
+        proc = Popen(['sh', '-c', cmd], env=env, stdin=PIPE, universal_newlines=True)
+      except (OSError, ValueError, TypeError) as e:
+        logger.error('Hook start failed: %s' % str(e))
+        continue
+      with self.cond:
+        self.procs.add(proc)
+      try:
+        proc.communicate(data, timeout=self.timeout)
+        if proc.returncode:
+          logger.warning('Hook "%s" exited with code %d' % (cmd, proc.returncode))
+      except TimeoutExpired:
+        logger.warning('Hook timeout: %s' % cmd)
+        proc.kill()
+        proc.communicate()
+      except OSError:
+        pass                            # Hook doesn't read its stdin
+      with self.cond:
+        self.procs.discard(proc)
+
+  def exit(self):                       # Drop waiting commands and kill running ones
+    with self.cond:
+      self.active = False
+      self.queue.clear()
+      for proc in self.procs:
+        proc.kill()
+      self.cond.notify_all()
+
+#################### Last known status cache ####################
+class StatusCache(object):      # Last known status values of daemons persisted between runs
+  '''
+  It keeps the last status values of each daemon (status, sizes, last items, folder and the time
+  when they were received) by daemon config file path. The values are written into JSON file
+  atomically not often than once per interval seconds (update() is called from change handler)
+  and on exit. On start they are used to show the menu before the first status request is
+  completed: get() returns them marked as stale ('stale' value is True).
+  '''
+  FIELDS = ('status', 'total', 'used', 'free', 'trash', 'error', 'path', 'lastitems')
+  STATUSES = ('busy', 'idle', 'paused', 'none', 'no_net', 'error')
+
+  def __init__(self, fileName, interval=10):
+    self.fileName = fileName
+    self.interval = interval
+    self.lock = Lock()
+    self.timer = None
+    try:
+      with open(fileName) as f:
+        self.data = jsonLoads(f.read())
+      if not isinstance(self.data, dict):
+        raise ValueError('not an object')
+    except (OSError, ValueError) as e:
+      logger.debug('Status cache is not loaded: %s' % str(e))
+      self.data = {}
+
+  def get(self, cfgFile):               # Stale status values of daemon or None
+    v = self.data.get(cfgFile)
+    try:
+      if v['status'] not in self.STATUSES:
+        return None
+      vals = {k: v[k] for k in self.FIELDS}
+      vals['lastitems'] = [str(p) for p in vals['lastitems']]
+      return dict(vals, progress='', laststatus='unknown', statchg=True, szchg=True, lastchg=True,
+                  dir=str(v['dir']), time=float(v['time']), stale=True)
+    except (KeyError, TypeError, ValueError):
+      return None
+
+  def update(self, daemon, vals):
+    if vals['status'] not in self.STATUSES:
+      return
+    v = {k: vals[k] for k in self.FIELDS}
+    v.update(dir=daemon.config.get('dir', ''), time=time())
+    with self.lock:
+      self.data[daemon.config.fileName] = v
+      if self.timer is None:                # Schedule writing when it is not scheduled yet
+        self.timer = thTimer(self.interval, self.write)
+        self.timer.start()
+
+  def write(self):
+    with self.lock:
+      self.timer = None
+      text = jsonDumps(self.data, separators=(',', ':'))
+    tmp = '%s.%d.tmp' % (self.fileName, getpid())
+    try:
+      with open(tmp, 'wt') as f:
+        f.write(text)
+      rename(tmp, self.fileName)            # Partially written file is never read on start
+    except OSError as e:
+      logger.error('Status cache write error: %s' % str(e))
+
+  def exit(self):
+    with self.lock:
+      if self.timer is not None:
+        self.timer.cancel()
+    self.write()
+
+#################### Time in states statistics ####################
+def durationText(seconds):      # Convert duration to short text like '2h 05m', '3m 07s' or '12s'
+  seconds = int(seconds)
+  return ('%dh %02dm' % (seconds // 3600, seconds % 3600 // 60) if seconds >= 3600 else
+          '%dm %02ds' % (seconds // 60, seconds % 60) if seconds >= 60 else '%ds' % seconds)
+
+class StateStats(object):       # Time in states and transitions histograms of daemons
+  '''
+  It accounts the time that each daemon spends in each status, the number of entries into each
+  status (it shows the flapping) and two histograms with fixed buckets (see BUCKETS): lengths of
+  busy phases and times to recover from errors (from 'error'/'no_net' to 'idle', 'busy' or
+  'paused', the daemon stop cancels the recovery). update() is called from change handler.
+  Values are kept by daemon config file path and they are written into JSON file (via temporary
+  file and rename) not often than once per interval seconds and on exit. The time when the
+  indicator is not running is not counted.
+  '''
+  STATUSES = ('busy', 'idle', 'paused', 'none', 'no_net', 'error')
+  BUCKETS = (10, 60, 300, 1800, 10800)          # Upper bounds (sec), the last bucket is unbounded
+  LABELS = ('<10s', '<1m', '<5m', '<30m', '<3h', '>=3h')
+  FAILURES = ('error', 'no_net')
+
+  def __init__(self, fileName, interval=60):
+    self.fileName = fileName
+    self.interval = interval
+    self.lock = Lock()
+    self.timer = None
+    self.current = {}                   # Config path -> [status, start, busy start, failure start]
+    try:
+      with open(fileName) as f:
+        self.data = jsonLoads(f.read())
+      if not isinstance(self.data, dict):
+        raise ValueError('not an object')
+    except (OSError, ValueError) as e:
+      logger.debug('State statistics are not loaded: %s' % str(e))
+      self.data = {}
+
+  def entry(self, cfgFile):             # Statistics of daemon (broken or missing values are reset)
+    e = self.data.get(cfgFile)
+    if not isinstance(e, dict):
+      e = self.data[cfgFile] = {}
+    for key, default in (('seconds', {}), ('entries', {}), ('busy', [0] * len(self.LABELS)),
+                         ('recover', [0] * len(self.LABELS)), ('since', time()), ('dir', '')):
+      value = e.get(key)
+      if (not isinstance(value, (int, float)) if key == 'since' else
+          type(value) is not type(default) or (type(default) is list and len(value) != len(default))):
+        e[key] = default
+    return e
+
+  def bucket(self, seconds):
+    return next((n for n, b in enumerate(self.BUCKETS) if seconds < b), len(self.BUCKETS))
+
+  def account(self, now):               # Add time of current statuses
+    for cfgFile, cur in self.current.items():
+      seconds = self.data[cfgFile]['seconds']
+      seconds[cur[0]] = seconds.get(cur[0], 0) + now - cur[1]
+      cur[1] = now
+
+  def update(self, daemon, vals):
+    status = vals['status']
+    if status not in self.STATUSES:
+      return
+    cfgFile = daemon.config.fileName
+    now = time()
+    with self.lock:
+      e = self.entry(cfgFile)
+      e['dir'] = daemon.config.get('dir', '')
+      cur = self.current.get(cfgFile)
+      if cur is not None:
+        if cur[0] == status:            # Progress or sizes are changed
+          return
+        self.account(now)
+        if cur[0] == 'busy':
+          e['busy'][self.bucket(now - cur[2])] += 1
+      failed = cur[3] if cur is not None else None
+      if status in self.FAILURES:
+        failed = failed or now
+      elif failed is not None:
+        if status != 'none':            # Recovered
+          e['recover'][self.bucket(now - failed)] += 1
+        failed = None
+      e['entries'][status] = e['entries'].get(status, 0) + 1
+      self.current[cfgFile] = [status, now, now if status == 'busy' else None, failed]
+      if self.timer is None:            # Schedule writing when it is not scheduled yet
+        self.timer = thTimer(self.interval, self.write)
+        self.timer.start()
+
+  def get(self, cfgFile):               # Current statistics of daemon (copy) or None
+    with self.lock:
+      if cfgFile not in self.data:
+        return None
+      self.account(time())
+      return jsonLoads(jsonDumps(self.entry(cfgFile)))
+
+  def csv(self, f):                     # Write all statistics as CSV
+    with self.lock:
+      self.account(time())
+      out = csvWriter(f)
+      out.writerow(('config', 'dir', 'since', 'kind', 'key', 'value'))
+      for cfgFile in sorted(self.data):
+        e = self.entry(cfgFile)
+        since = datetime.fromtimestamp(e['since']).isoformat(timespec='seconds')
+        for kind in ('seconds', 'entries'):
+          for status in self.STATUSES:
+            out.writerow((cfgFile, e['dir'], since, kind, status,
+                          round(e[kind].get(status, 0), 1)))
+        for kind in ('busy', 'recover'):
+          for label, count in zip(self.LABELS, e[kind]):
+            out.writerow((cfgFile, e['dir'], since, kind, label, count))
+
+  def write(self):
+    with self.lock:
+      self.timer = None
+      self.account(time())
+      text = jsonDumps(self.data, separators=(',', ':'))
+    tmp = '%s.%d.tmp' % (self.fileName, getpid())
+    try:
+      with open(tmp, 'wt') as f:
+        f.write(text)
+      rename(tmp, self.fileName)
+    except OSError as e:
+      logger.error('State statistics write error: %s' % str(e))
+
+  def exit(self):
+    with self.lock:
+      if self.timer is not None:
+        self.timer.cancel()
+    self.write()
+
+def statsMain(args):            # Write time in states statistics as CSV and exit
+  stats = StateStats(pathJoin(configPath, 'stats.json'))
+  if args.statscsv == '-':
+    stats.csv(stdout)
+  else:
+    with open(expanduser(args.statscsv), 'wt', newline='') as f:
+      stats.csv(f)
+  return 0
+
+#################### Local changes monitor ####################
+class LocalMonitor(object):     # Recursive inotify watcher of daemon folder
+  '''
+  It watches the daemon folder recursively (except '.sync' and the folders from 'exclude-dirs' of
+  daemon config) with inotify and requests the daemon status refresh on local changes: the first
+  change after quiet period is reported at once, the changes that follow it are joined into one
+  refresh per 'delay' seconds. The refresh switches the daemon to the fast status polling.
+  Folders are watched after daemon initialization, changes of 'exclude-dirs' are applied when the
+  daemon config is saved (see reload). When the inotify watches limit is reached the rest of folders
+  are not watched. When inotify events are lost (queue overflow) the whole tree is scanned again to
+  watch the folders that were created meanwhile.
+  '''
+  MASK = 0x2 | 0x8 | 0x40 | 0x80 | 0x100 | 0x200  # MODIFY, CLOSE_WRITE, MOVED_FROM/TO, CREATE, DELETE
+  IN_ISDIR, IN_Q_OVERFLOW, IN_IGNORED = 0x40000000, 0x4000, 0x8000
+
+  def __init__(self, daemon, delay=2):
+    self.daemon = daemon
+    self.delay = delay
+    self.stopR, self.stopW = pipe()     # Commands to the watcher thread: b'x' - exit, b'r' - reload
+    self.thread = Thread(target=self.run, daemon=True)
+    self.thread.start()
+
+  def run(self):
+    while not self.daemon.ready:        # Wait for daemon config
+      if select([self.stopR], [], [], 0.5)[0] and read(self.stopR, 1) == b'x':
+        return
+    self.root = expanduser(self.daemon.config.get('dir', ''))
+    if not self.root or not pathExists(self.root):
+      return
+    self.excluded = self.excludedDirs()
+    self.libc = CDLL('libc.so.6', use_errno=True)
+    self.fd = self.libc.inotify_init1(0o2000000)   # IN_CLOEXEC
+    if self.fd < 0:
+      logger.error('%sLocal changes monitor: inotify is not available' % self.daemon.ID)
+      return
+    self.watches = {}                   # watch descriptor -> path
+    self.full = False                   # True when watches limit is reached
+    self.addTree(self.root)
+    logger.info('%sLocal changes monitor watches %d folders' % (self.daemon.ID, len(self.watches)))
+    try:
+      self.loop()
+    finally:
+      closeFile(self.fd)
+
+  def excludedDirs(self):               # Excluded folders (relative to daemon folder) from config
+    excluded = set(['.sync'])
+    for path in CVal(self.daemon.config.get('exclude-dirs', None)):
+      path = str(path)                  # Paths are relative to daemon folder or absolute
+      excluded.add(relativePath(path, self.root) if path.startswith('/') else path.strip('/'))
+    return excluded
+
+  def applyExcluded(self):              # Update watches according to changed 'exclude-dirs'
+    excluded = self.excludedDirs()
+    if excluded == self.excluded:
+      return
+    self.excluded = excluded
+    for wd, path in list(self.watches.items()):
+      if self.isExcluded(path):         # Folder is excluded now: stop watching it
+        self.libc.inotify_rm_watch(self.fd, wd)
+        del self.watches[wd]
+    self.rescan()                       # Watch the folders that are not excluded any more
+
+  def rescan(self):                     # Watch all folders of tree again (existing watches are kept)
+    self.full = False
+    self.addTree(self.root)
+    logger.info('%sLocal changes monitor watches %d folders' % (self.daemon.ID, len(self.watches)))
+
+  def isExcluded(self, path):           # Check that path or one of its parents is excluded
+    rel = relativePath(path, self.root)
+    parts = rel.split('/')
+    return any('/'.join(parts[:i]) in self.excluded for i in range(1, len(parts) + 1))
+
+  def addTree(self, top):               # Add watches for folder and all its sub-folders
+    for path, dirs, files in walk(top):
+      if self.full:
+        return
+      if self.isExcluded(path):
+        dirs[:] = []
+        continue
+      wd = self.libc.inotify_add_watch(self.fd, path.encode(), self.MASK)
+      if wd < 0:
+        if get_errno() == ENOSPC:
+          logger.warning('%sLocal changes monitor: inotify watches limit is reached' % self.daemon.ID)
+          self.full = True
+        continue
+      self.watches[wd] = path
+      dirs[:] = [d for d in dirs if not self.isExcluded(pathJoin(path, d))]
+
+  def events(self):                     # Read events, returns number of changes
+    try:
+      buf = read(self.fd, 65536)
+    except OSError:
+      return 0
+    pos, cnt, overflow = 0, 0, False
+    while pos < len(buf):
+      wd, mask, cookie, length = unpack_from('iIII', buf, pos)
+      name = buf[pos + 16: pos + 16 + length].rstrip(b'\0').decode(errors='replace')
+      pos += 16 + length
+      if mask & self.IN_IGNORED:        # Watch is removed (folder is deleted)
+        self.watches.pop(wd, None)
+        continue
+      cnt += 1
+      if mask & self.IN_Q_OVERFLOW:     # Events are lost: new folders can be not watched
+        overflow = True
+        continue
+      if mask & self.IN_ISDIR and mask & (0x80 | 0x100) and wd in self.watches and not self.full:
+        path = pathJoin(self.watches[wd], name)     # New sub-folder: watch it
+        if not self.isExcluded(path):
+          self.addTree(path)
+    if overflow:
+      logger.warning('%sLocal changes monitor: events are lost, folders are scanned again' %
+                     self.daemon.ID)
+      self.rescan()
+    return cnt
+
+  def loop(self):                       # Join changes and request the refresh
+    last, pending, changes = None, False, 0
+    while True:
+      timeout = None if not pending else max(0, last + self.delay - monotonic())
+      ready = select([self.fd, self.stopR], [], [], timeout)[0]
+      if self.stopR in ready:
+        if read(self.stopR, 1) != b'r':
+          return
+        self.applyExcluded()
+        continue
+      if self.fd in ready:
+        changes += self.events()
+        if not changes:
+          continue
+        if last is not None and monotonic() - last < self.delay:
+          pending = True                # Join with the next refresh
+          continue
+      elif not pending:
+        continue
+      logger.debug('%sLocal changes: %d' % (self.daemon.ID, changes))
+      self.daemon.refresh()
+      last, pending, changes = monotonic(), False, 0
+
+  def reload(self):                     # Apply changed 'exclude-dirs' (daemon config is saved)
+    write(self.stopW, b'r')
+
+  def exit(self):
+    write(self.stopW, b'x')
+
+def startLocalMonitors(config, daemons):  # Make LocalMonitor for each daemon when it is activated
+  if not config.get('localmonitor', False):
+    return []
+  return [LocalMonitor(d, float(config.get('localmonitordelay', 2))) for d in daemons]
+
+#################### Status wait service and client ####################
+class WaitServer(object):       # Unix socket that pushes daemons statuses to waiting clients
+  '''
+  The running indicator listens on the socket (see waitSocket) and sends to each connected client
+  the JSON line {"statuses": [<status of daemon 0>, <status of daemon 1>, ...]} at once and then
+  on each status change. Clients (see waitMain) don't request anything, they just read lines
+  until the awaited state is reached, so waiting clients don't cost anything between changes.
+  Client sockets are non-blocking: the client that doesn't read lines (its socket buffer is full)
+  is dropped, so sending never delays the status handling.
+  '''
+  def __init__(self, daemons, path):
+    self.daemons = daemons
+    self.path = path
+    self.clients = []
+    self.lock = Lock()
+    try:
+      remove(path)                      # Remove the socket left by killed instance
+    except OSError:
+      pass
+    self.sock = socket(AF_UNIX, SOCK_STREAM)
+    self.sock.bind(path)
+    self.sock.listen(16)
+    Thread(target=self.serve, daemon=True).start()
+
+  def line(self):                       # Statuses of all daemons as JSON line
+    return (jsonDumps({'statuses': [d.snapshot()['status'] for d in self.daemons]}) + '\n').encode()
+
+  def serve(self):
+    while True:
+      try:
+        conn = self.sock.accept()[0]
+      except OSError:
+        return                          # Socket is closed on exit
+      conn.setblocking(False)           # Stuck client is dropped instead of waiting for it
+      with self.lock:
+        if self.send(conn, self.line()):
+          self.clients.append(conn)
+
+  def send(self, conn, line):           # Send line without waiting (False when client is dropped)
+    try:
+      if conn.send(line) == len(line):
+        return True
+    except OSError:                     # Client has gone or its buffer is full (BlockingIOError)
+      pass
+    conn.close()
+    return False
+
+  def update(self, daemon, vals):       # Send statuses to clients when status is changed
+    if not vals['statchg'] or not self.clients:
+      return
+    line = self.line()
+    with self.lock:
+      self.clients = [conn for conn in self.clients if self.send(conn, line)]
+
+  def exit(self):
+    self.sock.close()
+    with self.lock:
+      for conn in self.clients:
+        conn.close()
+      self.clients = []
+    try:
+      remove(self.path)
+    except OSError:
+      pass
+
+def waitSocket():               # Path to status wait socket
+  return pathJoin(getenv('XDG_RUNTIME_DIR') or configPath, appHomeName + '.sock')
+
+def startWaitServer(daemons):   # Make WaitServer (None when socket can't be created)
+  try:
+    return WaitServer(daemons, waitSocket())
+  except OSError as e:
+    logger.error('Status wait socket can not be created: %s' % str(e))
+    return None
+
+def waitMain(args):             # Client mode: wait for the status of daemons in running indicator
+  '''
+  Waits until all selected daemons (--daemon, all by default) have one of awaited statuses
+  (--wait-idle or --wait-status). Exit codes: 0 - the state is reached, 1 - timeout,
+  2 - indicator is not running or it has exited, 3 - selected daemon is in 'error' status while
+  waiting for 'idle' (--wait-idle), 4 - wrong arguments: unknown status or wrong daemon number.
+  '''
+  wanted = set(['idle'] if args.waitidle else args.waitstatus.split(','))
+  unknown = wanted - set(('busy', 'idle', 'paused', 'none', 'no_net', 'error'))
+  if unknown:
+    stdout.write(_('Unknown status: %s\n') % ', '.join(sorted(unknown)))
+    return 4
+  if any(n < 0 for n in args.daemon or []):
+    stdout.write(_('Wrong daemon number\n'))
+    return 4
+  try:
+    sock = socket(AF_UNIX, SOCK_STREAM)
+    sock.connect(waitSocket())
+  except OSError:
+    stdout.write(_('Indicator is not running\n'))
+    return 2
+  deadline = monotonic() + args.timeout if args.timeout > 0 else None
+  stream = sock.makefile('rb')
+  while True:
+    sock.settimeout(None if deadline is None else max(0.001, deadline - monotonic()))
+    try:
+      line = stream.readline()
+    except OSError:                     # Timeout
+      stdout.write(_('Timeout\n'))
+      return 1
+    if not line:
+      stdout.write(_('Indicator has exited\n'))
+      return 2
+    statuses = jsonLoads(line.decode())['statuses']
+    selected = args.daemon or range(len(statuses))
+    if any(n >= len(statuses) for n in selected):
+      stdout.write(_('Wrong daemon number\n'))
+      return 4
+    current = [statuses[n] for n in selected]
+    if all(s in wanted for s in current):
+      stdout.write(' '.join(current) + '\n')
+      return 0
+    if args.waitidle and 'error' in current:
+      stdout.write(' '.join(current) + '\n')
+      return 3
+
+#################### On-demand profiling ####################
+class Profiler(object):         # Profiling session (SIGUSR1) and memory/threads snapshots (SIGUSR2)
+  '''
+  toggle() starts the profiling session or stops it and writes the report. Session type is set
+  by 'profiler' key of app config:
+    sample   - (default) all threads stacks are sampled every 'profileinterval' seconds. Report
+               has the top functions by samples and the collapsed stacks (for flamegraph.pl).
+    cprofile - cProfile of the main (GUI) thread, report is sorted by cumulative time.
+  snapshot() writes the stacks of all threads and the top allocations (tracemalloc is started by
+  the first snapshot, next ones also show the growth since the previous snapshot).
+  Reports are written into ~/.config/<appHomeName>/profiles/ with the time stamp in file name.
+  '''
+  def __init__(self, settings):
+    self.mode = settings.get('profiler', 'sample')
+    self.interval = float(settings.get('profileinterval', 0.01))
+    self.path = pathJoin(configPath, 'profiles')
+    self.session = None                 # Active cProfile object or sampler stop event
+    self.lastSnapshot = None            # Previous tracemalloc snapshot
+
+  def fileName(self, kind):
+    makeDirs(self.path)
+    return pathJoin(self.path, '%s-%s.txt' % (kind, datetime.now().strftime('%Y%m%d-%H%M%S')))
+
+  def toggle(self):                     # Start or stop profiling session
+    if self.session is None:
+      logger.info('Profiling (%s) started' % self.mode)
+      self.started = monotonic()
+      if self.mode == 'cprofile':
+        self.session = Profile()
+        self.session.enable()
+      else:
+        self.stacks = Counter()
+        self.samples = 0
+        self.session = Event()
+        self.sampler = Thread(target=self.sample, args=(self.session,), daemon=True)
+        self.sampler.start()
+    else:
+      duration = monotonic() - self.started
+      fileName = self.fileName('profile')
+      with open(fileName, 'wt') as f:
+        f.write('Profile (%s) of %s v.%s, duration: %.1f sec\n\n' % (self.mode, appName, appVer,
+                                                                     duration))
+        if self.mode == 'cprofile':
+          self.session.disable()
+          Stats(self.session, stream=f).sort_stats('cumulative').print_stats(50)
+        else:
+          self.session.set()
+          self.sampler.join()
+          self.report(f)
+      self.session = None
+      logger.info('Profile is written to %s' % fileName)
+    return True                         # Keep the signal handler
+
+  def sample(self, stopped):            # Sampler thread
+    me = get_ident()
+    while not stopped.wait(self.interval):
+      names = dict((t.ident, t.name) for t in threadsList())
+      for ident, frame in currentFrames().items():
+        if ident == me:
+          continue
+        stack = []
+        while frame is not None:
+          code = frame.f_code
+          stack.append('%s (%s:%d)' % (code.co_name, code.co_filename.rsplit('/', 1)[-1],
+                                       code.co_firstlineno))
+          frame = frame.f_back
+        stack.append(names.get(ident, str(ident)))
+        self.stacks[';'.join(reversed(stack))] += 1
+      self.samples += 1
+
+  def report(self, f):                  # Write top functions and collapsed stacks
+    own, total = Counter(), Counter()
+    for stack, cnt in self.stacks.items():
+      funcs = stack.split(';')[1:]      # First item is the thread name
+      if funcs:
+        own[funcs[-1]] += cnt
+        for func in set(funcs):
+          total[func] += cnt
+    stacks = max(sum(self.stacks.values()), 1)
+    f.write('Samples: %d (interval %g sec), thread stacks: %d\n' % (self.samples, self.interval,
+                                                                  stacks))
+    for title, cnt in (('Top functions by own samples', own),
+                       ('Top functions by total samples', total)):
+      f.write('\n%s (%% of thread stacks):\n' % title)
+      for func, n in cnt.most_common(30):
+        f.write('%8d %5.1f%%  %s\n' % (n, 100 * n / stacks, func))
+    f.write('\nCollapsed stacks:\n')
+    for stack, n in self.stacks.most_common():
+      f.write('%s %d\n' % (stack, n))
+
+  def snapshot(self):                   # Write threads stacks and top allocations
+    fileName = self.fileName('memory')
+    with open(fileName, 'wt') as f:
+      f.write('Snapshot of %s v.%s\n' % (appName, appVer))
+      names = dict((t.ident, t.name) for t in threadsList())
+      for ident, frame in currentFrames().items():
+        f.write('\nThread %s:\n%s' % (names.get(ident, ident), ''.join(formatStack(frame))))
+      if not tracemalloc.is_tracing():
+        tracemalloc.start(10)
+        f.write('\nMemory allocations tracing is started: next snapshot will show allocations\n')
+      else:
+        snap = tracemalloc.take_snapshot()
+        f.write('\nTraced memory: current %d, peak %d bytes\n' % tracemalloc.get_traced_memory())
+        f.write('\nTop allocations:\n')
+        for st in snap.statistics('lineno')[:30]:
+          f.write('%s\n' % st)
+        if self.lastSnapshot is not None:
+          f.write('\nGrowth since the previous snapshot:\n')
+          for st in snap.compare_to(self.lastSnapshot, 'lineno')[:30]:
+            f.write('%s\n' % st)
+        self.lastSnapshot = snap
+    logger.info('Snapshot is written to %s' % fileName)
+    return True                         # Keep the signal handler
+
+#################### Application start-up functions ####################
+def setProcName(newname):
+  from ctypes import cdll, byref, create_string_buffer
+  libc = cdll.LoadLibrary('libc.so.6')
+  buff = create_string_buffer(len(newname) + 1)
+  buff.value = bytes(newname, 'UTF8')
+  libc.prctl(15, byref(buff), 0, 0, 0)
+
+def appInit(args):              # Common start-up: logging level, single instance check, config
+  '''
+  It sets logging level, checks that no other instance is running, reads application config
+  and updates daemons list according to -c/-r options. Returns (config, daemons).
+  '''
+  # Change the process name
+  setProcName(appHomeName)
+
+  # Check for already running instance of the indicator application
+  if (str(getpid()) !=
+      check_output(["pgrep", '-u', str(geteuid()), "yd-tools"], universal_newlines=True).strip()):
+    sysExit(_('The indicator instance is already running.'))
+
+  # Set user specified logging level
+  logger.setLevel(args.level)
+
+  # Report app version and logging level
+  logger.info('%s v.%s' % (appName, appVer))
+  logger.debug('Logging level: ' + str(args.level))
+  config = Config(pathJoin(configPath, appName + '.conf'))
+  config.setdefault('daemons', '~/.config/yandex-disk/config.cfg')
+  # Add new daemon if it is not in current list
+  daemons = [expanduser(d) for d in CVal(config['daemons'])]
+  if args.cfg:
+    args.cfg = expanduser(args.cfg)
+    if args.cfg not in daemons:
+      daemons.append(args.cfg)
+      config.changed = True
+  # Remove daemon if it is in the current list
+  if args.rcfg:
+    args.rcfg = expanduser(args.rcfg)
+    if args.rcfg in daemons:
+      daemons.remove(args.rcfg)
+      config.changed = True
+  # Check that at least one daemon is in the daemons list
+  if not daemons:
+    sysExit(_('No daemons specified.\nCheck correctness of -r and -c options.'))
+  if config.changed:
+    config['daemons'] = CVal(daemons).get()
+  return config, daemons
+
+def startHooks(config, daemons):  # Make HookRunner when hooks file exists
+  fileName = expanduser(config.get('hooks', pathJoin(configPath, 'hooks.conf')))
+  if not pathExists(fileName):
+    return None
+  return HookRunner(daemons, fileName, int(config.get('hookworkers', 2)),
+                    int(config.get('hookqueue', 32)), float(config.get('hooktimeout', 60)))
+
+#################### Headless mode ####################
+class HeadlessDaemon(YDDaemon):       # Daemon monitor that writes status changes as JSON lines
+  ''' Status changes are written as JSON objects (one per line) with event type, time, daemon
+      index and folder and the status values (see YDDaemon.change). '''
+  outLock = Lock()                    # All daemons write into one stream
+
+  def __init__(self, path, ID, index, out):
+    self.index = index
+    self.out = out
+    super().__init__(path, ID)
+
+  def write(self, event, **values):
+    line = jsonDumps(dict(values, event=event, time=datetime.now().isoformat(),
+                          daemon=self.index, dir=self.config.get('dir', '')))
+    with self.outLock:
+      self.out.write(line + '\n')
+      self.out.flush()
+
+  def error(self, cfgFile):           # Not configured daemon can't be set up without GUI
+    logger.error('%sDaemon is not configured: %s' % (self.ID, cfgFile))
+    return 1
+
+  def change(self, vals):
+    self.write('change', **dict((k, v) for k, v in vals.items()))
+    if exporter is not None:
+      exporter.update(self, vals)
+    if hooks is not None:
+      hooks.event(self, vals)
+    if waitServer is not None:
+      waitServer.update(self, vals)
+    if stateStats is not None:
+      stateStats.update(self, vals)
+
+  def governed(self, reason):
+    self.write('governor', reason=reason)
+
+def headlessMain(args):         # Monitor daemons without GUI until SIGINT/SIGTERM
+  global exporter, hooks, waitServer, stateStats
+  config, daemons = appInit(args)
+  config.setdefault('governor', False)
+  config.setdefault('promfile', '')
+  if config.changed:
+    config.save()
+  out = open(expanduser(args.output), 'at') if args.output else stdout
+  exporter = hooks = waitServer = None
+  stateStats = StateStats(pathJoin(configPath, 'stats.json'))
+  monitors = [HeadlessDaemon(d, '#%d ' % n if len(daemons) > 1 else '', n, out)
+              for n, d in enumerate(daemons)]
+  if config['promfile']:
+    exporter = PromExporter(monitors, config['promfile'], float(config.get('prominterval', 15)))
+  hooks = startHooks(config, monitors)
+  localMonitors = startLocalMonitors(config, monitors)
+  waitServer = startWaitServer(monitors)
+  governor = Governor(monitors, config) if config['governor'] else None
+  if governor is not None:
+    governor.start()
+  stopped = Event()
+  signal(SIGINT, lambda *a: stopped.set())
+  signal(SIGTERM, lambda *a: stopped.set())
+  profiler = Profiler(config)
+  signal(SIGUSR1, lambda *a: profiler.toggle())
+  signal(SIGUSR2, lambda *a: profiler.snapshot())
+  while not stopped.wait(3600):
+    pass
+  logger.debug("Exit started")
+  if governor is not None:
+    governor.stop()
+  for l in localMonitors:
+    l.exit()
+  for m in monitors:
+    m.exit()
+  if exporter is not None:
+    exporter.exit()
+  if hooks is not None:
+    hooks.exit()
+  if waitServer is not None:
+    waitServer.exit()
+  stateStats.exit()
+  return 0
+
 #################### Indicatior class ####################
 class Indicator(YDDaemon):            # Yandex.Disk appIndicator
+  errorLock = Lock()                  # Serializes configuration error dialogs of all daemons
 
   ####### YDDaemon virtual classes/methods implementations
   def error(self, configPath):        # Show error messages implementation
+    ### NOTE: it is called not from main thread (see YDDaemon.__setup), so the dialog is shown
+    ### via main loop queue. Only one dialog is shown at a time, other daemons are not blocked.
+    def do_error(done, response):
       dialog = Gtk.MessageDialog(None, 0, Gtk.MessageType.INFO, Gtk.ButtonsType.OK_CANCEL,
                                   _('Yandex.Disk Indicator: daemon start failed'))
-      dialog.format_secondary_text(_('Yandex.Disk daemon failed to start because it is not' +
+      dialog.format_secondary_text(self.ID + _('Yandex.Disk daemon failed to start because it is not' +
           ' configured properly\n  To configure it up: press OK button.\n  Press Cancel to exit.'))
       dialog.set_default_size(400, 250)
       dialog.set_icon(logo)
-      response = dialog.run()
+      response.append(dialog.run())
       dialog.destroy()
-      if response == Gtk.ResponseType.OK:  # Launch Set-up utility
-        logger.debug('starting configuration utility')
-        retCode = call([pathJoin(installDir, 'ya-setup'), configPath])
-      else:
-        retCode = 1
-      dialog.destroy()
-      return retCode              # 0 when error is not critical or fixed (daemon has been configured via ya-setup)
+      done.set()
+      return False                # Don't repeat idle call
+    with self.errorLock:
+      done, response = Event(), []
+      idle_add(do_error, done, response)
+      done.wait()
+    if response[0] == Gtk.ResponseType.OK:  # Launch Set-up utility
+      logger.debug('starting configuration utility')
+      retCode = call([pathJoin(installDir, 'ya-setup'), configPath])
+    else:
+      retCode = 1
+    return retCode              # 0 when error is not critical or fixed (daemon has been configured via ya-setup)
 
   def change(self, vals):             # Implementation of daemon class call-back function
     ### NOTE: it is called not from main thread, so it have to add action in main loop queue
@@ -614,102 +2221,182 @@ class Indicator(YDDaemon):            # Yandex.Disk appIndicator
     It handles daemon status changes by updating icon, creating messages and also update
     status information in menu (status, sizes and list of last synchronized items).
     It is called when daemon detects any change of its status.
+    Only one update per daemon waits in the main loop queue: the changes that come before it is
+    handled are merged into it (the latest values win, change flags are joined and 'laststatus'
+    is kept from the first merged change). The handler receives the read-only snapshot.
+    All status transitions of merged changes are kept, so the icon and notifications are updated
+    even when the status has returned to its first value (like busy -> idle -> busy).
     '''
     logger.info(self.ID + 'Change event: %s' % ','.join(['stat' if vals['statchg'] else '',
                                                          'size' if vals['szchg'] else '',
                                                          'last' if vals['lastchg'] else '']))
-    def do_change(vals, path):
-      # Update information in menu
-      self.menu.update(vals, path)
+    # Metrics and hooks are handled before merging of changes to see all status transitions
+    if exporter is not None:
+      exporter.update(self, vals)
+    if hooks is not None:
+      hooks.event(self, vals)
+    if waitServer is not None:
+      waitServer.update(self, vals)
+    if statusCache is not None:
+      statusCache.update(self, vals)
+    if stateStats is not None:
+      stateStats.update(self, vals)
+    def do_change():
+      with self.__chgLock:
+        vals = self.__pending                    # Take the latest snapshot
+        transitions = self.__transitions         # ...and status transitions that are merged in it
+        self.__pending, self.__transitions = None, []
+      path = self.config.get('dir', '')
+      self.shown = (vals, path)                  # Values for menu section that is built later
+      # Update information in menu (aggregate mode: when daemon section is already built)
+      if self.menu is not None:
+        self.menu.update(vals, path)
+      # Remember current status (required for Preferences dialog and aggregate icon)
+      self.currentStatus = vals['status']
+      if aggregate is not None:
+        aggregate.update(self, vals, path)       # Update daemon row in aggregate menu
+      if Preferences.window is not None:
+        Preferences.window.daemonChanged(self)   # Update daemon row in Preferences window
+      # Update D-Bus object properties
+      if dbusService is not None:
+        dbusService.update(self, vals)
       # Handle daemon status change by icon change
-      if vals['status'] != vals['laststatus']:
-        logger.info('Status: ' + vals['laststatus'] + ' -> ' + vals['status'])
+      if transitions:
         self.updateIcon(vals['status'])          # Update icon
+      for laststatus, status in transitions:
+        logger.info('Status: ' + laststatus + ' -> ' + status)
         # Create notifications for status change events
         if config['notifications']:
-          if vals['laststatus'] == 'none':       # Daemon has been started
+          if laststatus == 'none':               # Daemon has been started
             self.notify.send(_('Yandex.Disk daemon has been started'))
-          if vals['status'] == 'busy':           # Just entered into 'busy'
+          if status == 'busy':                   # Just entered into 'busy'
             self.notify.send(_('Synchronization started'))
-          elif vals['status'] == 'idle':         # Just entered into 'idle'
-            if vals['laststatus'] == 'busy':     # ...from 'busy' status
+          elif status == 'idle':                 # Just entered into 'idle'
+            if laststatus == 'busy':             # ...from 'busy' status
               self.notify.send(_('Synchronization has been completed'))
-          elif vals['status'] == 'paused':       # Just entered into 'paused'
-            if vals['laststatus'] not in ['none', 'unknown']:  # ...not from 'none'/'unknown' status
+          elif status == 'paused':               # Just entered into 'paused'
+            if laststatus not in ['none', 'unknown']:  # ...not from 'none'/'unknown' status
               self.notify.send(_('Synchronization has been paused'))
-          elif vals['status'] == 'none':         # Just entered into 'none' from some another status
-            if vals['laststatus'] != 'unknown':  # ... not from 'unknown'
+          elif status == 'none':                 # Just entered into 'none' from some another status
+            if laststatus != 'unknown':          # ... not from 'unknown'
               self.notify.send(_('Yandex.Disk daemon has been stopped'))
           else:                                  # status is 'error' or 'no-net'
             self.notify.send(_('Synchronization ERROR'))
-      # Remember current status (required for Preferences dialog)
-      self.currentStatus = vals['status']
-    idle_add(do_change, vals, self.config['dir'])
+      return False                               # Don't repeat idle call
+    with self.__chgLock:
+      pending = self.__pending
+      if vals['status'] != vals['laststatus']:
+        self.__transitions.append((vals['laststatus'], vals['status']))
+      if pending is not None:                    # Merge with waiting update
+        vals = dict(vals, laststatus=pending['laststatus'],
+                    statchg=vals['statchg'] or pending['statchg'],
+                    szchg=vals['szchg'] or pending['szchg'],
+                    lastchg=vals['lastchg'] or pending['lastchg'])
+      self.__pending = MappingProxyType(dict(vals))
+    if pending is None:                          # Schedule the update when no one is waiting
+      idle_add(do_change)
+
+  def governed(self, reason):         # Show the reason of pause made by Governor
+    ### NOTE: it is called not from main thread, so it have to add action in main loop queue
+    logger.info('%sGovernor: %s' % (self.ID, reason if reason else 'resumed'))
+    def do_governed():
+      self.governedReason = reason               # It is shown when menu section is built later
+      if self.menu is not None:                  # Menu section can be not built yet in aggregate mode
+        self.menu.setGoverned(reason)
+      return False                               # Don't repeat idle call
+    idle_add(do_governed)
+
+  def loaded(self, configured):       # Daemon initialization is finished
+    ### NOTE: it is called not from main thread
+    if not configured and self.ID == '':        # There is nothing to show without daemon
+      logger.error('Daemon is not configured')
+      idle_add(appExit)
+    def do_loaded():
+      # Not configured daemon has no status changes: its row and page are updated here
+      if Preferences.window is not None:
+        Preferences.window.daemonChanged(self)
+      return False                               # Don't repeat idle call
+    idle_add(do_loaded)
 
   ####### Own classes/methods 
   def __init__(self, path, ID):
+    # Staff for merging of changes that wait for handling in main loop (see change())
+    self.__chgLock = Lock()
+    self.__pending = None
+    self.__transitions = []                       # Status transitions of waiting update
     # Create indicator notification engine
     self.notify = Notification(_('Yandex.Disk ') + ID)
-    # Setup icons theme
-    self.setIconTheme(config['theme'])
-    # Create staff for icon animation support (don't start it here)
-    def iconAnimation():          # Changes busy icon by loop (triggered by self.timer)
-      # Set next animation icon
-      self.ind.set_icon_full(pathJoin(self.themePath, 'yd-busy' + str(self._seqNum) + '.png'), '')
-      # Calculate next icon number
-      self._seqNum = self._seqNum % 5 + 1   # 5 icon numbers in loop (1-2-3-4-5-1-2-3...)
-      return True                           # True required to continue triggering by timer
-    self.iconTimer = self.Timer(777, iconAnimation, start=False)
-    # Create App Indicator
-    self.ind = appIndicator.Indicator.new(
-      "yandex-disk-%s" % ID[1: -1],
-      self.icon['paused'],
-      appIndicator.IndicatorCategory.APPLICATION_STATUS)
-    self.ind.set_status(appIndicator.IndicatorStatus.ACTIVE)
-    self.menu = self.Menu(self, ID)               # Create menu for daemon
-    self.ind.set_menu(self.menu)                  # Attach menu to indicator
-    # Initialize Yandex.Disk daemon connection object
-    super().__init__(path, ID)
-
-  def setIconTheme(self, theme):      # Determine paths to icons according to current theme
-    global installDir, configPath
-    theme = 'light' if theme else 'dark'
-    # Determine theme from application configuration settings
-    defaultPath = pathJoin(installDir, 'icons', theme)
-    userPath = pathJoin(configPath, 'icons', theme)
-    # Set appropriate paths to all status icons
-    self.icon = dict()
-    for status in ['idle', 'error', 'paused', 'none', 'no_net', 'busy']:
-      name = ('yd-ind-pause.png' if status in {'paused', 'none', 'no_net'} else
-              'yd-busy1.png' if status == 'busy' else
-              'yd-ind-' + status + '.png')
-      userIcon = pathJoin(userPath, name)
-      self.icon[status] = userIcon if pathExists(userIcon) else pathJoin(defaultPath, name)
-      # userIcon corresponds to busy icon on exit from this loop
-    # Set theme paths according to existence of first busy icon
-    self.themePath = userPath if pathExists(userIcon) else defaultPath
+    self.currentStatus = 'paused'                 # Status that is shown by initial icon
+    self.shown = None                             # The last shown values and folder
+    self.governedReason = ''
+    if aggregate is None:
+      self.menu = self.Menu(self, ID)             # Create menu for daemon
+      # Create App Indicator icon with attached menu
+      self.statusIcon = StatusIcon("yandex-disk-%s" % ID[1: -1], self.menu)
+    else:                                         # Aggregate mode: the single icon and menu are used
+      self.menu = None                            # Menu section is built when it is opened first
+      aggregate.add(self)
+    # Show the last known (stale) values until the first status request is completed
+    cached = statusCache.get(path) if statusCache is not None else None
+    if cached is not None:
+      self.shown = (cached, cached['dir'])
+      if aggregate is None:
+        self.menu.update(cached, cached['dir'])
+      else:
+        aggregate.update(self, cached, cached['dir'])
+    # Initialize Yandex.Disk daemon connection object (config is loaded in background)
+    super().__init__(path, ID, background=True)
+
+  def buildMenu(self):                # Build daemon menu section (aggregate mode) and show last values
+    if self.menu is None:
+      self.menu = self.Menu(self, self.ID, common=False)
+      if self.shown is not None:
+        self.menu.update(*self.shown)
+      if self.governedReason:
+        self.menu.setGoverned(self.governedReason)
+    return self.menu
+
+  def setIconTheme(self, theme):      # Set icons theme
+    if aggregate is None:
+      self.statusIcon.setIconTheme(theme)
+    else:
+      aggregate.setIconTheme(theme)
 
   def updateIcon(self, status):       # Change indicator icon according to just changed daemon status
-    # Set icon according to the current status
-    self.ind.set_icon_full(self.icon[status], '')
-    # Handle animation
-    if status == 'busy':        # Just entered into 'busy' status
-      self._seqNum = 2          # Next busy icon number for animation
-      self.iconTimer.start()    # Start animation timer
+    if aggregate is None:
+      self.statusIcon.updateIcon(status)
     else:
-      self.iconTimer.stop()     # Stop animation timer when status is not busy
+      aggregate.updateIcon()                      # Aggregate icon depends on all daemons statuses
 
   class Menu(Gtk.Menu):               # Indicator menu
 
-    def __init__(self, daemon, ID):
+    def __init__(self, daemon, ID, common=True):
+      ''' daemon - daemon object (None for the aggregate menu that has the common items only),
+          common - add the common items (web, preferences, help, about and quit) '''
       self.daemon = daemon                      # Store reference to daemon object for future usage
       self.folder = ''
       super().__init__()                        # Initialize menu
       self.ID = ID
+      # Define user readable statuses dictionary
+      self.YD_STATUS = {'idle': _('Synchronized'), 'busy': _('Sync.: '), 'none': _('Not started'),
+                        'paused': _('Paused'), 'no_net': _('Not connected'), 'error': _('Error')}
+      if daemon is not None:
+        self.addDaemonItems()
+      if common:
+        self.addCommonItems()
+      self.show_all()
+
+    def addDaemonItems(self):               # Add daemon status and control items
       if self.ID != '':                         # Add addition field in multidaemon mode
         self.yddir = Gtk.MenuItem(label='');  self.yddir.set_sensitive(False);   self.append(self.yddir)
-      self.status = Gtk.MenuItem(label='');   self.status.connect("activate", self.showOutput)
+      # Daemon is loading until the first update
+      self.status = Gtk.MenuItem(label=_('Status: ') + _('Loading...'))
+      self.status.connect("activate", self.showOutput);   self.status.set_sensitive(False)
       self.append(self.status)
+      self.outputWindow = None                  # Live daemon output window (see OutputWindow)
+      self.governed = Gtk.MenuItem(label=''); self.governed.set_sensitive(False)
+      self.governed.set_no_show_all(True)       # It is shown only when daemon is paused by Governor
+      self.append(self.governed)
       self.used = Gtk.MenuItem(label='');     self.used.set_sensitive(False)
       self.append(self.used)
       self.free = Gtk.MenuItem(label='');     self.free.set_sensitive(False)
@@ -718,20 +2405,38 @@ class Indicator(YDDaemon):            # Yandex.Disk appIndicator
       self.last.set_sensitive(False)
       self.lastItems = Gtk.Menu()               # Sub-menu: list of last synchronized files/folders
       self.last.set_submenu(self.lastItems)     # Add submenu (empty at the start)
+      self.lastPaths = []                       # Full paths of last synchronized items
       self.append(self.last)
+      self.stats = Gtk.MenuItem(label=_('Time in states'))
+      self.statsItems = Gtk.Menu()              # Sub-menu: it is filled when it is shown
+      self.statsItems.connect("show", self.updateStats)
+      self.stats.set_submenu(self.statsItems)
+      self.append(self.stats)
       self.append(Gtk.SeparatorMenuItem.new())  # -----separator--------
       self.daemon_ss = Gtk.MenuItem(label='')         # Start/Stop daemon: Label is depends on current daemon status
       self.daemon_ss.connect("activate", self.startStopDaemon)
+      self.daemon_ss.set_no_show_all(True)      # It is shown on the first update
       self.append(self.daemon_ss)
       self.open_folder = Gtk.MenuItem(label=_('Open Yandex.Disk Folder'))
       self.open_folder.connect("activate", lambda w: self.openPath(w, self.folder))
       self.append(self.open_folder)
+      # Each handler is subscribed to the fields that it shows
+      self.started = None                       # Daemon is started (unknown before first update)
+      self.store = StatusStore()
+      self.store.subscribe(('status', 'progress', 'error', 'path', 'stale'), self.updateStatus)
+      self.store.subscribe(('status', 'stale'), self.updateStarted)
+      self.store.subscribe(('dir',), self.updateDir)
+      self.store.subscribe(('used', 'total'), self.updateUsed)
+      self.store.subscribe(('free', 'trash'), self.updateFree)
+      self.store.subscribe(('lastitems', 'dir'), self.updateLast)
+
+    def addCommonItems(self):               # Add items that are common for all daemons
       open_web = Gtk.MenuItem(label=_('Open Yandex.Disk on the web'))
       open_web.connect("activate", self.openInBrowser, _('https://disk.yandex.com'))
       self.append(open_web)
       self.append(Gtk.SeparatorMenuItem.new())  # -----separator--------
       self.preferences = Gtk.MenuItem(label=_('Preferences'))
-      self.preferences.connect("activate", Preferences)
+      self.preferences.connect("activate", Preferences.open)
       self.append(self.preferences)
       open_help = Gtk.MenuItem(label=_('Help'))
       m_help = Gtk.Menu()
@@ -750,61 +2455,132 @@ class Indicator(YDDaemon):            # Yandex.Disk appIndicator
       close = Gtk.MenuItem(label=_('Quit'))
       close.connect("activate", self.close)
       self.append(close)
-      self.show_all()
-      # Define user readable statuses dictionary
-      self.YD_STATUS = {'idle': _('Synchronized'), 'busy': _('Sync.: '), 'none': _('Not started'),
-                        'paused': _('Paused'), 'no_net': _('Not connected'), 'error': _('Error')}
 
     def update(self, vals, yddir):  # Update information in menu
+      '''
+      Values are passed to the status store that calls only the handlers of changed fields (all
+      handlers are called on the first update). Each handler updates only its own items.
+      The last known values from status cache have 'stale' value (see StatusCache.get).
+      '''
       self.folder = yddir
-      # Update status data on first run or when status has changed
-      if vals['statchg'] or vals['laststatus'] == 'unknown':
-        self.status.set_label(_('Status: ') + self.YD_STATUS[vals['status']] +
-                              (vals['progress'] if vals['status'] == 'busy'
-                               else
-                               ' '.join((':', vals['error'], shortPath(vals['path']))) if vals['status'] == 'error'
-                               else
-                               ''))
-        # Update pseudo-static items on first run or when daemon has stopped or started
-        if 'none' in (vals['status'], vals['laststatus']) or vals['laststatus'] == 'unknown':
-          started = vals['status'] != 'none'
-          self.status.set_sensitive(started)
-          # zero-space UTF symbols are used to detect requered action without need to compare translated strings
-          self.daemon_ss.set_label(('\u2060' + _('Stop Yandex.Disk daemon')) if started else ('\u200B' + _('Start Yandex.Disk daemon')))
-          if self.ID != '':                             # Set daemon identity row in multidaemon mode
-            self.yddir.set_label(self.ID + _('  Folder: ') + (shortPath(yddir) if yddir else '< NOT CONFIGURED >'))
-          self.open_folder.set_sensitive(yddir != '') # Activate Open YDfolder if daemon configured
-      # Update sizes data on first run or when size data has changed
-      if vals['szchg'] or vals['laststatus'] == 'unknown':
-        self.used.set_label(_('Used: ') + vals['used'] + '/' + vals['total'])
-        self.free.set_label(_('Free: ') + vals['free'] + _(', trash: ') + vals['trash'])
-      # Update last synchronized sub-menu on first run or when last data has changed
-      if vals['lastchg'] or vals['laststatus'] == 'unknown':
-        # Update last synchronized sub-menu
-        self.lastItems.destroy()                      # Disable showing synchronized sub menu while updating it - temp fix for #197
-        self.lastItems = Gtk.Menu()                   # Create new/empty Sub-menu:
-        for filePath in vals['lastitems']:            # Create new sub-menu items
-          # Create menu label as file path (shorten it down to 50 symbols when path length > 50
-          # symbols), with replaced underscore (to disable menu acceleration feature of GTK menu).
-          widget = Gtk.MenuItem.new_with_label(shortPath(filePath))
-          filePath = pathJoin(yddir, filePath)        # Make full path to file
-          if pathExists(filePath):
-            widget.set_sensitive(True)                # If it exists then it can be opened
-            widget.connect("activate", self.openPath, filePath)
-          else:
-            widget.set_sensitive(False)               # Don't allow to open non-existing path
-          self.lastItems.append(widget)
-        self.last.set_submenu(self.lastItems)
-        # Switch off last items menu sensitivity if no items in list
-        self.last.set_sensitive(len(vals['lastitems']) != 0)
-        logger.debug("Sub-menu 'Last synchronized' has " + str(len(vals['lastitems'])) + " items")
-        
-      self.show_all()                                 # Renew menu
+      self.store.update(dict(vals, dir=yddir, stale=vals.get('stale', False)))
+      if self.outputWindow is not None:
+        self.outputWindow.update(vals)
+
+    def staleMark(self, vals):              # Mark of last known values that are not confirmed yet
+      return (' ' + _('(last known at %s)') % datetime.fromtimestamp(vals['time']).strftime('%H:%M')
+              if vals.get('stale') else '')
+
+    def updateStatus(self, vals):           # Status line: status, progress, error and path
+      label = (_('Status: ') + self.YD_STATUS[vals['status']] +
+               (vals['progress'] if vals['status'] == 'busy'
+                else
+                ' '.join((':', vals['error'], shortPath(vals['path']))) if vals['status'] == 'error'
+                else
+                '') + self.staleMark(vals))
+      if label != self.status.get_label():  # Progress of idle daemon or error path can be changed
+        self.status.set_label(label)
+
+    def updateStarted(self, vals):          # Pseudo-static items: they are changed on start/stop
+      if vals['stale']:                         # Daemon state is not known yet
+        return
+      started = vals['status'] != 'none'
+      if started == self.started:
+        return
+      self.started = started
+      self.status.set_sensitive(started)
+      # zero-space UTF symbols are used to detect requered action without need to compare translated strings
+      self.daemon_ss.set_label(('\u2060' + _('Stop Yandex.Disk daemon')) if started else ('\u200B' + _('Start Yandex.Disk daemon')))
+      self.daemon_ss.show()
+
+    def updateDir(self, vals):              # Daemon identity row and open folder item
+      yddir = vals['dir']
+      if self.ID != '':                             # Set daemon identity row in multidaemon mode
+        self.yddir.set_label(self.ID + _('  Folder: ') + (shortPath(yddir) if yddir else '< NOT CONFIGURED >'))
+      self.open_folder.set_sensitive(yddir != '') # Activate Open YDfolder if daemon configured
+
+    def updateUsed(self, vals):
+      self.used.set_label(_('Used: ') + vals['used'] + '/' + vals['total'])
+
+    def updateFree(self, vals):
+      self.free.set_label(_('Free: ') + vals['free'] + _(', trash: ') + vals['trash'])
+
+    def updateLast(self, vals):             # Last synchronized sub-menu
+      yddir = vals['dir']
+      # Sub-menu is recreated: it is not shown while it is updated - temp fix for #197. The old
+      # sub-menu is destroyed with its items (they are not leaked), items open the paths by index.
+      self.lastItems.destroy()
+      self.lastItems = Gtk.Menu()
+      self.lastPaths = []
+      for i, filePath in enumerate(vals['lastitems']):
+        # Create menu label as file path (shorten it down to 50 symbols when path length > 50
+        # symbols), with replaced underscore (to disable menu acceleration feature of GTK menu).
+        widget = Gtk.MenuItem.new_with_label(shortPath(filePath))
+        widget.connect("activate", self.openLastItem, i)
+        filePath = pathJoin(yddir, filePath)        # Make full path to file
+        self.lastPaths.append(filePath)
+        # If it exists then it can be opened, don't allow to open non-existing path
+        widget.set_sensitive(pathExists(filePath))
+        self.lastItems.append(widget)
+      self.lastItems.show_all()
+      self.last.set_submenu(self.lastItems)
+      # Switch off last items menu sensitivity if no items in list
+      self.last.set_sensitive(len(vals['lastitems']) != 0)
+      logger.debug("Sub-menu 'Last synchronized' has " + str(len(vals['lastitems'])) + " items")
+
+    def updateStats(self, menu):            # Fill time in states sub-menu by current statistics
+      for widget in menu.get_children():
+        widget.destroy()
+      stats = stateStats.get(self.daemon.config.fileName) if stateStats is not None else None
+      lines = []
+      if stats is not None:
+        lines.append(_('Since ') + datetime.fromtimestamp(stats['since']).strftime('%Y-%m-%d %H:%M'))
+        for status in StateStats.STATUSES:
+          if stats['entries'].get(status):
+            lines.append('%s: %s, %s' % (self.YD_STATUS[status].rstrip(': '),
+                                         durationText(stats['seconds'].get(status, 0)),
+                                         _('%d times') % stats['entries'][status]))
+        for key, title in (('busy', _('Sync. durations: ')), ('recover', _('Recovery times: '))):
+          if any(stats[key]):
+            lines.append(title + ', '.join('%s %d' % (label, n) for label, n in
+                                           zip(StateStats.LABELS, stats[key]) if n))
+      else:
+        lines.append(_('No statistics yet'))
+      for line in lines:
+        widget = Gtk.MenuItem(label=line)
+        widget.set_sensitive(False)
+        menu.append(widget)
+      menu.append(Gtk.SeparatorMenuItem.new())
+      export = Gtk.MenuItem(label=_('Export as CSV...'))
+      export.connect("activate", self.exportStats)
+      menu.append(export)
+      menu.show_all()
+
+    def exportStats(self, widget):          # Save statistics of all daemons into CSV file
+      dialog = Gtk.FileChooserDialog(_('Export time in states statistics'), None,
+                                     Gtk.FileChooserAction.SAVE,
+                                     (_('Close'), Gtk.ResponseType.CANCEL,
+                                      _('Save'), Gtk.ResponseType.ACCEPT))
+      dialog.set_default_response(Gtk.ResponseType.ACCEPT)
+      dialog.set_do_overwrite_confirmation(True)
+      dialog.set_current_name('yandex-disk-stats.csv')
+      if dialog.run() == Gtk.ResponseType.ACCEPT:
+        try:
+          with open(dialog.get_filename(), 'wt', newline='') as f:
+            stateStats.csv(f)
+        except OSError as e:
+          logger.error('Statistics export error: %s' % str(e))
+      dialog.destroy()
+
+    def setGoverned(self, reason):          # Show/hide the reason of pause made by Governor
+      self.governed.set_label(_('Paused by governor: ') + reason)
+      self.governed.set_visible(reason != '')
+      return False                          # Don't repeat idle call
 
     def openAbout(self, widget):            # Show About window
-      global logo, indicators
-      for i in indicators:
-        i.menu.about.set_sensitive(False)           # Disable menu item
+      global logo
+      for m in commonMenus():
+        m.about.set_sensitive(False)                # Disable menu item
       aboutWindow = Gtk.AboutDialog()
       aboutWindow.set_logo(logo);   aboutWindow.set_icon(logo)
       aboutWindow.set_program_name(_('Yandex.Disk indicator'))
@@ -830,31 +2606,18 @@ class Indicator(YDDaemon):            # Yandex.Disk appIndicator
       aboutWindow.set_resizable(False)
       aboutWindow.run()
       aboutWindow.destroy()
-      for i in indicators:
-        i.menu.about.set_sensitive(True)            # Enable menu item
-
-    def showOutput(self, widget):           # Request for daemon output
-      widget.set_sensitive(False)                         # Disable menu item
-      def displayOutput(outText, widget):
-        ### NOTE: it is called not from main thread, so it have to add action in main loop queue
-        def do_display(outText, widget):
-          global logo
-          #outText = self.daemon.getOutput(True)
-          statusWindow = Gtk.Dialog(_('Yandex.Disk daemon output message'))
-          statusWindow.set_icon(logo)
-          statusWindow.set_border_width(6)
-          statusWindow.add_button(_('Close'), Gtk.ResponseType.CLOSE)
-          textBox = Gtk.TextView()                            # Create text-box to display daemon output
-          # Set output buffer with daemon output in user language
-          textBox.get_buffer().set_text(outText)
-          textBox.set_editable(False)
-          # Put it inside the dialogue content area
-          statusWindow.get_content_area().pack_start(textBox, True, True, 6)
-          statusWindow.show_all();  statusWindow.run();   statusWindow.destroy()
-          widget.set_sensitive(True)                          # Enable menu item
-        idle_add(do_display, outText, widget)
-      self.daemon.output(lambda t: displayOutput(t, widget))
-      
+      for m in commonMenus():
+        m.about.set_sensitive(True)                 # Enable menu item
+
+    def showOutput(self, widget):           # Show live daemon output window
+      if self.outputWindow is None:
+        self.outputWindow = OutputWindow(self.daemon, self.outputClosed)
+      else:
+        self.outputWindow.present()
+
+    def outputClosed(self, window):
+      self.outputWindow = None
+
     def openInBrowser(self, widget, url):   # Open URL
       openNewBrowser(url)
 
@@ -866,6 +2629,9 @@ class Indicator(YDDaemon):            # Yandex.Disk appIndicator
       elif action == '\u2060':  # Stop
         self.daemon.stop()
 
+    def openLastItem(self, widget, index):  # Open last synchronized item
+      self.openPath(widget, self.lastPaths[index])
+
     def openPath(self, widget, path):       # Open path
       logger.info('Opening %s' % path)
       if pathExists(path):
@@ -905,11 +2671,127 @@ class Indicator(YDDaemon):            # Yandex.Disk appIndicator
         source_remove(self.timer)
         self.active = False
 
+#################### Indicator icon classes ####################
+class StatusIcon(object):             # App Indicator icon with busy status animation
+
+  def __init__(self, name, menu):
+    # Setup icons theme
+    self.setIconTheme(config['theme'])
+    # Create staff for icon animation support (don't start it here)
+    self.iconTimer = Indicator.Timer(777, self.iconAnimation, start=False)
+    # Create App Indicator
+    self.ind = appIndicator.Indicator.new(name, self.icon['paused'],
+                                          appIndicator.IndicatorCategory.APPLICATION_STATUS)
+    self.ind.set_status(appIndicator.IndicatorStatus.ACTIVE)
+    self.ind.set_menu(menu)                       # Attach menu to indicator
+
+  def iconAnimation(self):            # Changes busy icon by loop (triggered by self.iconTimer)
+    # Set next animation icon
+    self.ind.set_icon_full(pathJoin(self.themePath, 'yd-busy' + str(self._seqNum) + '.png'), '')
+    # Calculate next icon number
+    self._seqNum = self._seqNum % 5 + 1   # 5 icon numbers in loop (1-2-3-4-5-1-2-3...)
+    return True                           # True required to continue triggering by timer
+
+  def setIconTheme(self, theme):        # Determine paths to icons according to current theme
+    global installDir, configPath
+    theme = 'light' if theme else 'dark'
+    # Determine theme from application configuration settings
+    defaultPath = pathJoin(installDir, 'icons', theme)
+    userPath = pathJoin(configPath, 'icons', theme)
+    # Set appropriate paths to all status icons
+    self.icon = dict()
+    for status in ['idle', 'error', 'paused', 'none', 'no_net', 'busy']:
+      name = ('yd-ind-pause.png' if status in {'paused', 'none', 'no_net'} else
+              'yd-busy1.png' if status == 'busy' else
+              'yd-ind-' + status + '.png')
+      userIcon = pathJoin(userPath, name)
+      self.icon[status] = userIcon if pathExists(userIcon) else pathJoin(defaultPath, name)
+      # userIcon corresponds to busy icon on exit from this loop
+    # Set theme paths according to existence of first busy icon
+    self.themePath = userPath if pathExists(userIcon) else defaultPath
+
+  def updateIcon(self, status):         # Change icon according to status
+    # Set icon according to the current status
+    self.ind.set_icon_full(self.icon[status], '')
+    # Handle animation
+    if status == 'busy':        # Just entered into 'busy' status
+      self._seqNum = 2          # Next busy icon number for animation
+      self.iconTimer.start()    # Start animation timer
+    else:
+      self.iconTimer.stop()     # Stop animation timer when status is not busy
+
+class Aggregate(object):              # The single icon and menu for all daemons
+  '''
+  In aggregate mode indicators don't create their own icons and menus. The single icon shows the
+  worst or the most active status of all daemons (see PRIORITY) and it has the single busy
+  animation timer. The menu has one row per daemon (identity, folder and status) with the daemon
+  menu section as sub-menu, followed by the common items. The daemon section is built when its row
+  is selected first time (see Indicator.buildMenu), until then only the row is updated.
+  '''
+  PRIORITY = ('error', 'no_net', 'busy', 'paused', 'none', 'idle')  # From the worst/most active
+
+  def __init__(self):
+    self.indicators = []
+    self.rows = []                                # Menu rows of daemons
+    self.labels = []                              # Current labels of rows
+    self.status = None                            # Status that is shown by icon
+    self.menu = Indicator.Menu(None, '')          # Menu with the common items only
+    self.menu.insert(Gtk.SeparatorMenuItem.new(), 0)
+    self.menu.show_all()
+    self.statusIcon = StatusIcon('yandex-disk-', self.menu)
+
+  def add(self, indicator):           # Add daemon row into menu
+    row = Gtk.MenuItem(label=indicator.ID + _('Loading...'))
+    row.set_submenu(Gtk.Menu())                   # Placeholder until daemon section is built
+    row.connect("select", self.select, indicator)
+    row.set_sensitive(False)                      # It is activated on the first update
+    self.menu.insert(row, len(self.rows))
+    row.show()
+    self.indicators.append(indicator)
+    self.rows.append(row)
+    self.labels.append(indicator.ID + _('Loading...'))
+
+  def select(self, row, indicator):   # Build daemon section when its row is selected first time
+    if indicator.menu is None:
+      row.set_submenu(indicator.buildMenu())
+
+  def update(self, indicator, vals, folder):  # Update daemon row
+    i = self.indicators.index(indicator)
+    if not self.rows[i].get_sensitive():
+      self.rows[i].set_sensitive(True)
+    label = (indicator.ID + (shortPath(folder) if folder else _('< NOT CONFIGURED >')) + ': ' +
+             self.menu.YD_STATUS[vals['status']] + self.menu.staleMark(vals))
+    if label != self.labels[i]:                   # Don't touch menu when nothing is changed
+      self.rows[i].set_label(label)
+      self.labels[i] = label
+
+  def setIconTheme(self, theme):      # Set icons theme
+    self.statusIcon.setIconTheme(theme)
+    self.status = None                            # Icon have to be set again
+
+  def updateIcon(self):               # Show the worst/most active status of all daemons
+    statuses = set(i.currentStatus for i in self.indicators)
+    status = next((s for s in self.PRIORITY if s in statuses), 'paused')
+    if status != self.status:
+      self.status = status
+      self.statusIcon.updateIcon(status)
+
 #### Application functions and classes
 class Preferences(Gtk.Dialog):  # Preferences window of application and daemons
+  '''
+  The window is not modal and only one window is shown (see open). Daemons are shown in the list
+  on the daemons tab that is built when it is selected first time, the options page of daemon is
+  built when the daemon is selected first time. Configurations are saved when window is closed.
+  '''
 
   class excludeDirsList(Gtk.Dialog):                                      # Excluded list dialogue
-
+    '''
+    Paths are kept in dictionary (ordered, path -> True) and the list model is filled in bulk
+    while it is detached from the view. Path is redundant when its parent folder is already in
+    the list: such paths are not added and they are removed when their parent is added.
+    The search entry filters the visible rows, 'Select all' and 'Remove selected' work on the
+    rows in one pass.
+    '''
     def __init__(self, widget, parent, dcofig):   # show current list
       self.dconfig = dcofig
       self.parent = parent
@@ -919,49 +2801,95 @@ class Preferences(Gtk.Dialog):  # Preferences window of application and daemons
       self.set_size_request(400, 300)
       self.add_button(_('Add catalogue'),
                       Gtk.ResponseType.APPLY).connect("clicked", self.addFolder, self)
+      self.add_button(_('Select all'),
+                      Gtk.ResponseType.ACCEPT).connect("clicked", self.selectAll)
       self.add_button(_('Remove selected'),
                       Gtk.ResponseType.REJECT).connect("clicked", self.deleteSelected)
       self.add_button(_('Close'),
                       Gtk.ResponseType.CLOSE).connect("clicked", self.exitFromDialog)
+      self.search = Gtk.SearchEntry()
+      self.search.connect("search-changed", self.searchChanged)
+      self.get_content_area().pack_start(self.search, False, False, 0)
+      self.query = ''
       self.exList = Gtk.ListStore(bool, str)
-      view = Gtk.TreeView(model=self.exList)
+      self.filter = self.exList.filter_new()      # Rows that match the search query
+      self.filter.set_visible_func(lambda model, it, data: self.query in model[it][1].lower())
+      self.view = Gtk.TreeView()
       render = Gtk.CellRendererToggle()
       render.connect("toggled", self.lineToggled)
-      view.append_column(Gtk.TreeViewColumn(" ", render, active=0))
-      view.append_column(Gtk.TreeViewColumn(_('Path'), Gtk.CellRendererText(), text=1))
+      for col in (Gtk.TreeViewColumn(" ", render, active=0),
+                  Gtk.TreeViewColumn(_('Path'), Gtk.CellRendererText(), text=1)):
+        col.set_sizing(Gtk.TreeViewColumnSizing.FIXED)  # Rows are not measured one by one
+        col.set_fixed_width(30)
+        self.view.append_column(col)
+      col.set_expand(True)
+      self.view.set_fixed_height_mode(True)
+      self.view.get_selection().set_mode(Gtk.SelectionMode.MULTIPLE)  # Just added rows are selected
       scroll = Gtk.ScrolledWindow()
-      scroll.add_with_viewport(view)
+      scroll.add_with_viewport(self.view)
       self.get_content_area().pack_start(scroll, True, True, 6)
-      # Populate list with paths from "exclude-dirs" property of daemon configuration
-      self.dirset = [val for val in CVal(self.dconfig.get('exclude-dirs', None))]
-      for val in self.dirset:
-        self.exList.append([False, val])
-      logger.debug(str(self.dirset))
+      self.counter = Gtk.Label()
+      self.get_content_area().pack_start(self.counter, False, False, 0)
+      # Load paths from "exclude-dirs" property of daemon configuration
+      self.dirs = dict.fromkeys(CVal(self.dconfig.get('exclude-dirs', None)), True)
+      self.fill()
       self.show_all()
 
+    def fill(self, shown=()):             # Fill list in bulk while model is detached from view
+      ''' shown - paths of rows to select and scroll to (they are not marked for removal) '''
+      self.view.set_model(None)
+      self.exList.clear()
+      shownRows = []
+      for path in self.dirs:
+        it = self.exList.insert_with_valuesv(-1, [0, 1], [False, path])
+        if path in shown:
+          shownRows.append(it)
+      self.view.set_model(self.filter)
+      selection = self.view.get_selection()
+      first = None
+      for it in shownRows:
+        visible, it = self.filter.convert_child_iter_to_iter(it)
+        if visible:                                 # Row matches the search query
+          selection.select_iter(it)
+          if first is None:
+            first = self.filter.get_path(it)
+      if first is not None:
+        self.view.scroll_to_cell(first, None, False, 0, 0)
+      self.counter.set_text(_('Folders: %d') % len(self.dirs))
+      logger.debug('Excluded folders: %d' % len(self.dirs))
 
     def exitFromDialog(self, widget):     # Save list from dialogue to "exclude-dirs" property
       if self.dconfig.changed:
-        eList = CVal()                                      # Store path value from dialogue rows
-        for i in self.dirset:
-          eList.add(i)
-        self.dconfig['exclude-dirs'] = eList.get()          # Save collected value
-      logger.debug(str(self.dirset))
+        self.dconfig['exclude-dirs'] = CVal(list(self.dirs) or None).get()  # Save collected value
       self.destroy()                                        # Close dialogue
 
+    def searchChanged(self, widget):      # Filter rows by search query
+      self.query = widget.get_text().lower()
+      self.filter.refilter()
+
     def lineToggled(self, widget, path):  # Line click handler, it switch row selection
+      path = self.filter.convert_path_to_child_path(Gtk.TreePath(path))
       self.exList[path][0] = not self.exList[path][0]
 
+    def selectAll(self, widget):          # Select all visible rows or unselect them when all selected
+      visible = [row for row in self.exList if self.query in row[1].lower()]
+      state = not all(row[0] for row in visible)
+      self.view.set_model(None)
+      for row in visible:
+        row[0] = state
+      self.view.set_model(self.filter)
+
     def deleteSelected(self, widget):     # Remove selected rows from list
-      listIiter = self.exList.get_iter_first()
-      while listIiter is not None and self.exList.iter_is_valid(listIiter):
-        if self.exList.get(listIiter, 0)[0]:
-          self.dirset.remove(self.exList.get(listIiter, 1)[0])
-          self.exList.remove(listIiter)
-          self.dconfig.changed = True
-        else:
-          listIiter = self.exList.iter_next(listIiter)
-      logger.debug(str(self.dirset))
+      selected = set(row[1] for row in self.exList if row[0])
+      if selected:
+        for path in selected:
+          del self.dirs[path]
+        self.dconfig.changed = True
+        self.fill()
+
+    def covered(self, path, dirs):        # Check that one of parent folders of path is in dirs
+      parts = path.split('/')
+      return any('/'.join(parts[:i]) in dirs for i in range(1, len(parts)))
 
     def addFolder(self, widget, parent):  # Add new path to list via FileChooserDialog
       dialog = Gtk.FileChooserDialog(_('Select catalogue to add to list'), parent,
@@ -973,26 +2901,39 @@ class Preferences(Gtk.Dialog):  # Preferences window of application and daemons
       rootDir = self.dconfig['dir']
       dialog.set_current_folder(rootDir)
       if dialog.run() == Gtk.ResponseType.ACCEPT:
+        new = set()
         for path in dialog.get_filenames():
           if path.startswith(rootDir):
             path = relativePath(path, start=rootDir)
-            if path not in self.dirset:
-              self.exList.append([False, path])
-              self.dirset.append(path)
-              self.dconfig.changed = True
+            if path != '.' and path not in self.dirs:
+              new.add(path)
+        # Skip paths that are covered by already excluded or just selected parent folders
+        new = set(p for p in new if not self.covered(p, self.dirs) and not self.covered(p, new))
+        if new:
+          # Remove paths that become redundant as their parent folder is added
+          self.dirs = dict.fromkeys((p for p in self.dirs if not self.covered(p, new)), True)
+          self.dirs.update(dict.fromkeys(sorted(new), True))
+          self.dconfig.changed = True
+          self.fill(shown=new)
       dialog.destroy()
-      #logger.debug(str(self.dirset))
 
-  def __init__(self, widget):
+  window = None                                 # The only Preferences window (it is not modal)
+
+  @classmethod
+  def open(cls, widget):                        # Show Preferences window (it is created once)
+    if cls.window is None:
+      cls.window = cls()
+    else:
+      cls.window.present()
+
+  def __init__(self):
     global config, indicators, logo
-    # Preferences Window routine
-    for i in indicators:
-      i.menu.preferences.set_sensitive(False)   # Disable menu items to avoid multi-dialogs creation
-    # Create Preferences window
-    Gtk.Dialog.__init__(self, _('Yandex.Disk-indicator and Yandex.Disks preferences'), flags=1)
+    # Preferences Window routine: the dialog is not modal, status updates are shown while it is open
+    Gtk.Dialog.__init__(self, _('Yandex.Disk-indicator and Yandex.Disks preferences'))
     self.set_icon(logo)
     self.set_border_width(6)
     self.add_button(_('Close'), Gtk.ResponseType.CLOSE)
+    self.connect("response", self.onResponse)
     pref_notebook = Gtk.Notebook()              # Create notebook for indicator and daemon options
     self.get_content_area().add(pref_notebook)  # Put it inside the dialogue content area
     # --- Indicator preferences tab ---
@@ -1006,62 +2947,131 @@ class Preferences(Gtk.Dialog):  # Preferences window of application and daemons
       cb[-1].set_active(config[key])
       cb[-1].connect("toggled", self.onButtonToggled, cb[-1], key)
       preferencesBox.add(cb[-1])
+    # Progress of file manager extensions activation (see FMActions)
+    self.fmProgress = Gtk.ProgressBar(show_text=True)
+    self.fmProgress.set_no_show_all(True)
+    preferencesBox.add(self.fmProgress)
+    self.closed = False
     # --- End of Indicator preferences tab --- add it to notebook
     pref_notebook.append_page(preferencesBox, Gtk.Label(_('Indicator settings')))
-    # Add daemos tabs
-    for i in indicators:
-      # --- Daemon start options tab ---
-      optionsBox = Gtk.VBox(spacing=5)
-      key = 'startonstartofindicator'           # Start daemon on indicator start
-      cbStOnStart = Gtk.CheckButton(_('Start Yandex.Disk daemon %swhen indicator is starting')
-                                    % i.ID)
-      cbStOnStart.set_tooltip_text(_("When daemon was not started before."))
-      cbStOnStart.set_active(i.config[key])
-      cbStOnStart.connect("toggled", self.onButtonToggled, cbStOnStart, key, i.config)
-      optionsBox.add(cbStOnStart)
-      key = 'stoponexitfromindicator'           # Stop daemon on exit
-      cbStoOnExit = Gtk.CheckButton(_('Stop Yandex.Disk daemon %son closing of indicator') % i.ID)
-      cbStoOnExit.set_active(i.config[key])
-      cbStoOnExit.connect("toggled", self.onButtonToggled, cbStoOnExit, key, i.config)
-      optionsBox.add(cbStoOnExit)
-      frame = Gtk.Frame()
-      frame.set_label(_("NOTE! You have to reload daemon %sto activate following settings") % i.ID)
-      frame.set_border_width(6)
-      optionsBox.add(frame)
-      framedBox = Gtk.VBox(homogeneous=True, spacing=5)
-      frame.add(framedBox)
-      key = 'read-only'                         # Option Read-Only    # daemon config
-      cbRO = Gtk.CheckButton(_('Read-Only: Do not upload locally changed files to Yandex.Disk'))
-      cbRO.set_tooltip_text(_("Locally changed files will be renamed if a newer version of this " +
-                              "file appear in Yandex.Disk."))
-      cbRO.set_active(i.config[key])
-      key = 'overwrite'                         # Option Overwrite    # daemon config
-      overwrite = Gtk.CheckButton(_('Overwrite locally changed files by files' +
-                                    ' from Yandex.Disk (in read-only mode)'))
-      overwrite.set_tooltip_text(_("Locally changed files will be overwritten if a newer " +
-                                   "version of this file appear in Yandex.Disk."))
-      overwrite.set_active(i.config[key])
-      overwrite.set_sensitive(i.config['read-only'])
-      cbRO.connect("toggled", self.onButtonToggled, cbRO, 'read-only', i.config, overwrite)
-      framedBox.add(cbRO)
-      overwrite.connect("toggled", self.onButtonToggled, overwrite, key, i.config)
-      framedBox.add(overwrite)
-      # Excude folders list
-      exListButton = Gtk.Button(_('Excluded folders List'))
-      exListButton.set_tooltip_text(_("Folders in the list will not be synchronized."))
-      exListButton.connect("clicked", self.excludeDirsList, self, i.config)
-      framedBox.add(exListButton)
-      # --- End of Daemon start options tab --- add it to notebook
-      pref_notebook.append_page(optionsBox, Gtk.Label(_('Daemon %soptions') % i.ID))
-    self.set_resizable(False)
+    # --- Daemons tab: list of daemons and options of selected one (it is built when it is selected)
+    self.daemonsBox = Gtk.Paned(orientation=Gtk.Orientation.HORIZONTAL)
+    self.daemonsList = None                     # List of daemons
+    self.pages = {}                             # Daemon index -> options page
+    pref_notebook.append_page(self.daemonsBox, Gtk.Label(_('Daemons options')))
+    pref_notebook.connect("switch-page", self.pageSwitched)
     self.show_all()
-    self.run()
+
+  def pageSwitched(self, notebook, page, num):  # Build daemons tab when it is selected first time
+    if page is not self.daemonsBox or self.daemonsList is not None:
+      return
+    self.daemonsList = Gtk.ListStore(str, str)  # Daemon (identity and folder) and its status
+    for i in indicators:
+      self.daemonsList.append(self.daemonRow(i))
+    view = Gtk.TreeView(model=self.daemonsList)
+    for n, title in enumerate((_('Daemon'), _('Status'))):
+      col = Gtk.TreeViewColumn(title, Gtk.CellRendererText(), text=n)
+      col.set_sizing(Gtk.TreeViewColumnSizing.FIXED)  # Rows are not measured one by one
+      col.set_fixed_width(200 if n == 0 else 100)
+      view.append_column(col)
+    view.set_fixed_height_mode(True)
+    scroll = Gtk.ScrolledWindow()
+    scroll.set_size_request(300, 250)
+    scroll.add(view)
+    self.daemonsBox.pack1(scroll, False, False)
+    self.stack = Gtk.Stack()
+    self.loading = Gtk.Label(_('Daemon configuration is not loaded yet'))
+    self.stack.add_named(self.loading, 'loading')
+    self.daemonsBox.pack2(self.stack, True, False)
+    self.selection = view.get_selection()
+    self.selection.connect("changed", self.daemonSelected)
+    self.daemonsBox.show_all()
+    self.selection.select_path(0)
+
+  def daemonRow(self, i):                       # Row of daemons list
+    folder = i.config.get('dir', '')
+    return [i.ID + (shortPath(folder) if folder else _('< NOT CONFIGURED >') if i.ready else
+                    _('Loading...')),
+            (i.menu if i.menu is not None else aggregate.menu).YD_STATUS.get(i.currentStatus, '') if i.ready else '']
+
+  def daemonChanged(self, i):                   # Update daemon row (it is called on status change)
+    if self.daemonsList is None:
+      return
+    n = indicators.index(i)
+    self.daemonsList[n] = self.daemonRow(i)
+    if n not in self.pages and i.ready:         # Replace 'loading' page of selected daemon
+      self.daemonSelected(self.selection)
+
+  def daemonSelected(self, selection):          # Show options of selected daemon
+    model, it = selection.get_selected()
+    if it is None:
+      return
+    n = model.get_path(it).get_indices()[0]
+    page = self.pages.get(n)
+    if page is None:
+      if not indicators[n].ready:
+        self.stack.set_visible_child(self.loading)
+        return
+      page = self.pages[n] = self.daemonOptions(indicators[n])
+      self.stack.add_named(page, str(n))
+      page.show_all()
+    self.stack.set_visible_child(page)
+
+  def daemonOptions(self, i):                   # Make options page of daemon
+    # --- Daemon start options tab ---
+    optionsBox = Gtk.VBox(spacing=5)
+    key = 'startonstartofindicator'             # Start daemon on indicator start
+    cbStOnStart = Gtk.CheckButton(_('Start Yandex.Disk daemon %swhen indicator is starting')
+                                  % i.ID)
+    cbStOnStart.set_tooltip_text(_("When daemon was not started before."))
+    cbStOnStart.set_active(i.config[key])
+    cbStOnStart.connect("toggled", self.onButtonToggled, cbStOnStart, key, i.config)
+    optionsBox.add(cbStOnStart)
+    key = 'stoponexitfromindicator'             # Stop daemon on exit
+    cbStoOnExit = Gtk.CheckButton(_('Stop Yandex.Disk daemon %son closing of indicator') % i.ID)
+    cbStoOnExit.set_active(i.config[key])
+    cbStoOnExit.connect("toggled", self.onButtonToggled, cbStoOnExit, key, i.config)
+    optionsBox.add(cbStoOnExit)
+    frame = Gtk.Frame()
+    frame.set_label(_("NOTE! You have to reload daemon %sto activate following settings") % i.ID)
+    frame.set_border_width(6)
+    optionsBox.add(frame)
+    framedBox = Gtk.VBox(homogeneous=True, spacing=5)
+    frame.add(framedBox)
+    key = 'read-only'                           # Option Read-Only    # daemon config
+    cbRO = Gtk.CheckButton(_('Read-Only: Do not upload locally changed files to Yandex.Disk'))
+    cbRO.set_tooltip_text(_("Locally changed files will be renamed if a newer version of this " +
+                            "file appear in Yandex.Disk."))
+    cbRO.set_active(i.config[key])
+    key = 'overwrite'                           # Option Overwrite    # daemon config
+    overwrite = Gtk.CheckButton(_('Overwrite locally changed files by files' +
+                                  ' from Yandex.Disk (in read-only mode)'))
+    overwrite.set_tooltip_text(_("Locally changed files will be overwritten if a newer " +
+                                 "version of this file appear in Yandex.Disk."))
+    overwrite.set_active(i.config[key])
+    overwrite.set_sensitive(i.config['read-only'])
+    cbRO.connect("toggled", self.onButtonToggled, cbRO, 'read-only', i.config, overwrite)
+    framedBox.add(cbRO)
+    overwrite.connect("toggled", self.onButtonToggled, overwrite, key, i.config)
+    framedBox.add(overwrite)
+    # Excude folders list
+    exListButton = Gtk.Button(_('Excluded folders List'))
+    exListButton.set_tooltip_text(_("Folders in the list will not be synchronized."))
+    exListButton.connect("clicked", self.excludeDirsList, self, i.config)
+    framedBox.add(exListButton)
+    return optionsBox
+
+  def onResponse(self, dialog, response):       # Save configurations and close the window
+    self.closed = True                          # FM actions activation can be still in progress
     if config.changed:
       config.save()                             # Save app config
     for i in indicators:
       if i.config.changed:
         i.config.save()                         # Save daemon options in config file
-      i.menu.preferences.set_sensitive(True)    # Enable menu items
+        for l in localMonitors:
+          if l.daemon is i:
+            l.reload()                          # Apply changed excluded folders
+    Preferences.window = None
     self.destroy()
 
   def onButtonToggled(self, widget, button, key, dconfig=None, ow=None):  # Handle clicks
@@ -1085,178 +3095,280 @@ class Preferences(Gtk.Dialog):  # Preferences window of application and daemons
         deleteFile(autoStartDst)
     elif key == 'fmextensions':
       if not button.get_inconsistent():         # It is a first call
-        if not activateActions(toggleState, installDir):            
-          toggleState = not toggleState         # When activation/deactivation is not success: revert settings back
-          button.set_inconsistent(True)         # set inconsistent state to detect second call
-          button.set_active(toggleState)        # set check-button to reverted status
-          # set_active will raise again the 'toggled' event
+        button.set_sensitive(False)             # Until activation/deactivation is finished
+        fmActions.start(toggleState, self.fmActionsProgress,
+                        lambda result: self.fmActionsDone(result, button, toggleState))
       else:                                     # This is a second call
         button.set_inconsistent(False)          # Just remove inconsistent status
     elif key == 'read-only':
       ow.set_sensitive(toggleState)
 
+  def fmActionsProgress(self, fm, fraction):  # Show progress of FM actions activation/deactivation
+    if not self.closed:
+      self.fmProgress.set_text(fm)
+      self.fmProgress.set_fraction(fraction)
+      self.fmProgress.show()
+
+  def fmActionsDone(self, result, button, toggleState):  # FM actions activation/deactivation is finished
+    if self.closed:                             # Dialog is closed: just revert and save setting
+      if not result:
+        config['fmextensions'] = not toggleState
+        config.save()
+      return
+    self.fmProgress.hide()
+    button.set_sensitive(True)
+    if not result:
+      button.set_inconsistent(True)             # set inconsistent state to detect second call
+      button.set_active(not toggleState)        # When activation/deactivation is not success: revert settings back
+      # set_active will raise again the 'toggled' event
+
+class OutputWindow(Gtk.Dialog):  # Live daemon output window
+  '''
+  It shows the daemon output in user language and the history of status changes. It is not modal
+  and it is updated from the daemon refresh cycle (update is called on each status change): the
+  history line is made from the status values and the output in user language is requested once
+  per change and only while the window is visible (the changes that come while the request is in
+  progress are joined into one more request).
+  '''
+  HISTORY = 500                                 # Maximal number of history lines
+
+  def __init__(self, daemon, onClose):
+    Gtk.Dialog.__init__(self, _('Yandex.Disk daemon output message') +
+                        (' ' + daemon.ID.strip() if daemon.ID else ''))
+    self.set_icon(logo)
+    self.set_border_width(6)
+    self.set_default_size(500, 450)
+    self.add_button(_('Close'), Gtk.ResponseType.CLOSE)
+    self.connect("response", lambda dialog, response: self.destroy())
+    self.connect("destroy", self.onDestroy, onClose)
+    self.daemon = daemon
+    self.textBox = Gtk.TextView()               # Daemon output in user language
+    self.textBox.set_editable(False)
+    self.get_content_area().pack_start(self.textBox, False, False, 6)
+    self.historyBox = Gtk.TextView()            # History of status changes
+    self.historyBox.set_editable(False)
+    scroll = Gtk.ScrolledWindow()
+    scroll.add(self.historyBox)
+    self.get_content_area().pack_start(scroll, True, True, 6)
+    self.history = deque(maxlen=self.HISTORY)
+    self.closed = False
+    self.requested = False                      # Output request is in progress
+    self.again = False                          # Output have to be requested again
+    self.show_all()
+    self.update(daemon.snapshot())
+
+  def update(self, vals):                       # Add history line and request the output
+    line = '  '.join(v for v in (vals['status'], vals['progress'], vals['used'] + '/' + vals['total'],
+                                 vals['error'] if vals['status'] == 'error' else '') if v)
+    if not self.history or self.history[-1][1] != line:
+      self.history.append((datetime.now().strftime('%H:%M:%S'), line))
+      buf = self.historyBox.get_buffer()
+      buf.set_text('\n'.join('%s  %s' % h for h in self.history))
+      self.historyBox.scroll_to_iter(buf.get_end_iter(), 0, False, 0, 0)
+    if not self.get_visible():                  # Output isn't requested for hidden window
+      return
+    if self.requested:
+      self.again = True
+      return
+    self.requested = True
+    self.daemon.output(lambda outText: idle_add(self.showText, outText))
+
+  def showText(self, outText):                  # Show received output
+    self.requested = False
+    if not self.closed:
+      self.textBox.get_buffer().set_text(outText)
+      if self.again:                            # Status was changed during the request
+        self.again = False
+        self.update(self.daemon.snapshot())
+    return False                                # Don't repeat idle call
+
+  def onDestroy(self, widget, onClose):
+    self.closed = True
+    onClose(self)
+
+def commonMenus():      # Menus that have the common items (Preferences, About, etc.)
+  return [i.menu for i in indicators] if aggregate is None else [aggregate.menu]
+
 def appExit():          # Exit from application (it closes all indicators)
-  global indicators
+  global indicators, governor, dbusService, exporter, hooks, localMonitors, waitServer, statusCache
+  global stateStats
   logger.debug("Exit started")
+  if waitServer is not None:
+    waitServer.exit()
+  for l in localMonitors:
+    l.exit()
+  if governor is not None:
+    governor.stop()
+  if dbusService is not None:
+    dbusService.exit()
+  if exporter is not None:
+    exporter.exit()
+  if hooks is not None:
+    hooks.exit()
   for i in indicators:
     i.exit()
+  if statusCache is not None:
+    statusCache.exit()
+  if stateStats is not None:
+    stateStats.exit()
   Gtk.main_quit()
   
-def activateActions(activate, installDir):  # Install/deinstall file extensions
-  userHome = getenv("HOME")
-  result = False
-  try:                  # Catch all exceptions during FM action activation/deactivation
-
-    # --- Actions for Nautilus ---
-    if which("nautilus") is not None:
-      logger.info("Nautilus installed")
-      ver = check_output(["lsb_release -r | sed -n '1{s/[^0-9]//g;p;q}'"], shell=True)
-      if ver != '' and int(ver) < 1210:
-        nautilusPath = ".gnome2/nautilus-scripts/"
-      else:
-        nautilusPath = ".local/share/nautilus/scripts"
-      logger.debug(nautilusPath)
-      if activate:      # Install actions for Nautilus
-
-        copyFile(pathJoin(installDir, "fm-actions/Nautilus_Nemo/publish"),
-                 pathJoin(userHome, nautilusPath, _("Publish via Yandex.Disk")))
-        copyFile(pathJoin(installDir, "fm-actions/Nautilus_Nemo/unpublish"),
-                 pathJoin(userHome, nautilusPath, _("Unpublish from Yandex.disk")))
-      else:             # Remove actions for Nautilus
-        deleteFile(pathJoin(userHome, nautilusPath, _("Publish via Yandex.Disk")))
-        deleteFile(pathJoin(userHome, nautilusPath, _("Unpublish from Yandex.disk")))
-      result = True
-
-    # --- Actions for Nemo ---
-    if which("nemo") is not None:
-      logger.info("Nemo installed")
-      if activate:      # Install actions for Nemo
-        copyFile(pathJoin(installDir, "fm-actions/Nautilus_Nemo/publish"),
-                 pathJoin(userHome, ".local/share/nemo/scripts", _("Publish via Yandex.Disk")))
-        copyFile(pathJoin(installDir, "fm-actions/Nautilus_Nemo/unpublish"),
-                 pathJoin(userHome, ".local/share/nemo/scripts", _("Unpublish from Yandex.disk")))
-      else:             # Remove actions for Nemo
-        deleteFile(pathJoin(userHome, ".gnome2/nemo-scripts", _("Publish via Yandex.Disk")))
-        deleteFile(pathJoin(userHome, ".gnome2/nemo-scripts", _("Unpublish from Yandex.disk")))
-      result = True
-
-    # --- Actions for Thunar ---
-    if which("thunar") is not None:
-      logger.info("Thunar installed")
-      ucaPath = pathJoin(userHome, ".config/Thunar/uca.xml")
-      # Read uca.xml
-      with open(ucaPath) as ucaf:
-        [(ust, actions, uen)] = reFindall(r'(^.*<actions>)(.*)(<\/actions>)', ucaf.read(), reS)
-      acts = reFindall(r'(<action>.*?<\/action>)', actions, reS)
-      nActs = dict((reFindall(r'<name>(.+?)<\/name>', u, reS)[0], u) for u in acts)
-
-      if activate:      # Install actions for Thunar
-        if _("Publish via Yandex.Disk") not in nActs.keys():
-          nActs[_("Publish via Yandex.Disk")] = ("<action><icon>folder-publicshare</icon>" +
-                           '<name>' + _("Publish via Yandex.Disk") +
-                           '</name><command>yandex-disk publish %f | xclip -filter -selection' +
-                           ' clipboard; zenity --info ' +
-                           '--window-icon=/usr/share/yd-tools/icons/yd-128.png ' +
-                           '--title="Yandex.Disk" --ok-label="' + _('Close') + '" --text="' +
-                           _('URL to file: %f was copied into clipboard.') +
-                           '"</command><description/><patterns>*</patterns>' +
-                           '<directories/><audio-files/><image-files/><other-files/>' +
-                           "<text-files/><video-files/></action>")
-        if _("Unpublish from Yandex.disk") not in nActs.keys():
-          nActs[_("Unpublish from Yandex.disk")] = ("<action><icon>folder</icon><name>" +
-                           _("Unpublish from Yandex.disk") +
-                           '</name><command>zenity --info ' +
-                           '--window-icon=/usr/share/yd-tools/icons/yd-128_g.png --ok-label="' +
-                           _('Close') + '" --title="Yandex.Disk" --text="' +
-                           _("Unpublish from Yandex.disk") +
-                           ': `yandex-disk unpublish %f`"</command>' +
-                           '<description/><patterns>*</patterns>' +
-                           '<directories/><audio-files/><image-files/><other-files/>' +
-                           "<text-files/><video-files/></action>")
-
-      else:             # Remove actions for Thunar
-        if _("Publish via Yandex.Disk") in nActs.keys():
-          del nActs[_("Publish via Yandex.Disk")]
-        if _("Unpublish from Yandex.disk") in nActs.keys():
-          del nActs[_("Unpublish from Yandex.disk")]
-
-      # Save uca.xml
-      with open(ucaPath, 'wt') as ucaf:
-        ucaf.write(ust + ''.join(u for u in nActs.values()) + uen)
-      result = True
-
-    # --- Actions for Dolphin ---
-    if which("dolphin") is not None:
-      logger.info("Dolphin installed")
-      if activate:      # Install actions for Dolphin
-        makeDirs(pathJoin(userHome, '.local/share/kservices5/ServiceMenus'))
-        copyFile(pathJoin(installDir, "fm-actions/Dolphin/ydpublish.desktop"),
-                 pathJoin(userHome, ".local/share/kservices5/ServiceMenus/ydpublish.desktop"))
-      else:             # Remove actions for Dolphin
-        deleteFile(pathJoin(userHome, ".local/share/kservices5/ServiceMenus/ydpublish.desktop"))
-      result = True
-
-    # --- Actions for Pantheon-files ---
-    if which("pantheon-files") is not None:
-      logger.info("Pantheon-files installed")
-      ctrs_path = "/usr/share/contractor/"
-      if activate:      # Install actions for Pantheon-files
-        src_path = pathJoin(installDir, "fm-actions", "pantheon-files")
-        ctr_pub = pathJoin(src_path, "yandex-disk-indicator-publish.contract")
-        ctr_unpub = pathJoin(src_path, "yandex-disk-indicator-unpublish.contract")
-        res = call(["gksudo", "-D", "yd-tools", "cp", ctr_pub, ctr_unpub, ctrs_path])
-        if res == 0:
-          result = True
-        else:
-          logger.error("Cannot enable actions for Pantheon-files")
-      else:             # Remove actions for Pantheon-files
-        res = call(["gksudo", "-D", "yd-tools", "rm",
-                    pathJoin(ctrs_path, "yandex-disk-indicator-publish.contract"),
-                    pathJoin(ctrs_path, "yandex-disk-indicator-unpublish.contract")])
-        if res == 0:
+class FMActions(object):        # File manager actions installer
+  '''
+  It installs or removes the publish/unpublish actions of file managers in background thread
+  (the file copying, uca.xml rewriting and Pantheon-files password prompt don't block GTK main
+  loop). Installed file managers are detected once. Installed files are recorded in the manifest
+  file, so the repeated request makes only the difference: files that are already installed are
+  not copied again, removal deletes only the installed files, Thunar uca.xml is rewritten (via
+  temporary file and rename) only when it is changed and the password is not requested when
+  Pantheon-files contracts are already in required state.
+  Callbacks progress(fileManager, fraction) and done(result) are called in main loop. The result
+  is True when actions are installed/removed at least for one file manager.
+  '''
+  MANAGERS = ('nautilus', 'nemo', 'thunar', 'dolphin', 'pantheon-files', 'caja')
+  CONTRACTS = '/usr/share/contractor/'
+
+  def __init__(self, installDir, manifest):
+    self.installDir = installDir
+    self.manifest = manifest
+    self.managers = None                # Installed file managers (detected on first request)
+    self.lock = Lock()                  # Only one request is executed at a time
+
+  def start(self, activate, progress=None, done=None):
+    Thread(target=self.run, args=(activate, progress, done), daemon=True).start()
+
+  def run(self, activate, progress=None, done=None):
+    result = False
+    with self.lock:
+      if self.managers is None:
+        self.managers = [fm for fm in self.MANAGERS if which(fm) is not None]
+      try:
+        with open(self.manifest) as f:
+          installed = jsonLoads(f.read())
+      except (OSError, ValueError):
+        installed = {}
+      for n, fm in enumerate(self.managers):
+        logger.info('%s installed' % fm)
+        if progress is not None:
+          idle_add(progress, fm, n / len(self.managers))
+        try:                            # Catch all exceptions during FM action activation/deactivation
+          if fm == 'thunar':
+            self.thunar(activate)
+          elif fm == 'pantheon-files':
+            self.pantheon(activate)
+          else:
+            installed[fm] = self.scripts(fm, activate, installed.get(fm, []))
           result = True
-        else:
-          logger.error("Cannot disable actions for Pantheon-files")
-
-    # --- Actions for Caja ---
-    if which("caja") is not None:
-      logger.info("Caja installed")
-      if activate:      # Install actions for Nemo
-        copyFile(pathJoin(installDir, "fm-actions/Nautilus_Nemo/publish"),
-                 pathJoin(userHome, ".config/caja/scripts", _("Publish via Yandex.Disk")))
-        copyFile(pathJoin(installDir, "fm-actions/Nautilus_Nemo/unpublish"),
-                 pathJoin(userHome, ".config/caja/scripts", _("Unpublish from Yandex.disk")))
-      else:             # Remove actions for Nemo
-        deleteFile(pathJoin(userHome, ".config/caja/scripts", _("Publish via Yandex.Disk")))
-        deleteFile(pathJoin(userHome, ".config/caja/scripts", _("Unpublish from Yandex.disk")))
-      result = True
-
-  except Exception as e:
-    logger.error("The following error occurred during the FM actions activation:\n %s" % str(e))
-  return result
-
-def argParse(ver):              # Parse command line arguments
-  parser = ArgumentParser(description=_('Desktop indicator for yandex-disk daemon'), add_help=False)
-  group = parser.add_argument_group(_('Options'))
-  group.add_argument('-l', '--log', type=int, choices=range(10, 60, 10), dest='level', default=30,
-            help=_('Sets the logging level: ' +
-                   '10 - to show all messages (DEBUG), ' +
-                   '20 - to show all messages except debugging messages (INFO), ' +
-                   '30 - to show all messages except debugging and info messages (WARNING), ' +
-                   '40 - to show only error and critical messages (ERROR), ' +
-                   '50 - to show critical messages only (CRITICAL). Default: 30'))
-  group.add_argument('-c', '--config', dest='cfg', metavar='path', default='',
-            help=_('Path to configuration file of YandexDisk daemon. ' +
-                   'This daemon will be added to daemons list' +
-                   ' if it is not in the current configuration.' +
-                   'Default: \'\''))
-  group.add_argument('-r', '--remove', dest='rcfg', metavar='path', default='',
-            help=_('Path to configuration file of daemon that should be removed' +
-                   ' from daemos list. Default: \'\''))
-  group.add_argument('-h', '--help', action='help', help=_('Show this help message and exit'))
-  group.add_argument('-v', '--version', action='version', version='%(prog)s v.' + ver,
-            help=_('Print version and exit'))
-  return parser.parse_args()
+        except Exception as e:
+          logger.error('The following error occurred during the %s actions %s:\n %s' %
+                       (fm, 'activation' if activate else 'deactivation', str(e)))
+      tmp = '%s.%d.tmp' % (self.manifest, getpid())
+      try:
+        with open(tmp, 'wt') as f:
+          f.write(jsonDumps(installed))
+        rename(tmp, self.manifest)
+      except OSError as e:
+        logger.error('FM actions manifest write error: %s' % str(e))
+    if done is not None:
+      idle_add(done, result)
+    return result
+
+  def files(self, fm):                  # (source, destination) pairs of actions files
+    home = expanduser('~')
+    if fm == 'dolphin':
+      return [(pathJoin(self.installDir, 'fm-actions/Dolphin/ydpublish.desktop'),
+               pathJoin(home, '.local/share/kservices5/ServiceMenus/ydpublish.desktop'))]
+    if fm == 'nautilus':
+      release = ''
+      try:                              # Old Nautilus (Ubuntu < 12.10) uses another scripts folder
+        with open('/etc/lsb-release') as f:
+          release = ''.join(reFindall(r'DISTRIB_RELEASE=(\d+)\.(\d+)', f.read())[0])
+      except (OSError, IndexError):
+        pass
+      path = '.gnome2/nautilus-scripts' if release and int(release) < 1210 else '.local/share/nautilus/scripts'
+    else:
+      path = {'nemo': '.local/share/nemo/scripts', 'caja': '.config/caja/scripts'}[fm]
+    src = pathJoin(self.installDir, 'fm-actions/Nautilus_Nemo')
+    return [(pathJoin(src, 'publish'), pathJoin(home, path, _('Publish via Yandex.Disk'))),
+            (pathJoin(src, 'unpublish'), pathJoin(home, path, _('Unpublish from Yandex.disk')))]
+
+  def scripts(self, fm, activate, installed):  # Copy/remove files, returns installed files
+    files = self.files(fm)
+    if activate:
+      for src, dst in files:
+        try:
+          with open(src, 'rb') as s, open(dst, 'rb') as d:
+            if s.read() == d.read():
+              continue                  # It is already installed
+        except OSError:
+          pass
+        makedirs(dirname(dst), exist_ok=True)
+        fileCopy(src, dst)
+      return [dst for src, dst in files]
+    # Installed files and files from current locations (they could be installed by older version)
+    for dst in set(installed).union(dst for src, dst in files):
+      if pathExists(dst):
+        remove(dst)
+    return []
+
+  def thunar(self, activate):           # Add/remove actions in Thunar uca.xml
+    ucaPath = expanduser('~/.config/Thunar/uca.xml')
+    try:
+      with open(ucaPath) as ucaf:
+        text = ucaf.read()
+    except FileNotFoundError:
+      if not activate:
+        return
+      text = '<?xml version="1.0" encoding="UTF-8"?>\n<actions>\n</actions>\n'
+    [(ust, actions, uen)] = reFindall(r'(^.*<actions>)(.*)(<\/actions>.*$)', text, reS)
+    acts = reFindall(r'(<action>.*?<\/action>)', actions, reS)
+    nActs = dict((reFindall(r'<name>(.+?)<\/name>', u, reS)[0], u) for u in acts)
+    names = set(nActs)                  # Names of actions before the change
+    if activate:                        # Install actions for Thunar
+      nActs.setdefault(_("Publish via Yandex.Disk"), "<action><icon>folder-publicshare</icon>" +
+                       '<name>' + _("Publish via Yandex.Disk") +
+                       '</name><command>yandex-disk publish %f | xclip -filter -selection' +
+                       ' clipboard; zenity --info ' +
+                       '--window-icon=/usr/share/yd-tools/icons/yd-128.png ' +
+                       '--title="Yandex.Disk" --ok-label="' + _('Close') + '" --text="' +
+                       _('URL to file: %f was copied into clipboard.') +
+                       '"</command><description/><patterns>*</patterns>' +
+                       '<directories/><audio-files/><image-files/><other-files/>' +
+                       "<text-files/><video-files/></action>")
+      nActs.setdefault(_("Unpublish from Yandex.disk"), "<action><icon>folder</icon><name>" +
+                       _("Unpublish from Yandex.disk") +
+                       '</name><command>zenity --info ' +
+                       '--window-icon=/usr/share/yd-tools/icons/yd-128_g.png --ok-label="' +
+                       _('Close') + '" --title="Yandex.Disk" --text="' +
+                       _("Unpublish from Yandex.disk") +
+                       ': `yandex-disk unpublish %f`"</command>' +
+                       '<description/><patterns>*</patterns>' +
+                       '<directories/><audio-files/><image-files/><other-files/>' +
+                       "<text-files/><video-files/></action>")
+    else:                               # Remove actions for Thunar
+      nActs.pop(_("Publish via Yandex.Disk"), None)
+      nActs.pop(_("Unpublish from Yandex.disk"), None)
+    if set(nActs) == names:             # Nothing is changed (actions are only added or removed)
+      return
+    makedirs(dirname(ucaPath), exist_ok=True)
+    tmp = '%s.%d.tmp' % (ucaPath, getpid())
+    with open(tmp, 'wt') as ucaf:       # Thunar never reads the partially written file
+      ucaf.write(ust + ''.join(nActs.values()) + uen)
+    rename(tmp, ucaPath)
+
+  def pantheon(self, activate):         # Copy/remove Pantheon-files contracts (as root)
+    names = ('yandex-disk-indicator-publish.contract', 'yandex-disk-indicator-unpublish.contract')
+    dsts = [pathJoin(self.CONTRACTS, n) for n in names]
+    if activate:
+      if all(pathExists(p) for p in dsts):
+        return
+      cmd = ['cp'] + [pathJoin(self.installDir, 'fm-actions', 'pantheon-files', n) for n in names] + [self.CONTRACTS]
+    else:
+      if not any(pathExists(p) for p in dsts):
+        return
+      cmd = ['rm', '-f'] + dsts
+    if call(['gksudo', '-D', 'yd-tools'] + cmd) != 0:
+      raise OSError('Cannot %s actions for Pantheon-files' % ('enable' if activate else 'disable'))
 
 def checkAutoStart(path):       # Check that auto-start is enabled
   if pathExists(path):
@@ -1270,51 +3382,22 @@ def checkAutoStart(path):       # Check that auto-start is enabled
         return True
   return False
 
-def setProcName(newname):
-  from ctypes import cdll, byref, create_string_buffer
-  libc = cdll.LoadLibrary('libc.so.6')
-  buff = create_string_buffer(len(newname) + 1)
-  buff.value = bytes(newname, 'UTF8')
-  libc.prctl(15, byref(buff), 0, 0, 0)
-
 ###################### MAIN #########################
 if __name__ == '__main__':
-  # Application constants
-  appName = 'yandex-disk-indicator'
-  # See appVer in the beginnig of the code
-  appHomeName = 'yd-tools'
-  installDir = pathJoin('/usr/share', appHomeName)
-  logo = Pixbuf.new_from_file(pathJoin(installDir, 'icons/yd-128.png'))
-  configPath = pathJoin(getenv("HOME"), '.config', appHomeName)
-  # Define .desktop files locations for indicator auto-start facility
-  autoStartSrc = '/usr/share/applications/Yandex.Disk-indicator.desktop'
-  autoStartDst = expanduser('~/.config/autostart/Yandex.Disk-indicator.desktop')
-
   # Initialize logging
   basicConfig(format='%(asctime)-15s %(levelname)-8s %(message)s')
   logger = getLogger('')
 
-  # Setup localization
-  # Load translation object (or NullTranslations) and define _() function.
-  translation(appName, '/usr/share/locale', fallback=True).install()
-
-  # Get command line arguments or their default values
-  args = argParse(appVer)
-
-  # Change the process name
-  setProcName(appHomeName)
-
-  # Check for already running instance of the indicator application
-  if (str(getpid()) !=
-      check_output(["pgrep", '-u', str(geteuid()), "yd-tools"], universal_newlines=True).strip()):
-    sysExit(_('The indicator instance is already running.'))
+  # Headless and client modes (command line arguments are parsed at the beginning)
+  if not guiMode:
+    sysExit(waitMain(args) if args.waitidle or args.waitstatus else
+            statsMain(args) if args.statscsv else headlessMain(args))
 
-  # Set user specified logging level
-  logger.setLevel(args.level)
-
-  # Report app version and logging level
-  logger.info('%s v.%s' % (appName, appVer))
-  logger.debug('Logging level: ' + str(args.level))
+  # Application constants (see also appVer, appHomeName, installDir and configPath at the beginning)
+  logo = Pixbuf.new_from_file(pathJoin(installDir, 'icons/yd-128.png'))
+  # Define .desktop files locations for indicator auto-start facility
+  autoStartSrc = '/usr/share/applications/Yandex.Disk-indicator.desktop'
+  autoStartDst = expanduser('~/.config/autostart/Yandex.Disk-indicator.desktop')
 
   # Application configuration
   '''
@@ -1322,7 +3405,21 @@ if __name__ == '__main__':
   This file can contain comments (line starts with '#') and config values in
   form: key=value[,value[,value ...]] where keys and values can be quoted ("...") or not.
   The following key words are reserved for configuration:
-    autostart, notifications, theme, fmextensions and daemons.
+    autostart, notifications, theme, fmextensions, daemons and dbus (D-Bus service activation).
+  Optional auto-pause governor (see Governor class) is activated by 'governor' key and it is tuned
+  by governorinterval, maxload, maxiopressure, minfreespace and governorresume keys.
+  Prometheus metrics are written into the file specified by 'promfile' key (for node_exporter
+  textfile collector) not often than once per 'prominterval' seconds.
+  User hooks for status transitions are read from ~/.config/<appHomeName>/hooks.conf (or from the
+  file specified by 'hooks' key), see HookRunner class. Their execution is tuned by hookworkers,
+  hookqueue and hooktimeout keys.
+  Local changes monitor (see LocalMonitor class) is activated by 'localmonitor' key, the changes
+  are joined into one status refresh per 'localmonitordelay' seconds.
+  On-demand profiling is tuned by 'profiler' and 'profileinterval' keys (see Profiler class).
+  When 'aggregate' key is set and there are several daemons then the single icon and menu are
+  shown for all daemons (see Aggregate class).
+  The last known status values of daemons are kept in ~/.config/<appHomeName>/status.json file
+  (see StatusCache class), time in states statistics - in stats.json file (see StateStats class).
 
   The dictionary 'config' stores the config settings for usage in code. Its values are saved to
   config file on exit from the Menu.Preferences dialogue or when there is no configuration file
@@ -1337,14 +3434,20 @@ if __name__ == '__main__':
   configuration file to provide the functionality of obsolete 'startonstart' and 'stoponexit'
   values for each daemon individually.
   '''
-  config = Config(pathJoin(configPath, appName + '.conf'))
+  # Read config, check for already running instance and update daemons list according to options
+  config, daemons = appInit(args)
   # Read some settings to variables, set default values and update some values
   config['autostart'] = checkAutoStart(autoStartDst)
   # Setup on-screen notification settings from config value
   config.setdefault('notifications', True)
   config.setdefault('theme', False)
   config.setdefault('fmextensions', True)
-  config.setdefault('daemons', '~/.config/yandex-disk/config.cfg')
+  config.setdefault('governor', False)
+  config.setdefault('dbus', False)
+  config.setdefault('promfile', '')
+  config.setdefault('aggregate', False)
+  # File manager actions installer (installed actions are recorded in manifest file)
+  fmActions = FMActions(installDir, pathJoin(configPath, 'fm-actions.json'))
   # Is it a first run?
   if not config.readSuccess:
     logger.info('No config, probably it is a first run.')
@@ -1367,27 +3470,15 @@ if __name__ == '__main__':
         logger.error('Can\'t activate indicator automatic start on system start-up')
 
     # Activate FM actions according to config (as it is first run)
-    activateActions(config['fmextensions'], installDir)
+    def fmActionsFirstRun(result, activate=config['fmextensions']):
+      if not result:                    # Actions are not activated/deactivated: revert the setting
+        config['fmextensions'] = not activate
+        config.save()
+    fmActions.start(config['fmextensions'], done=fmActionsFirstRun)
     # Default settings should be saved (later)
     config.changed = True
 
-  # Add new daemon if it is not in current list
-  daemons = [expanduser(d) for d in CVal(config['daemons'])]
-  if args.cfg:
-    args.cfg = expanduser(args.cfg)
-    if args.cfg not in daemons:
-      daemons.append(args.cfg)
-      config.changed = True
-  # Remove daemon if it is in the current list
-  if args.rcfg:
-    args.rcfg = expanduser(args.rcfg)
-    if args.rcfg in daemons:
-      daemons.remove(args.rcfg)
-      config.changed = True
-  # Check that at least one daemon is in the daemons list
-  if not daemons:
-    sysExit(_('No daemons specified.\nCheck correctness of -r and -c options.'))
-  # Update config if daemons list has been changed
+  # Update config if daemons list has been changed or it is a first run
   if config.changed:
     config['daemons'] = CVal(daemons).get()
     # Update configuration file
@@ -1395,12 +3486,45 @@ if __name__ == '__main__':
 
   # Make indicator objects for each daemon in daemons list
   indicators = []
+  dbusService = governor = exporter = hooks = waitServer = None  # They are created when all indicators are ready
+  localMonitors = []
+  # Last known status values are shown in menus until the first status requests are completed
+  statusCache = StatusCache(pathJoin(configPath, 'status.json'))
+  # Time in states statistics of daemons (see StateStats)
+  stateStats = StateStats(pathJoin(configPath, 'stats.json'))
+  # The single icon and menu for all daemons in aggregate mode
+  aggregate = Aggregate() if config['aggregate'] and len(daemons) > 1 else None
   for d in daemons:
     indicators.append(Indicator(d, _('#%d ') % len(indicators) if len(daemons) > 1 else ''))
 
+  # Start metrics export when metrics file is specified in configuration
+  if config['promfile']:
+    exporter = PromExporter(indicators, config['promfile'], float(config.get('prominterval', 15)))
+
+  # Start user hooks runner when hooks file exists
+  hooks = startHooks(config, indicators)
+
+  # Start local changes monitors when they are activated in configuration
+  localMonitors = startLocalMonitors(config, indicators)
+
+  # Serve the clients that wait for daemons status (see waitMain)
+  waitServer = startWaitServer(indicators)
+
+  # Export daemons status on session bus
+  dbusService = DBusService(indicators) if config['dbus'] else None
+
+  # Start auto-pause governor when it is activated in configuration
+  if config['governor']:
+    governor = Governor(indicators, config)
+    governor.start()
+
   # Register the SIGINT/SIGTERM handler for graceful exit when indicator is killed
   unix_signal_add(PRIORITY_HIGH, SIGINT, appExit)
   unix_signal_add(PRIORITY_HIGH, SIGTERM, appExit)
+  # Register the SIGUSR1/SIGUSR2 handlers for on-demand profiling (see Profiler class)
+  profiler = Profiler(config)
+  unix_signal_add(PRIORITY_HIGH, SIGUSR1, profiler.toggle)
+  unix_signal_add(PRIORITY_HIGH, SIGUSR2, profiler.snapshot)
 
   # Start GTK Main loop
   Gtk.main()